@@ -1,20 +1,44 @@
 # === Built-in Imports ===
-from contextlib import contextmanager
+from collections import Counter, deque
+from contextlib import ExitStack, contextmanager
 from datetime import datetime
 from tkinter import messagebox
 from tkinter.ttk import Combobox
+import argparse
+import asyncio
+import concurrent.futures
+import copy
+import csv
 import ctypes
 from datetime import datetime
+import gc
+import gzip
+import hashlib
+import io
+import itertools
+import json
+import math
+import mmap
 import os
 import platform
+import queue
 import re
+import shlex
+import shutil
 import sqlite3
+import struct
 import subprocess 
 import sys
+import tempfile
 import threading
 import time
 import tkinter as tk
+import tracemalloc
+import unicodedata
+import wave
 import webbrowser
+import xml.etree.ElementTree as ET
+import zlib
 
 # === Third-party Imports ===
 from argon2 import PasswordHasher
@@ -25,6 +49,24 @@ import pytz
 import requests
 import wikipedia
 
+# === Optional Imports ===
+try:
+    import pyarrow
+    import pyarrow.parquet as pq
+except ImportError:
+    pyarrow = None
+    pq = None
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# === Local Imports ===
+try:
+    from .password_hashing import hash_password, hashing_pool
+except ImportError:  # run as a script from src/
+    from password_hashing import hash_password, hashing_pool
 
 # Set ALSA environment variables to suppress warnings (LINUX)
 os.environ['PYTHONWARNINGS'] = 'ignore'
@@ -150,6 +192,52 @@ class DatabaseManager:
     def fetchall(self):
         return self.get_cursor().fetchall()
 
+    def iter_batches(self, query, params=(), batch_size=1000):
+        """Stream query results in batches of rows using fetchmany"""
+        if not self.ensure_connection():
+            raise sqlite3.Error("Could not establish database connection")
+
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            cursor.close()
+
+    def executemany(self, query, rows):
+        """Run one batch of parameter rows inside a single transaction"""
+        if not self.ensure_connection():
+            raise sqlite3.Error("Could not establish database connection")
+
+        with self.lock:
+            try:
+                cursor = self.connection.cursor()
+                cursor.executemany(query, rows)
+                self.connection.commit()
+                return cursor.rowcount
+            except sqlite3.Error:
+                self.connection.rollback()
+                raise
+
+    @contextmanager
+    def transaction(self):
+        """Run several statements atomically while holding the manager lock"""
+        if not self.ensure_connection():
+            raise sqlite3.Error("Could not establish database connection")
+
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.connection
+                self.connection.commit()
+            except Exception:
+                self.connection.rollback()
+                raise
+
     def commit(self):
         if self.connection:
             self.connection.commit()
@@ -241,16 +329,1857 @@ class DarkScrollbar(tk.Scrollbar):
             relief=tk.FLAT
         )
 
+
+# === Class Definition: UserProfile ===
+class UserProfile:
+    """The signed-in user's row, loaded once at login and written through on every change"""
+    __slots__ = ('id', 'name', 'last_name', 'email', 'password_hash', 'voice_speed')
+    COLUMNS = "id, name, last_name, email, password, voice_speed"
+    UPDATABLE = ('name', 'last_name', 'voice_speed')
+
+    def __init__(self, id, name, last_name, email, password_hash, voice_speed=None):
+        self.id = id
+        self.name = name
+        self.last_name = last_name
+        self.email = email
+        self.password_hash = password_hash
+        self.voice_speed = voice_speed or "Normal"
+
+    @classmethod
+    def load(cls, email):
+        row = db_manager.execute(f"SELECT {cls.COLUMNS} FROM users WHERE email = ?", (email,)).fetchone()
+        return cls(*row) if row else None
+
+    @property
+    def full_name(self):
+        return f"{self.name} {self.last_name}" if self.last_name else self.name
+
+    @property
+    def speech_rate(self):
+        return VOICE_SPEED_RATES.get(self.voice_speed, VOICE_SPEED_RATES["Normal"])
+
+    def update(self, **fields):
+        """Write the given fields in one UPDATE, then apply them to this object"""
+        unknown = set(fields) - set(self.UPDATABLE)
+        if unknown:
+            raise ValueError(f"Cannot update {', '.join(sorted(unknown))}")
+        if not fields:
+            return
+        assignments = ", ".join(f"{column} = ?" for column in fields)
+        db_manager.execute(f"UPDATE users SET {assignments} WHERE id = ?", (*fields.values(), self.id))
+        db_manager.commit()
+        for column, value in fields.items():
+            setattr(self, column, value)
+
+
+# === Class Definition: TranscriptTurn ===
+class TranscriptTurn:
+    """One line of the live conversation (kept small, sessions can be long)"""
+    __slots__ = ('speaker', 'text', 'timestamp', 'mark')
+
+    def __init__(self, speaker, text, mark=None):
+        self.speaker = speaker
+        self.text = text
+        self.timestamp = time.time()
+        self.mark = mark
+
+
+# === Class Definition: ConversationTranscript ===
+class ConversationTranscript:
+    """Bounded live transcript that keeps a conversation Text widget to the last N turns"""
+    def __init__(self, widget, status_label=None, max_turns=None):
+        self.widget = widget
+        self.status_label = status_label
+        self.turns = deque(maxlen=max(2, max_turns or MAX_TRANSCRIPT_TURNS))
+        self.turn_counter = 0
+
+    def exists(self):
+        return widget_exists(self.widget)
+
+    def add_turn(self, speaker, text):
+        """Append a turn, dropping the oldest one from the widget once the buffer is full"""
+        if not self.exists():
+            return
+
+        if len(self.turns) == self.turns.maxlen:
+            # Everything before the second oldest turn's mark belongs to the evicted turn
+            oldest, survivor = self.turns[0], self.turns[1]
+            self.widget.delete("1.0", survivor.mark)
+            self.widget.mark_unset(oldest.mark)
+
+        mark = f"turn{self.turn_counter}"
+        self.turn_counter += 1
+        self.widget.mark_set(mark, "end-1c")
+        self.widget.mark_gravity(mark, tk.LEFT)
+
+        tag = 'user' if speaker == "USER" else 'bot'
+        self.widget.insert(tk.END, f"{speaker}: {text}\n", tag)
+        self.widget.see(tk.END)
+        self.turns.append(TranscriptTurn(speaker, text, mark))
+
+    def set_status(self, text):
+        """Show or clear the status indicator (e.g. "Listening...") without touching the transcript"""
+        if self.status_label is not None and widget_exists(self.status_label):
+            self.status_label.config(text=text)
+
+    def clear(self):
+        if self.exists():
+            for turn in self.turns:
+                self.widget.mark_unset(turn.mark)
+            self.widget.delete("1.0", tk.END)
+        self.turns.clear()
+
+
+# === Class Definition: MicrophoneCache ===
+class MicrophoneCache:
+    """Per-host microphone choice and energy threshold, persisted between sessions"""
+    def __init__(self, path):
+        self.path = path
+        self.host = platform.node() or "default"
+        self.lock = threading.Lock()
+        self.selection = None
+        self.microphone = None
+        self.device_names = None  # latest snapshot from the watcher
+        self.stop_event = threading.Event()
+        self.watcher = None
+
+    def load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                return json.load(f).get(self.host)
+        except (OSError, ValueError):
+            return None
+
+    def save(self, selection):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        data[self.host] = selection
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=2)
+        except OSError as e:
+            print(f"Could not save microphone cache: {e}")
+
+    def is_valid(self, selection):
+        """Cheap check that the cached device still sits at the same index"""
+        index = selection.get('device_index')
+        if index is None:
+            return True
+        names = self.device_names if self.device_names is not None else list_microphones()
+        return index < len(names) and names[index] == selection.get('device_name')
+
+    def get_microphone(self):
+        """Return (sr.Microphone, selection), probing devices only on a cache miss"""
+        with self.lock:
+            if self.selection is None:
+                self.selection = self.load()
+            if not self.selection or not self.is_valid(self.selection):
+                self.selection = probe_microphone(self.device_names)
+                self.microphone = None
+                self.save(self.selection)
+            if self.microphone is None:
+                with suppress_stderr():
+                    self.microphone = sr.Microphone(device_index=self.selection.get('device_index'))
+            return self.microphone, self.selection
+
+    def start_watcher(self, interval=None):
+        """Re-probe in the background whenever the list of audio devices changes"""
+        if self.watcher and self.watcher.is_alive():
+            return
+        self.stop_event.clear()
+        self.watcher = threading.Thread(target=self.watch, args=(interval or MIC_WATCH_INTERVAL,), daemon=True)
+        self.watcher.start()
+
+    def stop_watcher(self):
+        self.stop_event.set()
+
+    def watch(self, interval):
+        self.device_names = list_microphones()
+        while not self.stop_event.wait(interval):
+            names = list_microphones()
+            if names == self.device_names:
+                continue
+            print("Audio devices changed, re-probing microphone")
+            selection = probe_microphone(names)
+            with self.lock:
+                self.device_names = names
+                self.selection = selection
+                self.microphone = None
+                self.save(selection)
+
+
+# === Class Definition: InterruptibleSource ===
+class InterruptibleSource(sr.AudioSource):
+    """Wraps an entered audio source so a blocking listen() returns once cancelled() is true
+
+    Recognizer.listen() treats an empty read as the end of the stream, so cancellation takes
+    effect within one chunk (about 60 ms) instead of after the listen timeout.
+    """
+    def __init__(self, source, cancelled):
+        self.source = source
+        self.cancelled = cancelled
+        self.interrupted = False
+        self.SAMPLE_RATE = source.SAMPLE_RATE
+        self.SAMPLE_WIDTH = source.SAMPLE_WIDTH
+        self.CHUNK = source.CHUNK
+        self.stream = self
+
+    def read(self, size):
+        if self.cancelled():
+            self.interrupted = True
+            return b""
+        return self.source.stream.read(size)
+
+
+# === Class Definition: AssistantRuntime ===
+class AssistantRuntime:
+    """The single listening loop, shared by the guest and signed-in pages
+
+    start() points it at a page's transcript, pause() stops it between pages and resume()
+    continues with the same transcript. Every start and pause begins a new session; a capture
+    still running for an older session is interrupted and its result dropped.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.resume_event = threading.Event()
+        self.shutdown_event = threading.Event()
+        self.thread = None
+        self.transcript = None
+        self.session = 0
+        self.state = "stopped"
+        self.selection = None  # microphone calibration applied to the recognizer
+        self.counters = Counter()
+
+    def start(self, transcript=None):
+        """Listen for transcript (None resumes the current one), starting the thread on first use"""
+        with self.lock:
+            if transcript is None:
+                if self.transcript is None or self.state == "running":
+                    return False
+                self.counters['resumes'] += 1
+            else:
+                self.transcript = transcript
+                self.counters['sessions'] += 1
+            self.session += 1
+            self.state = "running"
+            self.shutdown_event.clear()
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name="assistant-runtime", daemon=True)
+                self.thread.start()
+                self.counters['threads_started'] += 1
+            self.resume_event.set()
+            return True
+
+    def resume(self):
+        return self.start()
+
+    def pause(self):
+        with self.lock:
+            if self.state != "running":
+                return False
+            self.session += 1
+            self.state = "paused"
+            self.resume_event.clear()
+            self.counters['pauses'] += 1
+            return True
+
+    def shutdown(self, timeout=1.0):
+        with self.lock:
+            self.session += 1
+            self.state = "stopped"
+            self.shutdown_event.set()
+            self.resume_event.set()  # wake a paused loop so it can exit
+            thread = self.thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+
+    def is_current(self, session):
+        return self.session == session and not self.shutdown_event.is_set()
+
+    def stats(self):
+        """Lifecycle counters plus the current state, e.g. for the close-time log"""
+        with self.lock:
+            return dict(self.counters, state=self.state,
+                        thread_alive=self.thread is not None and self.thread.is_alive())
+
+    def run(self):
+        recognizer = sr.Recognizer()
+        session, last_command = None, None
+        try:
+            while not self.shutdown_event.is_set():
+                self.resume_event.wait()
+                with self.lock:
+                    current, transcript = self.session, self.transcript
+                if not self.is_current(current):
+                    continue
+                if current != session:
+                    session, last_command = current, None
+
+                # The microphone would hear the spoken answer and take it for a new command
+                while not speech_stream.idle.wait(0.1) and self.is_current(current):
+                    pass
+                if not self.is_current(current):
+                    continue
+                started = time.monotonic()
+                command = self.capture(recognizer, current, transcript)
+                if command is None or not command.strip():
+                    continue
+                if not self.is_current(current):
+                    self.counters['discarded'] += 1
+                    continue
+                if speech_stream.spoke_since(started):
+                    self.counters['echoes'] += 1
+                    continue
+                if command == last_command:
+                    self.counters['duplicates'] += 1
+                    continue
+
+                # Keep listening while the command runs (not while its answer is spoken), so "stop"
+                # or a new command can cancel it
+                last_command = command
+                self.counters['turns'] += 1
+                submit_command(transcript, command)
+        finally:
+            self.counters['threads_stopped'] += 1
+
+    def capture(self, recognizer, session, transcript):
+        """Listen for one utterance and recognise it; None on silence, errors or cancellation"""
+        gui_queue.post(transcript.set_status, "Listening...")
+        self.counters['captures'] += 1
+        source = None
+        try:
+            with suppress_stderr():
+                # Follow device changes picked up by the hot-plug watcher
+                microphone, selection = microphone_cache.get_microphone()
+                if selection is not self.selection:
+                    self.selection = selection
+                    if selection.get('energy_threshold'):
+                        recognizer.energy_threshold = selection['energy_threshold']
+                with microphone as device:
+                    # Speech starting mid-capture also ends it, before the answer is heard as a command
+                    source = InterruptibleSource(device, lambda: not self.is_current(session)
+                                                 or not speech_stream.idle.is_set())
+                    if not selection.get('energy_threshold'):
+                        recognizer.adjust_for_ambient_noise(source, duration=0.5)
+                    started = time.perf_counter()
+                    audio = recognizer.listen(source, timeout=5, phrase_time_limit=10)
+                if source.interrupted:
+                    self.counters['cancelled'] += 1
+                    return None
+
+                captured = time.perf_counter()
+                command = None
+                try:
+                    command = recognizer.recognize_google(audio)
+                    return command
+                finally:
+                    audio_recorder.record(audio, command, (time.perf_counter() - captured) * 1000,
+                                          recognizer.energy_threshold, (captured - started) * 1000)
+        except sr.WaitTimeoutError:
+            self.counters['timeouts'] += 1
+            return None
+        except Exception as e:
+            if source is not None and source.interrupted:
+                self.counters['cancelled'] += 1
+                return None
+            print(f"Recognition error: {e}")
+            self.counters['errors'] += 1
+            if not isinstance(e, sr.UnknownValueError):
+                self.shutdown_event.wait(1)  # a broken device must not turn this into a busy loop
+            return None
+        finally:
+            gui_queue.post(transcript.set_status, "")
+
+
+# === Class Definition: PhraseAudioCache ===
+class PhraseAudioCache:
+    """WAV renderings of fixed phrases, keyed by text, voice and rate, played without synthesis"""
+    def __init__(self, directory, engine, phrases=()):
+        self.directory = directory
+        self.engine = engine
+        self.phrases = set(phrases)
+        self.player = None  # resolved on first use
+
+    def key(self, text):
+        voice = self.engine.getProperty('voice')
+        rate = self.engine.getProperty('rate')
+        digest = hashlib.sha1(f"{voice}\0{text}".encode("utf-8")).hexdigest()
+        # The rate stays readable so invalidate() can drop one speed at a time
+        return f"{rate}-{digest}.wav"
+
+    def path(self, text):
+        """Path of the rendering of text, synthesising it on the first request"""
+        path = os.path.join(self.directory, self.key(text))
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            return path
+        os.makedirs(self.directory, exist_ok=True)
+        self.engine.save_to_file(text, path)
+        self.engine.runAndWait()
+        return path if os.path.exists(path) and os.path.getsize(path) > 0 else None
+
+    def find_player(self):
+        if platform.system() == "Windows":
+            return "winsound"
+        if platform.system() == "Darwin":
+            return shutil.which("afplay")
+        for player in ("paplay", "aplay", "pw-play"):
+            if shutil.which(player):
+                return shutil.which(player)
+        return None
+
+    def play(self, text):
+        """Play a cached phrase; False means the caller should synthesise it instead"""
+        if text not in self.phrases:
+            return False
+        if self.player is None:
+            self.player = self.find_player() or ""
+        if not self.player:
+            return False
+
+        try:
+            path = self.path(text)
+            if path is None:
+                return False
+            if self.player == "winsound":
+                import winsound
+                winsound.PlaySound(path, winsound.SND_FILENAME)
+            else:
+                subprocess.run([self.player, path], check=True,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            return True
+        except Exception as e:
+            print(f"Phrase playback error: {e}")
+            return False
+
+    def invalidate(self, rate=None):
+        """Delete renderings made at rate (all of them when rate is None)"""
+        if not os.path.isdir(self.directory):
+            return 0
+        prefix = f"{rate}-" if rate is not None else ""
+        removed = 0
+        for name in os.listdir(self.directory):
+            if name.endswith(".wav") and name.startswith(prefix):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                    removed += 1
+                except OSError:
+                    pass
+        return removed
+
+
+# === Class Definition: AudioRecorder ===
+class AudioRecorder:
+    """Opt-in capture of recognised utterances to a gzip corpus for replay_audio_corpus()
+
+    Each record is a length-prefixed JSON header followed by the length-prefixed PCM bytes.
+    Records are written by a background thread so recording never delays the next listen().
+    """
+    def __init__(self, path=None):
+        self.path = os.path.expanduser(path) if path else None
+        self.queue = queue.Queue()
+        self.writer = None
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.path is not None
+
+    def record(self, audio, transcript, recognition_ms, energy_threshold=None, listen_ms=None):
+        if not self.enabled:
+            return
+        header = {
+            'time': time.time(),
+            'sample_rate': audio.sample_rate,
+            'sample_width': audio.sample_width,
+            'transcript': transcript,
+            'recognition_ms': round(recognition_ms, 3),
+            'listen_ms': round(listen_ms, 3) if listen_ms is not None else None,
+            'energy_threshold': energy_threshold,
+        }
+        with self.lock:
+            if self.writer is None:
+                self.writer = threading.Thread(target=self.write_records, daemon=True)
+                self.writer.start()
+        self.queue.put((header, audio.frame_data))
+
+    def write_records(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        # Append mode adds a new gzip member per session, which readers see as one stream
+        with gzip.open(self.path, 'ab') as f:
+            while True:
+                item = self.queue.get()
+                if item is None:
+                    break
+                header, frame_data = item
+                meta = json.dumps(header).encode("utf-8")
+                f.write(AUDIO_FRAME.pack(len(meta)) + meta + AUDIO_FRAME.pack(len(frame_data)))
+                f.write(frame_data)
+                if self.queue.empty():
+                    f.flush()
+
+    def close(self):
+        """Write out everything queued so far"""
+        with self.lock:
+            writer, self.writer = self.writer, None
+        if writer is not None:
+            self.queue.put(None)
+            writer.join()
+
+
+# === Class Definition: CorpusMicrophone ===
+class CorpusMicrophone(sr.AudioSource):
+    """Stand-in for sr.Microphone that plays a recorded utterance into Recognizer.listen()
+
+    Trailing silence is appended so listen() ends the phrase through its pause detection, as it
+    would live. speed paces the chunks (1.0 is real time, 10.0 ten times faster); None means as
+    fast as the recogniser reads.
+    """
+    def __init__(self, frame_data, sample_rate, sample_width, speed=None, trailing_silence=1.0, chunk_size=1024):
+        self.SAMPLE_RATE = sample_rate
+        self.SAMPLE_WIDTH = sample_width
+        self.CHUNK = chunk_size
+        silence = (b"\x80" if sample_width == 1 else b"\0") * (int(sample_rate * trailing_silence) * sample_width)
+        self.data = memoryview(bytes(frame_data) + silence)
+        self.speed = speed
+        self.position = 0
+        self.started = None
+        self.stream = None
+
+    def __enter__(self):
+        # Each use reads from its own copy, so overlapping listen() calls each hear the whole clip
+        source = copy.copy(self)
+        source.position = 0
+        source.started = time.perf_counter()
+        source.stream = source
+        return source
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+    def read(self, size):
+        chunk = self.data[self.position:self.position + size * self.SAMPLE_WIDTH]
+        self.position += len(chunk)
+        if self.speed:
+            # Hold each chunk back until it would have been captured at the chosen speed
+            due = self.position / self.SAMPLE_WIDTH / self.SAMPLE_RATE / self.speed
+            delay = self.started + due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        return bytes(chunk)
+
+
+# === Class Definition: KnowledgePack ===
+class KnowledgePack:
+    """Optional offline Wikipedia abstracts with title/redirect lookup and an FTS5 fallback"""
+    def __init__(self, path):
+        self.path = path
+        self.db = None
+        self.has_fts = False
+
+    def available(self):
+        """Open the pack the first time it is found on disk"""
+        if self.db is None and os.path.exists(self.path):
+            self.db = DatabaseManager(self.path)
+            self.has_fts = self.db.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'abstracts_fts'").fetchone() is not None
+        return self.db is not None
+
+    def lookup(self, query, sentences=3):
+        """First sentences of the best matching abstract, or None on a miss"""
+        key = normalize_title(query)
+        if not key or not self.available():
+            return None
+
+        try:
+            row = self.db.execute(
+                "SELECT a.abstract FROM titles t JOIN articles a ON a.id = t.article_id WHERE t.key = ?",
+                (key,)
+            ).fetchone()
+            terms = re.findall(r"\w+", key)
+            if row is None and self.has_fts and terms:
+                # Every word of the query must appear in the title; bm25 prefers short titles
+                match = "title : (" + " ".join(f'"{term}"' for term in terms) + ")"
+                row = self.db.execute(
+                    "SELECT abstract FROM abstracts_fts WHERE abstracts_fts MATCH ? ORDER BY rank LIMIT 1",
+                    (match,)
+                ).fetchone()
+        except sqlite3.Error as e:
+            print(f"Knowledge pack error: {e}")
+            return None
+
+        if row is None:
+            return None
+        return " ".join(split_sentences(row[0])[:sentences])
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+
+# === Class Definition: Lexicon ===
+class Lexicon:
+    """Memory-mapped dictionary: a sorted offset table binary-searched without loading the entries
+
+    Layout: magic, entry count, then one little-endian uint64 offset per word in sorted order,
+    then the records (uint16 word length, word, uint32 entry length, JSON entry).
+    """
+    MAGIC = b"VALEXv1\0"
+    HEADER = struct.Struct("<8sI")
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        self.data = None
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def available(self):
+        with self.lock:
+            if self.data is None and os.path.exists(self.path):
+                try:
+                    self.file = open(self.path, "rb")
+                    self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+                    magic, self.count = self.HEADER.unpack_from(self.data, 0)
+                    if magic != self.MAGIC:
+                        raise ValueError("not a lexicon file")
+                except (OSError, ValueError, struct.error) as e:
+                    print(f"Ignoring lexicon {self.path}: {e}")
+                    self.close_locked()
+            return self.data is not None
+
+    def word_at(self, index):
+        offset, = struct.unpack_from("<Q", self.data, self.HEADER.size + 8 * index)
+        length, = struct.unpack_from("<H", self.data, offset)
+        return offset + 2 + length, self.data[offset + 2:offset + 2 + length]
+
+    def lookup(self, word):
+        """Entry in dictionaryapi.dev shape ({'word', 'meanings'}) or None"""
+        key = normalize_word(word).encode("utf-8")
+        if not key or not self.available():
+            return None
+
+        low, high = 0, self.count
+        while low < high:
+            mid = (low + high) // 2
+            end, current = self.word_at(mid)
+            if current < key:
+                low = mid + 1
+            elif current > key:
+                high = mid
+            else:
+                length, = struct.unpack_from("<I", self.data, end)
+                return json.loads(self.data[end + 4:end + 4 + length].decode("utf-8"))
+        return None
+
+    def close_locked(self):
+        if self.data is not None:
+            self.data.close()
+        if self.file is not None:
+            self.file.close()
+        self.data = self.file = None
+        self.count = 0
+
+    def close(self):
+        with self.lock:
+            self.close_locked()
+
+
+# === Class Definition: NewsRefresher ===
+class NewsRefresher:
+    """Polls the headlines in the background with conditional requests and keeps a formatted snapshot"""
+    def __init__(self, url, interval=None):
+        self.url = url
+        self.interval = interval or NEWS_REFRESH_INTERVAL
+        self.session = requests.Session()
+        self.etag = None
+        self.last_modified = None
+        self.snapshot = None  # (spoken intro, full report)
+        self.checked_at = None  # last time the snapshot was confirmed current
+        self.lock = threading.Lock()
+        self.fetch_lock = threading.Lock()  # the poll thread and the synchronous fallback share the session
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def refresh(self):
+        """Fetch the headlines unless the server says they have not changed; returns the snapshot"""
+        with self.fetch_lock:
+            headers = {}
+            if self.etag:
+                headers['If-None-Match'] = self.etag
+            if self.last_modified:
+                headers['If-Modified-Since'] = self.last_modified
+
+            response = self.session.get(self.url, headers=headers, timeout=10)
+            if response.status_code == 304:
+                with self.lock:
+                    self.checked_at = time.time()
+                    return self.snapshot
+
+            data = response.json()
+            if data.get('status') != 'ok' or not data.get('articles'):
+                with self.lock:
+                    return self.snapshot
+
+            snapshot = format_news_report(data['articles'])
+            with self.lock:
+                self.snapshot = snapshot
+                self.checked_at = time.time()
+                self.etag = response.headers.get('ETag')
+                self.last_modified = response.headers.get('Last-Modified')
+            return snapshot
+
+    def latest(self):
+        """(snapshot, age in seconds) or (None, None) before the first successful fetch"""
+        with self.lock:
+            if self.snapshot is None:
+                return None, None
+            return self.snapshot, time.time() - self.checked_at
+
+    def start(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def run(self):
+        while not self.stop_event.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"News refresh error: {e}")
+            self.stop_event.wait(self.interval)
+
+
+# === Class Definition: WeatherCache ===
+class WeatherCache:
+    """City name -> OpenWeatherMap ID/coordinates, recent reports, and a favourite-city prefetcher"""
+    def __init__(self, path, ttl=None):
+        self.path = path
+        self.ttl = ttl or WEATHER_TTL
+        self.session = requests.Session()
+        self.lock = threading.Lock()
+        self.cities = {}  # normalized name -> {'id', 'name', 'lat', 'lon'}
+        self.reports = {}  # normalized name -> (fetched at, {'current', 'forecast'})
+        self.wake_event = threading.Event()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                self.cities = json.load(f)
+        except (OSError, ValueError):
+            self.cities = {}
+
+    def save(self):
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with self.lock:
+                data = json.dumps(self.cities, indent=2)
+            with open(self.path, "w", encoding="utf-8") as f:
+                f.write(data)
+        except OSError as e:
+            print(f"Could not save city cache: {e}")
+
+    def location_params(self, city_name):
+        """Query by resolved city ID when known, so the API skips geocoding the name"""
+        city = self.cities.get(normalize_word(city_name))
+        return {'id': city['id']} if city else {'q': city_name}
+
+    def get(self, city_name):
+        """Cached report if it is younger than the TTL"""
+        with self.lock:
+            cached = self.reports.get(normalize_word(city_name))
+        if cached and time.time() - cached[0] < self.ttl:
+            return cached[1]
+        return None
+
+    def fetch(self, city_name):
+        """Download current weather and forecast, caching the report and the resolved city"""
+        location = self.location_params(city_name)
+        common = {'units': 'metric', 'appid': WEATHER_API_KEY}
+        current = self.session.get("http://api.openweathermap.org/data/2.5/weather",
+                                   params={**location, **common}, timeout=10).json()
+        forecast = self.session.get("http://api.openweathermap.org/data/2.5/forecast",
+                                    params={**location, **common, 'cnt': 5}, timeout=10).json()
+        report = {'current': current, 'forecast': forecast}
+
+        if 'main' in current and 'list' in forecast:
+            key = normalize_word(city_name)
+            resolved = key not in self.cities and 'id' in current
+            with self.lock:
+                self.reports[key] = (time.time(), report)
+                if resolved:
+                    self.cities[key] = {'id': current['id'], 'name': current.get('name'),
+                                        'lat': current.get('coord', {}).get('lat'),
+                                        'lon': current.get('coord', {}).get('lon')}
+            if resolved:
+                self.save()
+        return report
+
+    def prefetch_now(self):
+        """Wake the prefetcher, e.g. right after a user signs in"""
+        self.wake_event.set()
+
+    def start(self, interval=None):
+        if self.thread is None or not self.thread.is_alive():
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self.run, args=(interval or WEATHER_PREFETCH_INTERVAL,), daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.wake_event.set()
+
+    def run(self, interval):
+        while not self.stop_event.is_set():
+            email = current_user_email
+            if email:
+                for city in get_favorite_cities(email):
+                    if self.stop_event.is_set():
+                        break
+                    if self.get(city) is None:
+                        try:
+                            self.fetch(city)
+                        except Exception as e:
+                            print(f"Weather prefetch error for {city}: {e}")
+            self.wake_event.wait(interval)
+            self.wake_event.clear()
+
+
+# === Class Definition: ApplicationIndex ===
+class ApplicationIndex:
+    """In-memory launch index of XDG .desktop applications, with the executables on $PATH
+
+    Only applications with a .desktop entry can be launched by name; a bare executable is never
+    reachable through "open X", so system tools like poweroff cannot be started that way.
+    """
+    FIELD_CODE = re.compile(r"%[a-zA-Z]")
+
+    def __init__(self):
+        self.entries = {}  # lower-case name -> argv
+        self.executables = {}  # executable name -> full path
+        self.snapshot = None  # directory mtimes the index was built from
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def path_directories(self):
+        return [d for d in os.environ.get("PATH", "").split(os.pathsep) if d]
+
+    def desktop_directories(self):
+        data_home = os.environ.get("XDG_DATA_HOME") or os.path.join(os.path.expanduser("~"), ".local", "share")
+        data_dirs = os.environ.get("XDG_DATA_DIRS") or "/usr/local/share:/usr/share"
+        return [os.path.join(d, "applications") for d in [data_home, *data_dirs.split(":")] if d]
+
+    def directory_snapshot(self):
+        snapshot = []
+        for directory in self.path_directories() + self.desktop_directories():
+            try:
+                snapshot.append((directory, os.stat(directory).st_mtime_ns))
+            except OSError:
+                snapshot.append((directory, None))
+        return snapshot
+
+    def read_desktop_entry(self, path):
+        """Key/value pairs of the [Desktop Entry] group (untranslated keys only)"""
+        fields, in_group = {}, False
+        try:
+            with open(path, encoding="utf-8", errors="replace") as f:
+                for line in f:
+                    line = line.strip()
+                    if line.startswith("["):
+                        in_group = line == "[Desktop Entry]"
+                    elif in_group and "=" in line and not line.startswith("#"):
+                        key, value = line.split("=", 1)
+                        fields.setdefault(key.strip(), value.strip())
+        except OSError:
+            pass
+        return fields
+
+    def build(self):
+        """Scan $PATH and .desktop files; names win over generic names, which win over keywords"""
+        snapshot = self.directory_snapshot()
+        executables = {}
+        extensions = [e.lower() for e in os.environ.get("PATHEXT", "").split(";") if e] if platform.system() == "Windows" else []
+        for directory in self.path_directories():
+            try:
+                with os.scandir(directory) as scan:
+                    for entry in scan:
+                        name, ext = os.path.splitext(entry.name)
+                        if extensions and ext.lower() not in extensions:
+                            continue
+                        if entry.is_file() and os.access(entry.path, os.X_OK):
+                            executables.setdefault((name if extensions else entry.name).lower(), entry.path)
+            except OSError:
+                continue
+
+        names, generic, keywords = {}, {}, {}
+        for directory in self.desktop_directories():
+            try:
+                files = sorted(f for f in os.listdir(directory) if f.endswith(".desktop"))
+            except OSError:
+                continue
+            for filename in files:
+                fields = self.read_desktop_entry(os.path.join(directory, filename))
+                if fields.get("Type", "Application") != "Application" or not fields.get("Exec"):
+                    continue
+                if fields.get("Hidden") == "true" or fields.get("NoDisplay") == "true":
+                    continue
+                try:
+                    argv = [arg for arg in shlex.split(self.FIELD_CODE.sub("", fields["Exec"])) if arg]
+                except ValueError:
+                    continue
+                if not argv or os.path.basename(argv[0]).lower() in BLOCKED_EXECUTABLES:
+                    continue
+                names.setdefault(fields.get("Name", "").lower(), argv)
+                names.setdefault(os.path.basename(argv[0]).lower(), argv)
+                names.setdefault(filename[:-len(".desktop")].lower(), argv)
+                generic.setdefault(fields.get("GenericName", "").lower(), argv)
+                for keyword in fields.get("Keywords", "").split(";"):
+                    keywords.setdefault(keyword.strip().lower(), argv)
+
+        entries = {}
+        for source in (names, generic, keywords):
+            for name, argv in source.items():
+                if name:
+                    entries.setdefault(name, argv)
+
+        with self.lock:
+            self.entries, self.executables, self.snapshot = entries, executables, snapshot
+        return len(entries)
+
+    def ensure_built(self):
+        if self.snapshot is None:
+            self.build()
+
+    def lookup(self, app_name):
+        """argv that launches app_name, or None"""
+        self.ensure_built()
+        return self.entries.get(app_name.lower().strip())
+
+    def has_executable(self, name):
+        self.ensure_built()
+        return name.lower() in self.executables
+
+    def start(self, interval=None):
+        """Build in the background, then rebuild whenever a scanned directory changes"""
+        if self.thread is None or not self.thread.is_alive():
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self.watch, args=(interval or APP_INDEX_INTERVAL,), daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def watch(self, interval):
+        while not self.stop_event.is_set():
+            try:
+                if self.snapshot != self.directory_snapshot():
+                    count = self.build()
+                    print(f"Application index: {count} names")
+            except Exception as e:
+                print(f"Application index error: {e}")
+            self.stop_event.wait(interval)
+
+
+# === Class Definition: FuzzyIndex ===
+class FuzzyIndex:
+    """Trigram candidate index over a vocabulary, verified with a bounded edit distance"""
+    def __init__(self, terms=()):
+        self.terms = []
+        self.known = set()
+        self.trigrams = {}  # trigram -> ids of the terms containing it
+        for term in terms:
+            self.add(term)
+
+    @staticmethod
+    def grams(text):
+        padded = f"  {text} "
+        return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+    def add(self, term):
+        term = term.lower().strip()
+        if not term or term in self.known:
+            return
+        self.known.add(term)
+        self.terms.append(term)
+        for gram in self.grams(term):
+            self.trigrams.setdefault(gram, []).append(len(self.terms) - 1)
+
+    def __contains__(self, term):
+        return term in self.known
+
+    def __len__(self):
+        return len(self.terms)
+
+    def match(self, text, max_distance):
+        """Closest term within max_distance edits, or None"""
+        text = text.lower().strip()
+        if text in self.known or max_distance < 1:
+            return text if text in self.known else None
+
+        grams = self.grams(text)
+        shared = Counter(term_id for gram in grams for term_id in self.trigrams.get(gram, ()))
+        # One edit changes at most three trigrams, so a close term shares at least this many
+        needed = max(1, len(grams) - 3 * max_distance)
+        best, best_distance = None, max_distance + 1
+        for term_id, count in shared.most_common():
+            if count < needed:
+                break
+            term = self.terms[term_id]
+            if abs(len(term) - len(text)) >= best_distance:
+                continue
+            distance = bounded_edit_distance(text, term, best_distance - 1)
+            if distance < best_distance:
+                best, best_distance = term, distance
+        return best
+
+
+# === Class Definition: CommandCorrector ===
+class CommandCorrector:
+    """Fixes near-miss recognitions of intent keywords, app names and city names before dispatch"""
+    def __init__(self):
+        self.keywords = FuzzyIndex(INTENT_KEYWORDS)
+        self.apps = None
+        self.cities = None
+        self.app_snapshot = None
+        self.lock = threading.Lock()
+
+    def ensure_built(self):
+        """(Re)build the app and city vocabularies when missing or the app index changed"""
+        app_index.ensure_built()
+        with self.lock:
+            if self.apps is not None and self.app_snapshot is app_index.snapshot:
+                return
+            self.apps = FuzzyIndex(itertools.chain(APP_COMMANDS, app_index.entries))
+            self.cities = FuzzyIndex(itertools.chain(
+                (zone.rsplit("/", 1)[-1].replace("_", " ") for zone in pytz.all_timezones if "/" in zone),
+                weather_cache.cities
+            ))
+            self.app_snapshot = app_index.snapshot
+
+    def is_word(self, word):
+        """Dictionary words are only replaced when that rescues an unrecognised command;
+        without the offline lexicon every word is treated as one"""
+        return not lexicon.available() or lexicon.lookup(word) is not None
+
+    def names_intent(self, command):
+        """Whether a command contains an intent's trigger as whole words"""
+        text = " " + " ".join(re.findall(r"[a-z']+", command.lower())) + " "
+        return any(f" {phrase} " in text for phrase in INTENT_PHRASES)
+
+    def correct(self, command):
+        self.ensure_built()
+        words, guesses = [], []
+        for word in command.split():
+            lower = word.lower()
+            fix = None
+            if lower.isalpha() and lower not in self.keywords:
+                fix = self.keywords.match(lower, allowed_edits(lower))
+            if fix and self.is_word(lower):
+                words.append(word)
+                guesses.append(fix)
+            else:
+                words.append(fix or word)
+                guesses.append(fix or word)
+        corrected = " ".join(words)
+        # "what is a cello" must not become a greeting: real words are kept unless the command
+        # means nothing as heard and does mean something corrected ("wether in chicago")
+        if guesses != words and not self.names_intent(corrected):
+            guessed = " ".join(guesses)
+            if self.names_intent(guessed):
+                corrected = guessed
+
+        # Arguments: the application after "open", the city in weather and time questions
+        lower = corrected.lower()
+        match = re.match(r"^(.*?\bopen\s+)(.+?)[?.!]*$", corrected, re.IGNORECASE)
+        if match:
+            vocabulary, prefix, argument = self.apps, match.group(1), match.group(2)
+        else:
+            match = re.search(r"^(.*\b(?:in|for|at)\s+)(.+?)[?.!]*$", corrected, re.IGNORECASE)
+            if not match or not any(word in lower for word in ("weather", "forecast", "time")):
+                return corrected
+            vocabulary, prefix, argument = self.cities, match.group(1), match.group(2)
+
+        argument = argument.lower().strip()
+        if argument not in vocabulary:
+            fix = vocabulary.match(argument, allowed_edits(argument))
+            if fix:
+                corrected = prefix + fix
+        return corrected
+
+
+# === Class Definition: HistoryIndex ===
+class HistoryIndex:
+    """Hashed word n-gram vectors of every history message, searched by cosine similarity
+
+    Rows are L2-normalised sparse vectors in append-only CSR arrays (uint16 columns, float16
+    weights), a few dozen bytes per message. Searches use a column-major copy (the rows holding
+    each column), so a query only touches the rows sharing one of its few columns; rows appended
+    since that copy was built are scored straight from the CSR arrays until there are
+    HISTORY_INDEX_TAIL of them. log_conversation() adds rows as they are written; sync() picks up
+    rows written any other way (imports, batch mode, another process) by conversation id. save()
+    writes only the rows added since the last save, as a new compressed segment next to meta.json.
+    """
+    def __init__(self, path=None, dims=None):
+        self.path = path  # directory holding meta.json and the segment files
+        self.dims = dims or HISTORY_INDEX_DIMS
+        self.lock = threading.RLock()
+        self.loaded = False
+        self.reset()
+
+    def available(self):
+        return np is not None
+
+    def reset(self, capacity=1024):
+        self.count = 0  # rows
+        self.nnz = 0  # stored weights
+        if np is not None:
+            self.ids = np.zeros(capacity, np.int64)
+            self.users = np.zeros(capacity, np.int32)
+            self.indptr = np.zeros(capacity + 1, np.int64)
+            self.indices = np.zeros(capacity * 16, np.uint16)
+            self.values = np.zeros(capacity * 16, np.float16)
+        self.user_codes = {}  # email -> small int stored per row
+        self.synced_id = 0  # every conversation id up to here has been seen by sync()
+        self.unsynced = set()  # ids above synced_id already added by add()
+        self.segments = []  # saved segment file names, oldest first
+        self.saved_count = 0  # rows already written to a segment
+        self.dirty = False
+        self.columns = None  # (rows covered, column offsets, row per weight, weights) for search
+
+    def ensure_loaded(self):
+        """Load the saved segments once, discarding them if they belong to another database"""
+        if self.loaded:
+            return
+        self.loaded = True
+        if not self.path or not os.path.exists(os.path.join(self.path, "meta.json")):
+            return
+        try:
+            with open(os.path.join(self.path, "meta.json"), encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta['dims'] != self.dims or meta['database'] != os.path.abspath(db_manager.db_path):
+                return
+            for name in meta['segments']:
+                with np.load(os.path.join(self.path, name), allow_pickle=False) as data:
+                    self.append(data['indptr'], data['indices'], data['values'], data['ids'], data['users'])
+            self.user_codes = meta['user_codes']
+            self.synced_id = meta['synced_id']
+            self.unsynced = set(meta['unsynced'])
+            self.segments = meta['segments']
+            self.saved_count = self.count
+            self.dirty = False
+            newest = db_manager.execute("SELECT COALESCE(MAX(id), 0) FROM conversations").fetchone()[0]
+            if newest < max(self.synced_id, *self.unsynced, 0):
+                raise ValueError("history is older than the index")
+        except (OSError, ValueError, KeyError, sqlite3.Error) as e:
+            print(f"Rebuilding history index: {e}")
+            self.reset()
+
+    def user_code(self, email):
+        return self.user_codes.setdefault(email, len(self.user_codes) + 1)
+
+    def grow(self, name, needed):
+        old = getattr(self, name)
+        if needed > len(old):
+            grown = np.zeros(max(needed, 2 * len(old)), old.dtype)
+            grown[:len(old)] = old
+            setattr(self, name, grown)
+
+    def append(self, indptr, indices, values, ids, users):
+        """Add CSR rows; rows without any features can never match and are dropped"""
+        counts = np.diff(indptr)
+        keep = counts > 0
+        counts, ids, users = counts[keep], np.asarray(ids)[keep], np.asarray(users)[keep]
+        rows, weights = len(counts), int(counts.sum())
+        for name, needed in (('ids', self.count + rows), ('users', self.count + rows),
+                             ('indptr', self.count + rows + 1), ('indices', self.nnz + weights),
+                             ('values', self.nnz + weights)):
+            self.grow(name, needed)
+        self.ids[self.count:self.count + rows] = ids
+        self.users[self.count:self.count + rows] = users
+        self.indptr[self.count + 1:self.count + rows + 1] = self.nnz + np.cumsum(counts)
+        self.indices[self.nnz:self.nnz + weights] = indices[indptr[0]:indptr[-1]]
+        self.values[self.nnz:self.nnz + weights] = values[indptr[0]:indptr[-1]]
+        self.count += rows
+        self.nnz += weights
+        self.dirty = True
+
+    def add(self, row_id, email, message):
+        """Index one message just written to the conversations table"""
+        if np is None or email is None or not message:
+            return
+        with self.lock:
+            self.ensure_loaded()
+            if row_id <= self.synced_id or row_id in self.unsynced:
+                return
+            self.append(*vectorize_texts([message], self.dims), [row_id], [self.user_code(email)])
+            self.unsynced.add(row_id)
+
+    def sync(self, batch_size=None, progress=None):
+        """Index every signed-in user's message written since the last sync; returns rows added"""
+        if np is None:
+            return 0
+        added = 0
+        with self.lock:
+            self.ensure_loaded()
+            while True:
+                rows = db_manager.execute(
+                    "SELECT c.id, u.email, c.message FROM conversations c JOIN users u ON u.id = c.user_id "
+                    "WHERE c.id > ? ORDER BY c.id LIMIT ?", (self.synced_id, batch_size or HISTORY_INDEX_BATCH)
+                ).fetchall()
+                if not rows:
+                    break
+                fresh = [row for row in rows if row[2] and row[0] not in self.unsynced]
+                if fresh:
+                    self.append(*vectorize_texts([message for _, _, message in fresh], self.dims),
+                                [row_id for row_id, _, _ in fresh], [self.user_code(email) for _, email, _ in fresh])
+                    added += len(fresh)
+                self.synced_id = rows[-1][0]
+                self.dirty = True
+                if progress:
+                    progress(added)
+            self.unsynced = {row_id for row_id in self.unsynced if row_id > self.synced_id}
+        return added
+
+    def search(self, queries, email, k=None):
+        """Top-k (conversation id, score) lists, one per query, among email's messages"""
+        k = k or HISTORY_TOP_K
+        if np is None:
+            return [[] for _ in queries]
+        self.sync()
+        with self.lock:
+            code = self.user_codes.get(email)
+            if code is None or not self.count:
+                return [[] for _ in queries]
+            # Appends only write past count and nnz, and growing copies, so these stay valid unlocked
+            count, ids, users = self.count, self.ids, self.users
+            indptr, indices, values = self.indptr, self.indices, self.values
+            columns = self.columns
+        if columns is None or count - columns[0] > HISTORY_INDEX_TAIL:
+            columns = self.build_columns(count, indptr, indices, values)
+            with self.lock:
+                if self.columns is None or self.columns[0] < columns[0]:
+                    self.columns = columns
+        covered, offsets, rows, weights = columns
+
+        query_ptr, query_columns, query_weights = vectorize_texts(queries, self.dims)
+        scores = np.zeros((len(queries), count), np.float32)
+        for i in range(len(queries)):
+            for column, weight in zip(query_columns[query_ptr[i]:query_ptr[i + 1]],
+                                      query_weights[query_ptr[i]:query_ptr[i + 1]]):
+                span = slice(offsets[column], offsets[column + 1])
+                scores[i, rows[span]] += weight * weights[span].astype(np.float32)  # a row holds a column once
+
+        if count > covered:
+            # The tail: expand the queries to dense columns and take dot products with the CSR rows
+            dense = np.zeros((self.dims, len(queries)), np.float32)
+            for i in range(len(queries)):
+                span = slice(query_ptr[i], query_ptr[i + 1])
+                dense[query_columns[span], i] = query_weights[span]
+            low, high = indptr[covered], indptr[count]
+            products = dense[indices[low:high]] * values[low:high, None].astype(np.float32)
+            scores[:, covered:count] = np.add.reduceat(products, indptr[covered:count] - low, axis=0).T
+        scores[:, users[:count] != code] = -1.0
+
+        results = []
+        for row in scores:
+            top = np.argpartition(-row, min(k, count) - 1)[:k]
+            top = top[np.argsort(-row[top])]
+            results.append([(int(ids[i]), float(row[i])) for i in top if row[i] >= HISTORY_MIN_SCORE])
+        return results
+
+    def build_columns(self, count, indptr, indices, values):
+        """Column-major copy of the first count rows: (count, column offsets, row per weight, weights)"""
+        nnz = int(indptr[count])
+        order = np.argsort(indices[:nnz], kind='stable')
+        offsets = np.zeros(self.dims + 1, np.int64)
+        offsets[1:] = np.cumsum(np.bincount(indices[:nnz], minlength=self.dims))
+        rows = np.repeat(np.arange(count, dtype=np.int32), np.diff(indptr[:count + 1]))[order]
+        return count, offsets, rows, values[:nnz][order]
+
+    def save(self):
+        """Write the rows added since the last save as a new segment, merging once there are many"""
+        if np is None or not self.path:
+            return
+        with self.lock:
+            if not self.dirty:
+                return
+            os.makedirs(self.path, exist_ok=True)
+            compact = len(self.segments) >= HISTORY_INDEX_SEGMENTS
+            first = 0 if compact else self.saved_count
+            segments = [] if compact else list(self.segments)
+            if self.count > first:
+                name = f"segment-{int(time.time() * 1000)}-{self.count}.npz"
+                low, high = self.indptr[first], self.indptr[self.count]
+                with open(os.path.join(self.path, name), 'wb') as f:
+                    np.savez_compressed(f, ids=self.ids[first:self.count], users=self.users[first:self.count],
+                                        indptr=self.indptr[first:self.count + 1] - low,
+                                        indices=self.indices[low:high], values=self.values[low:high])
+                segments.append(name)
+
+            # meta.json is the commit point: segments it does not list are leftovers
+            meta = {'dims': self.dims, 'database': os.path.abspath(db_manager.db_path), 'segments': segments,
+                    'user_codes': self.user_codes, 'synced_id': self.synced_id, 'unsynced': sorted(self.unsynced)}
+            temp_path = os.path.join(self.path, "meta.json.tmp")
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(meta, f)
+            os.replace(temp_path, os.path.join(self.path, "meta.json"))
+            for name in os.listdir(self.path):
+                if name.startswith("segment-") and name not in segments:
+                    os.remove(os.path.join(self.path, name))
+            self.segments, self.saved_count, self.dirty = segments, self.count, False
+
+
+# === Class Definition: AssistantSession ===
+class AssistantSession:
+    """Per-connection state for server mode, replacing the desktop app's module globals"""
+    __slots__ = ("id", "peer", "user_email", "started", "commands", "inflight")
+
+    def __init__(self, session_id, peer, max_inflight):
+        self.id = session_id
+        self.peer = peer
+        self.user_email = None  # guest until a login request succeeds
+        self.started = time.time()
+        self.commands = 0
+        self.inflight = asyncio.Semaphore(max_inflight)
+
+
+# === Class Definition: UsageRecorder ===
+class UsageRecorder:
+    """Buffers one analytics row per turn and writes them in batches
+
+    The turns_update_usage trigger folds every inserted row into the per user, intent and day
+    summaries, so reports never scan the turns table. A full batch is written at once; a
+    background thread writes whatever is left every interval seconds.
+    """
+    def __init__(self, batch_size=None, interval=None):
+        self.batch_size = batch_size or USAGE_FLUSH_ROWS
+        self.interval = interval or USAGE_FLUSH_INTERVAL
+        self.rows = []
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def record(self, email, intent, latency_ms, outcome):
+        with self.lock:
+            self.rows.append((email, int(time.time()), intent, round(latency_ms, 3), outcome))
+            due = len(self.rows) >= self.batch_size
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name="usage-flush", daemon=True)
+                self.thread.start()
+        if due:
+            self.flush()
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            self.flush()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def flush(self):
+        with self.lock:
+            rows, self.rows = self.rows, []
+        if not rows:
+            return 0
+        try:
+            db_manager.executemany(
+                "INSERT INTO turns (user_id, timestamp, intent, latency_ms, outcome) "
+                "VALUES ((SELECT id FROM users WHERE email = ?), ?, ?, ?, ?)",
+                rows
+            )
+        except Exception as e:
+            print(f"Failed to record usage: {e}")
+            return 0
+        return len(rows)
+
+
+# === Class Definition: TurnOutput ===
+class TurnOutput:
+    """The transcript widget as one intent handler sees it; appends are dropped once the turn is abandoned"""
+    def __init__(self, widget, abandoned):
+        self.widget = widget
+        self.abandoned = abandoned  # threading.Event set when the turn times out or is cancelled
+
+
+# === Class Definition: IntentRunner ===
+class IntentRunner:
+    """Runs intent handlers on a managed pool with per-intent time budgets and cancellation
+
+    Python cannot kill a thread, so a handler that times out or is cancelled keeps its worker
+    until it returns and its result is dropped; the pool size bounds how many can pile up.
+    Handlers get the transcript as a TurnOutput, so such a handler cannot write to it either.
+    """
+    def __init__(self, workers=None):
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers or INTENT_WORKERS,
+                                                              thread_name_prefix="intent")
+        self.lock = threading.Lock()
+        self.inflight = None  # (wake, cancelled) events of the interactive turn in progress
+        self.stats = Counter()  # (intent, outcome) -> count
+
+    def run(self, command, conversation_area=None, cancel_previous=True, user_email=None, denied_intents=()):
+        """Handler response, a timeout fallback, or None when a newer command cancelled it
+
+        Every turn is recorded for usage analytics under user_email (None for guests). Intents in
+        denied_intents are refused without running their handler.
+        """
+        start = time.perf_counter()
+        command = correct_command(command)
+        intent = classify_intent(command.lower())
+        if intent in denied_intents:
+            with self.lock:
+                self.stats[intent, "denied"] += 1
+            usage_recorder.record(user_email, intent, (time.perf_counter() - start) * 1000, "denied")
+            return REMOTE_DENIED_MESSAGE
+        wake, cancelled = threading.Event(), threading.Event()
+        if cancel_previous:
+            with self.lock:
+                self.cancel_locked()
+                self.inflight = (wake, cancelled)
+
+        output = TurnOutput(conversation_area, cancelled) if conversation_area is not None else None
+        future = self.executor.submit(handle_intent, intent, command, output, user_email=user_email)
+        future.add_done_callback(lambda _: wake.set())
+        wake.wait(INTENT_TIMEOUTS.get(intent, DEFAULT_INTENT_TIMEOUT))
+
+        with self.lock:
+            if self.inflight is not None and self.inflight[0] is wake:
+                self.inflight = None
+            if cancelled.is_set():
+                outcome = "cancelled"
+            elif not future.done():
+                outcome = "timeouts"
+            elif future.exception() is not None:
+                outcome = "errors"
+            else:
+                outcome = "completed"
+            self.stats[intent, outcome] += 1
+        usage_recorder.record(user_email, intent, (time.perf_counter() - start) * 1000, outcome)
+
+        if outcome == "completed":
+            return future.result()
+        cancelled.set()  # a timed-out handler that finishes later must not write to the transcript
+        future.cancel()  # only helps if it never started
+        if outcome == "cancelled":
+            return None
+        if outcome == "errors":
+            print(f"Handler error in {intent}: {future.exception()}")
+            return INTENT_ERROR_MESSAGE
+        print(f"Handler for {intent} exceeded its {INTENT_TIMEOUTS.get(intent, DEFAULT_INTENT_TIMEOUT)}s budget")
+        return INTENT_TIMEOUT_MESSAGE
+
+    def cancel(self):
+        """Abandon the interactive turn in progress (a new command or 'stop' takes over)"""
+        with self.lock:
+            self.cancel_locked()
+
+    def cancel_locked(self):
+        if self.inflight is not None:
+            wake, cancelled = self.inflight
+            cancelled.set()
+            wake.set()
+            self.inflight = None
+
+    def summary(self):
+        """{intent: {outcome: count}} plus overall totals under 'all'"""
+        with self.lock:
+            items = list(self.stats.items())
+        summary = {}
+        for (intent, outcome), count in items:
+            summary.setdefault(intent, {})[outcome] = count
+            totals = summary.setdefault("all", {})
+            totals[outcome] = totals.get(outcome, 0) + count
+        return summary
+
+
+# === Class Definition: MemoryMonitor ===
+class MemoryMonitor:
+    """Periodic tracemalloc snapshots plus Tk widget and thread counts for long sessions
+
+    Every sample writes a report with the allocation sites that grew since the previous sample
+    and since the first one, and flags metrics that grew in each of the last few samples.
+    """
+    METRICS = ('traced_bytes', 'widgets', 'threads')
+
+    def __init__(self, directory, frames=None, top=None, trend_window=None):
+        self.directory = directory
+        self.frames = frames or MEMORY_TRACE_FRAMES
+        self.top = top or MEMORY_REPORT_TOP
+        self.trend_window = max(2, trend_window or MEMORY_TREND_WINDOW)
+        self.samples = deque(maxlen=1000)
+        self.sample_count = 0
+        self.baseline = None
+        self.previous = None
+        self.root = None
+        self.interval_ms = None
+        self.after_id = None
+
+    def start(self, root=None, interval=None):
+        """Sample every interval seconds on the Tk thread, where widgets can be counted safely"""
+        self.root = root
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+        if root is not None and interval:
+            self.interval_ms = int(interval * 1000)
+            self.after_id = root.after(self.interval_ms, self.tick)
+
+    def stop(self):
+        if self.after_id is not None and self.root is not None and widget_exists(self.root):
+            self.root.after_cancel(self.after_id)
+        self.after_id = None
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def tick(self):
+        try:
+            self.sample()
+        except Exception as e:
+            print(f"Memory diagnostics error: {e}")
+        if self.root is not None and widget_exists(self.root):
+            self.after_id = self.root.after(self.interval_ms, self.tick)
+
+    def sample(self, label=None):
+        """Record one sample and write its report; returns (sample, flagged trends)"""
+        gc.collect()
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        ))
+        traced, peak = tracemalloc.get_traced_memory()
+        threads = Counter(thread_kind(thread) for thread in threading.enumerate())
+        sample = {
+            'time': time.time(),
+            'label': label,
+            'traced_bytes': traced,
+            'peak_bytes': peak,
+            'widgets': count_widgets(self.root) if self.root is not None and widget_exists(self.root) else 0,
+            'threads': sum(threads.values()),
+            'thread_kinds': dict(threads),
+        }
+        self.samples.append(sample)
+        self.sample_count += 1
+        trends = self.growth_trends()
+        self.write_report(sample, snapshot, trends)
+        if self.baseline is None:
+            self.baseline = snapshot
+        self.previous = snapshot
+        return sample, trends
+
+    def growth_trends(self):
+        """Metrics that grew in every one of the last trend_window samples: {metric: (from, to)}"""
+        recent = list(self.samples)[-self.trend_window:]
+        if len(recent) < self.trend_window:
+            return {}
+        trends = {}
+        for metric in self.METRICS:
+            values = [sample[metric] for sample in recent]
+            if all(later > earlier for earlier, later in zip(values, values[1:])):
+                trends[metric] = (values[0], values[-1])
+        return trends
+
+    def write_report(self, sample, snapshot, trends):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, "samples.jsonl"), 'a', encoding='utf-8') as f:
+            f.write(json.dumps(dict(sample, trends=trends)) + "\n")
+
+        stamp = datetime.fromtimestamp(sample['time']).strftime('%Y%m%d-%H%M%S')
+        lines = [
+            f"Memory report {stamp}" + (f" ({sample['label']})" if sample['label'] else ""),
+            f"traced {sample['traced_bytes'] / 1024 / 1024:.2f} MiB, peak {sample['peak_bytes'] / 1024 / 1024:.2f} MiB, "
+            f"{sample['widgets']} widgets, {sample['threads']} threads",
+            "threads: " + ", ".join(f"{kind} x{count}" for kind, count in sorted(sample['thread_kinds'].items())),
+        ]
+        for metric, (first, last) in trends.items():
+            lines.append(f"GROWTH: {metric} rose in each of the last {self.trend_window} samples ({first} -> {last})")
+        for title, reference in (("since previous sample", self.previous), ("since first sample", self.baseline)):
+            if reference is None:
+                continue
+            lines.append(f"\nTop growth {title}:")
+            for stat in snapshot.compare_to(reference, 'lineno')[:self.top]:
+                lines.append(f"  {stat}")
+        with open(os.path.join(self.directory, f"memory-{stamp}-{self.sample_count:04d}.txt"), 'w', encoding='utf-8') as f:
+            f.write("\n".join(lines) + "\n")
+
+
+# === Class Definition: PageManager ===
+class PageManager:
+    """Builds each page once, caches its frame and switches pages with tkraise()"""
+    def __init__(self):
+        self.root = None
+        self.container = None
+        self.pages = {}  # name -> (frame, refresh callback)
+        self.current = None
+        self.latencies = {}  # name -> recent navigation times in ms
+
+    def attach(self, root):
+        self.root = root
+        self.container = tk.Frame(root, bg=DARK_THEME['bg'])
+        self.container.pack(fill=tk.BOTH, expand=True)
+        self.container.grid_rowconfigure(0, weight=1)
+        self.container.grid_columnconfigure(0, weight=1)
+
+    def show(self, name, builder):
+        """Raise a page, building it on first use; builder(frame) returns an optional refresh callback"""
+        start = time.perf_counter()
+
+        # Pages never share the microphone, the target page restarts it if needed
+        stop_assistant()
+
+        built = name not in self.pages
+        if built:
+            frame = tk.Frame(self.container, bg=DARK_THEME['bg'])
+            frame.grid(row=0, column=0, sticky='nsew')
+            try:
+                self.pages[name] = (frame, builder(frame))
+            except Exception:
+                frame.destroy()
+                raise
+
+        frame, refresh = self.pages[name]
+        self.current = name
+        frame.tkraise()
+        frame.focus_set()
+        if refresh:
+            refresh()
+
+        # Measured once Tk has processed the resulting layout and redraw
+        self.root.after_idle(self.record_latency, name, start, built)
+
+    def record_latency(self, name, start, built):
+        elapsed = (time.perf_counter() - start) * 1000
+        self.latencies.setdefault(name, deque(maxlen=50)).append(elapsed)
+        print(f"Navigation to '{name}' took {elapsed:.1f} ms ({'built' if built else 'cached'})")
+
+
+# === Class Definition: GuiUpdateQueue ===
+class GuiUpdateQueue:
+    """Queue that worker threads post GUI work to, drained on the Tk thread at a fixed frame rate"""
+    APPEND = object()
+
+    def __init__(self, frame_ms=None):
+        self.messages = queue.SimpleQueue()
+        self.frame_ms = frame_ms or GUI_FRAME_MS
+        self.root = None
+
+    def post(self, callback, *args):
+        """Run callback(*args) on the Tk thread during the next frame"""
+        self.messages.put((callback, args))
+
+    def append_text(self, widget, text, tag=None):
+        """Append text to a Text widget (or a TurnOutput); consecutive appends are merged into one insert"""
+        if isinstance(widget, TurnOutput):
+            if widget.abandoned.is_set():
+                return
+            widget = widget.widget
+        if widget is not None:
+            self.messages.put((self.APPEND, (widget, text, tag)))
+
+    def start(self, root):
+        self.root = root
+        root.after(self.frame_ms, self.drain)
+
+    def drain(self):
+        """Apply everything posted since the last frame, then scroll each touched widget once"""
+        pending_widget, pending_chunks = None, []
+        touched = []
+
+        def flush():
+            if pending_widget is not None and widget_exists(pending_widget):
+                pending_widget.insert(tk.END, *pending_chunks)
+                if pending_widget not in touched:
+                    touched.append(pending_widget)
+
+        # Work posted while draining (e.g. the next spoken sentence) waits for the next frame
+        for _ in range(self.messages.qsize()):
+            try:
+                callback, args = self.messages.get_nowait()
+            except queue.Empty:
+                break
+
+            if callback is self.APPEND:
+                widget, text, tag = args
+                if widget is not pending_widget:
+                    flush()
+                    pending_widget, pending_chunks = widget, []
+                pending_chunks.extend((text, tag or ()))
+                continue
+
+            flush()
+            pending_widget, pending_chunks = None, []
+            try:
+                callback(*args)
+            except Exception as e:
+                print(f"GUI update error: {e}")
+
+        flush()
+        for widget in touched:
+            if widget_exists(widget):
+                widget.see(tk.END)
+
+        if self.root is not None and widget_exists(self.root):
+            self.root.after(self.frame_ms, self.drain)
+
+
+# === Class Definition: SpeechStream ===
+class SpeechStream:
+    """Speaks one sentence per GUI frame so playback starts early and can stop between sentences"""
+    def __init__(self, post):
+        self.post = post
+        self.pending = deque()
+        self.lock = threading.Lock()
+        self.active = False
+        self.idle = threading.Event()  # clear while sentences are queued or playing
+        self.idle.set()
+        self.finished_at = 0.0  # time.monotonic() when playback last went idle
+        self.muted = False  # set by the soak test, which runs thousands of greetings
+
+    def say(self, text):
+        if self.muted:
+            return
+        text = normalize_speech_text(text)
+        # Cached phrases are played whole; splitting them would miss the cache
+        sentences = [text] if text in phrase_cache.phrases else split_sentences(text)
+        with self.lock:
+            self.pending.extend(sentences)
+            if self.active or not self.pending:
+                return
+            self.active = True
+            self.idle.clear()
+        self.post(self.speak_next)
+
+    def stop(self):
+        """Drop the queued sentences; the one being spoken is allowed to finish"""
+        with self.lock:
+            self.pending.clear()
+
+    def spoke_since(self, started):
+        """Whether anything was playing at or after time.monotonic() value started"""
+        with self.lock:
+            return self.active or self.finished_at >= started
+
+    def speak_next(self):
+        with self.lock:
+            if not self.pending:
+                self.active = False
+                self.finished_at = time.monotonic()
+                self.idle.set()
+                return
+            sentence = self.pending.popleft()
+        try:
+            speak_sentence(sentence)
+        finally:
+            self.post(self.speak_next)
+
 # === Global Variables ===
-current_user = None
+current_user = None  # UserProfile of the signed-in user
+VOICE_SPEED_RATES = {"Fast": 200, "Normal": 150, "Slow": 100}  # pyttsx3 words per minute
 window = None
 current_state = "main"
 current_user_email = None
-assistant_stop_event = threading.Event()
+MAX_TRANSCRIPT_TURNS = 200
+GUI_FRAME_MS = 33  # ~30 GUI frames per second
+gui_queue = GuiUpdateQueue()
+speech_stream = SpeechStream(gui_queue.post)
+page_manager = PageManager()
+APP_DATA_DIR = os.path.join(os.path.expanduser("~"), ".voice_assistant")
+MIC_WATCH_INTERVAL = 10  # seconds between audio device list checks
+microphone_cache = MicrophoneCache(os.path.join(APP_DATA_DIR, "microphone.json"))
+assistant_runtime = AssistantRuntime()
+audio_recorder = AudioRecorder(os.environ.get("VOICE_ASSISTANT_RECORD"))  # corpus path, recording is opt-in
+command_lock = threading.Lock()  # serialises spoken and typed turns
+GOODBYE_MESSAGE = "Goodbye! Have a nice day."
+BATCH_WORKERS = 4
 ph = PasswordHasher()
 engine = pyttsx3.init()
 voices = engine.getProperty('voices')
 current_rate = engine.getProperty('rate')
+CACHED_PHRASES = (
+    "Good Morning Sir !", "Good Afternoon Sir !", "Good Evening Sir !",
+    "Voice Assistant initialized", "Voice Assistant initialized.",
+    "Hello! How can I help you today?", "I am in your service",
+    GOODBYE_MESSAGE,
+    "I'm not sure how to help with that. Could you try asking something else?",
+    "What would you like me to search on Wikipedia?",
+    "Please specify a city (e.g., 'weather in London')",
+    "I couldn't perform the search. Please try again.",
+)
+phrase_cache = PhraseAudioCache(os.path.join(APP_DATA_DIR, "phrases"), engine, CACHED_PHRASES)
+knowledge_pack = KnowledgePack(os.path.join(APP_DATA_DIR, "wikipedia.db"))
+lexicon = Lexicon(os.path.join(APP_DATA_DIR, "lexicon.bin"))
+NEWS_API_KEY = "your_newsapi_key"  # Replace with your actual key
+NEWS_REFRESH_INTERVAL = 15 * 60  # seconds between headline polls
+news_refresher = NewsRefresher(f"https://newsapi.org/v2/top-headlines?country=us&pageSize=5&apiKey={NEWS_API_KEY}")
+WEATHER_API_KEY = "your_api_key"  # Get from https://openweathermap.org/
+WEATHER_TTL = 10 * 60  # seconds a weather report counts as current
+WEATHER_PREFETCH_INTERVAL = 5 * 60  # seconds between favourite-city refreshes
+WEATHER_FAVORITES = 3  # cities prefetched per user
+weather_cache = WeatherCache(os.path.join(APP_DATA_DIR, "cities.json"))
+APP_INDEX_INTERVAL = 30  # seconds between checks of $PATH and application directories
+# Never launched through "open X", even from a .desktop entry; shutdown and restart have their own confirm step
+BLOCKED_EXECUTABLES = frozenset((
+    "poweroff", "reboot", "shutdown", "halt", "systemctl", "loginctl", "init", "telinit", "kill", "killall",
+    "pkill", "rm", "rmdir", "dd", "mkfs", "shred", "wipefs", "fdisk", "parted", "sudo", "su", "doas", "pkexec",
+))
+app_index = ApplicationIndex()
+HISTORY_INDEX_DIMS = 4096  # hashed n-gram buckets (at most 65536, columns are stored as uint16)
+HISTORY_INDEX_BATCH = 20000  # rows vectorised per sync step
+HISTORY_INDEX_SEGMENTS = 16  # saved segments before save() merges them into one
+HISTORY_INDEX_TAIL = 65536  # rows searched without the column-major copy before it is rebuilt
+HISTORY_TOP_K = 3
+HISTORY_RECALL_MAX_HITS = 200  # widest search a recall makes while skipping earlier recall turns
+HISTORY_MIN_SCORE = 0.2  # cosine similarity below this is not worth reading out
+HISTORY_STOPWORDS = frozenset(
+    "a an and are about ask asked did do does for i in is it me my of on say said the to was what when you".split())
+RECALL_PHRASES = (
+    "what did i ask about", "what did i say about", "what did you say about", "what did you tell me about",
+    "search my history for", "remind me what",
+)
+history_index = HistoryIndex(os.path.join(APP_DATA_DIR, "history_index"))
+INTENT_KEYWORDS = (
+    "hello", "holiday", "holidays", "search", "google", "chrome", "wikipedia", "define", "explain",
+    "meaning", "computer", "restart", "reboot", "shutdown", "confirm", "weather", "forecast",
+    "headlines", "convert",
+)
+# classify_intent()'s triggers; it matches them as bare substrings ("hi" in "chicago"), the corrector as whole words
+INTENT_PHRASES = RECALL_PHRASES + (
+    "hello", "hi", "current local time", "date", "hey assistant", "bot", "can you hear me", "hey",
+    "holiday", "holidays", "time in", "time at", "world time", "time zones", "open", "search google",
+    "search web", "search chrome", "wikipedia", "what is", "who is", "tell me about", "define",
+    "what does mean", "explain the word", "lock computer", "lock pc", "restart computer",
+    "reboot computer", "shutdown computer", "turn off computer", "weather", "forecast", "news",
+    "headlines", "convert", "change", "to", "exit", "quit", "stop",
+)
+command_corrector = CommandCorrector()
+INTENT_WORKERS = 16
+DEFAULT_INTENT_TIMEOUT = 3.0  # seconds
+INTENT_TIMEOUTS = {
+    'news': 8.0, 'weather': 8.0, 'wikipedia': 8.0, 'define': 6.0, 'open': 5.0,
+    'web_search': 5.0, 'holidays': 5.0, 'lock': 5.0, 'restart': 5.0, 'shutdown': 5.0,
+    'recall': 5.0,
+}
+INTENT_TIMEOUT_MESSAGE = "Sorry, that is taking too long. Please try again in a moment."
+INTENT_ERROR_MESSAGE = "Sorry, something went wrong with that request."
+REMOTE_DENIED_MESSAGE = "Sorry, that command only works on the computer running the assistant."
+USAGE_FLUSH_ROWS = 200  # analytics rows buffered before a write
+USAGE_FLUSH_INTERVAL = 5.0  # seconds between background writes, so a quiet session still reaches the database
+usage_recorder = UsageRecorder()
+intent_runner = IntentRunner()
+MEMORY_TRACE_FRAMES = 5  # traceback depth kept by tracemalloc
+MEMORY_REPORT_TOP = 15  # allocation sites listed per comparison
+MEMORY_TREND_WINDOW = 5  # consecutive increases before a metric is flagged
+memory_monitor = MemoryMonitor(os.path.join(APP_DATA_DIR, "diagnostics"))
+wikipedia.set_lang("en")
 db_manager = DatabaseManager('user.db')
 DARK_THEME = {
     'bg': '#121212',  # Dark background
@@ -308,15 +2237,16 @@ def configure_window():
 
     # Function: setup_main_screen() (Main screen)
 def setup_main_screen():
-    clear_window()
-    global window, current_state
+    global current_state
     current_state = "main"
-    configure_window()
-
     window.title("Voice Assistant - Main Menu")
+    page_manager.show("main", build_main_screen)
 
+
+    # Function: build_main_screen()
+def build_main_screen(page):
     # Main container frame
-    main_frame = tk.Frame(window, bg=DARK_THEME['bg'])
+    main_frame = tk.Frame(page, bg=DARK_THEME['bg'])
     main_frame.pack(expand=True, fill=tk.BOTH, padx=50, pady=50)
 
     # Title label 
@@ -367,37 +2297,80 @@ def setup_main_screen():
     # Function: continue_without_account() (Guest mode)
 def continue_without_account():
     try:
-        clear_window()
-        configure_window()
+        page_manager.show("guest", build_guest_page)
 
-        # Main frame
-        main_frame = tk.Frame(window, bg=DARK_THEME['bg'])
-        main_frame.pack(fill=tk.BOTH, expand=True, padx=20, pady=20)
+    except Exception as e:
+        print(f"Fatal error in guest mode: {e}")
+        messagebox.showerror("Error", "Failed to initialize guest mode")
+        setup_main_screen()
 
-        # Conversation area with scrollbar
-        conv_frame = tk.Frame(main_frame, bg=DARK_THEME['bg'])
-        conv_frame.pack(fill=tk.BOTH, expand=True)
 
-        conversation_area = tk.Text(
-            conv_frame,
-            bg=DARK_THEME['text_bg'],
-            fg=DARK_THEME['text_fg'],
-            insertbackground=DARK_THEME['fg'],
-            wrap=tk.WORD,
-            font=('Arial', 10)
-        )
-        scrollbar = tk.Scrollbar(conv_frame, command=conversation_area.yview)
-        conversation_area.config(yscrollcommand=scrollbar.set)
-        
-        # Configure tags for coloring
-        conversation_area.tag_config('user', foreground=DARK_THEME['user_text'])  # Turquoise
-        conversation_area.tag_config('bot', foreground=DARK_THEME['bot_text'])    # Light gray
-        conversation_area.tag_config('system', foreground=DARK_THEME['accent'])   # Purple accent
-        
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-        conversation_area.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+    # Function: build_guest_page()
+def build_guest_page(page):
+    # Main frame
+    main_frame = tk.Frame(page, bg=DARK_THEME['bg'])
+    main_frame.pack(fill=tk.BOTH, expand=True, padx=20, pady=20)
 
-        # Welcome message
+    # Listening indicator, kept outside the transcript
+    status_label = DarkLabel(main_frame, text="", anchor='w')
+    status_label.config(fg=DARK_THEME['accent'])
+    status_label.pack(fill=tk.X)
+
+    # Conversation area with scrollbar
+    conv_frame = tk.Frame(main_frame, bg=DARK_THEME['bg'])
+    conv_frame.pack(fill=tk.BOTH, expand=True)
+
+    conversation_area = tk.Text(
+        conv_frame,
+        bg=DARK_THEME['text_bg'],
+        fg=DARK_THEME['text_fg'],
+        insertbackground=DARK_THEME['fg'],
+        wrap=tk.WORD,
+        font=('Arial', 10)
+    )
+    scrollbar = tk.Scrollbar(conv_frame, command=conversation_area.yview)
+    conversation_area.config(yscrollcommand=scrollbar.set)
+    
+    # Configure tags for coloring
+    conversation_area.tag_config('user', foreground=DARK_THEME['user_text'])  # Turquoise
+    conversation_area.tag_config('bot', foreground=DARK_THEME['bot_text'])    # Light gray
+    conversation_area.tag_config('system', foreground=DARK_THEME['accent'])   # Purple accent
+    
+    scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+    conversation_area.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+    transcript = ConversationTranscript(conversation_area, status_label)
+
+    # Typed commands go through the same dispatcher as spoken ones
+    create_command_input(main_frame, transcript).pack(fill=tk.X, pady=(10, 0))
+
+    # Control buttons
+    button_frame = tk.Frame(main_frame, bg=DARK_THEME['bg'])
+    button_frame.pack(fill=tk.X, pady=10)
+
+    # Left-aligned Main Menu
+    DarkButton(button_frame, 
+            text="Main Menu",
+            command=setup_main_screen
+            ).pack(side=tk.LEFT, padx=5)
+
+    # Centered Sign Up/Sign In container
+    center_buttons = tk.Frame(button_frame, bg=DARK_THEME['bg'])
+    center_buttons.pack(side=tk.LEFT, expand=True)
+
+    DarkButton(center_buttons, 
+            text="Sign Up", 
+            command=sign_up
+            ).pack(side=tk.LEFT, padx=20)
+
+    DarkButton(center_buttons, 
+            text="Sign In", 
+            command=sign_in
+            ).pack(side=tk.LEFT, padx=20)
+
+    def refresh():
+        # Guest sessions always start with a fresh transcript
+        transcript.clear()
         conversation_area.insert(tk.END, "Voice Assistant - Guest Mode\n\n", 'system')
         
         # Initialize speech engine safely
@@ -409,45 +2382,28 @@ def continue_without_account():
             conversation_area.insert(tk.END, "Speech functions unavailable\n", 'system')
 
         # Start listening thread safely
-        global assistant_stop_event
         try:
-            assistant_stop_event = listen_and_respond(conversation_area)
+            listen_and_respond(transcript)
         except Exception as e:
             print(f"Listener error: {e}")
             conversation_area.insert(tk.END, "Could not start voice listener\n", 'system')
 
-        # Control buttons
-        button_frame = tk.Frame(main_frame, bg=DARK_THEME['bg'])
-        button_frame.pack(fill=tk.X, pady=10)
-
-        # Left-aligned Main Menu
-        DarkButton(button_frame, 
-                text="Main Menu",
-                command=setup_main_screen
-                ).pack(side=tk.LEFT, padx=5)
-
-        # Centered Sign Up/Sign In container
-        center_buttons = tk.Frame(button_frame, bg=DARK_THEME['bg'])
-        center_buttons.pack(side=tk.LEFT, expand=True)
+    return refresh
 
-        DarkButton(center_buttons, 
-                text="Sign Up", 
-                command=sign_up
-                ).pack(side=tk.LEFT, padx=20)
 
-        DarkButton(center_buttons, 
-                text="Sign In", 
-                command=sign_in
-                ).pack(side=tk.LEFT, padx=20)
+    # Function: sign_up() (Sign up form)
+def sign_up():
+    try:
+        page_manager.show("sign_up", build_sign_up_page)
 
     except Exception as e:
-        print(f"Fatal error in guest mode: {e}")
-        messagebox.showerror("Error", "Failed to initialize guest mode")
+        print(f"Error initializing signup screen: {e}")
+        messagebox.showerror("Error", "Failed to initialize signup form")
         setup_main_screen()
 
 
-    # Function: sign_up() (Sign up form)
-def sign_up():
+    # Function: build_sign_up_page()
+def build_sign_up_page(page):
     def create_account_if_valid():
         # Get and clean input values
         name = name_entry.get().strip()
@@ -456,15 +2412,6 @@ def sign_up():
         password = password_entry.get().strip()
         confirm_password = confirm_entry.get().strip()
 
-        def is_valid_name(name_str):
-            """Check if name contains only letters, spaces or hyphens"""
-            return all(c.isalpha() or c in (' ', '-') for c in name_str)
-
-        def capitalize_name(name_str):
-            """Capitalize first letter of each name part (including after hyphens)"""
-            return ' '.join(word.capitalize() for part in name_str.split() 
-                          for word in part.split('-')).replace('- ', '-')
-
         # Validation checks
         if not all([name, last_name, email, password, confirm_password]):
             messagebox.showerror("Error", "Please fill in all fields")
@@ -474,7 +2421,7 @@ def sign_up():
             messagebox.showerror("Error", "Name and Last name should contain only letters, spaces or hyphens")
             return
             
-        if not re.match(r'^[\w\.-]+@[\w\.-]+\.\w+$', email):
+        if not EMAIL_PATTERN.match(email):
             messagebox.showerror("Error", "Please enter a valid email address")
             return
             
@@ -513,81 +2460,80 @@ def sign_up():
         except Exception as e:
             messagebox.showerror("Error", f"An unexpected error occurred: {str(e)}")
 
-    try:
-        clear_window()
-        configure_window()
+    # Create a frame for better layout control
+    signup_frame = tk.Frame(page, bg=DARK_THEME['bg'])
+    signup_frame.place(relx=0.5, rely=0.5, anchor=tk.CENTER)
 
-        # Create a frame for better layout control
-        signup_frame = tk.Frame(window, bg=DARK_THEME['bg'])
-        signup_frame.place(relx=0.5, rely=0.5, anchor=tk.CENTER)
-
-        # Title
-        DarkLabel(signup_frame, 
-                 text="CREATE ACCOUNT", 
-                 font=("Arial", 20, "bold")
-                 ).grid(row=0, column=0, columnspan=3, pady=(0, 20))
-
-        # Form fields
-        fields = [
-            ("Name:", "name_entry"),
-            ("Last Name:", "last_entry"),
-            ("Email:", "email_entry"),
-            ("Password:", "password_entry"),
-            ("Confirm Password:", "confirm_entry")
-        ]
+    # Title
+    DarkLabel(signup_frame, 
+             text="CREATE ACCOUNT", 
+             font=("Arial", 20, "bold")
+             ).grid(row=0, column=0, columnspan=3, pady=(0, 20))
+
+    # Form fields
+    fields = [
+        ("Name:", "name_entry"),
+        ("Last Name:", "last_entry"),
+        ("Email:", "email_entry"),
+        ("Password:", "password_entry"),
+        ("Confirm Password:", "confirm_entry")
+    ]
 
-        entries = {}
-        for i, (label_text, entry_name) in enumerate(fields, start=1):
-            DarkLabel(signup_frame, text=label_text).grid(row=i, column=0, sticky=tk.E, pady=5)
-            
-            # Create entry frame to hold both entry and toggle button
-            entry_frame = tk.Frame(signup_frame, bg=DARK_THEME['bg'])
-            entry_frame.grid(row=i, column=1, pady=5, sticky='ew')
-            
-            entry = DarkEntry(entry_frame, width=25)
-            entry.pack(side=tk.LEFT, fill=tk.X, expand=True)
-            entries[entry_name] = entry
-            
-            if entry_name in ["password_entry", "confirm_entry"]:
-                entry.config(show="•")  # Set to show bullets by default
-                toggle_btn = create_password_toggle(entry_frame, entry)
-                toggle_btn.pack(side=tk.LEFT)
-
-        # Store references to entry widgets
-        global name_entry, last_entry, email_entry, password_entry, confirm_entry
-        name_entry = entries["name_entry"]
-        last_entry = entries["last_entry"]
-        email_entry = entries["email_entry"]
-        password_entry = entries["password_entry"]
-        confirm_entry = entries["confirm_entry"]
-
-        # Buttons
-        button_frame = tk.Frame(signup_frame, bg=DARK_THEME['bg'])
-        button_frame.grid(row=len(fields)+1, column=0, columnspan=3, pady=20)
+    entries = {}
+    for i, (label_text, entry_name) in enumerate(fields, start=1):
+        DarkLabel(signup_frame, text=label_text).grid(row=i, column=0, sticky=tk.E, pady=5)
+        
+        # Create entry frame to hold both entry and toggle button
+        entry_frame = tk.Frame(signup_frame, bg=DARK_THEME['bg'])
+        entry_frame.grid(row=i, column=1, pady=5, sticky='ew')
+        
+        entry = DarkEntry(entry_frame, width=25)
+        entry.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        entries[entry_name] = entry
+        
+        if entry_name in ["password_entry", "confirm_entry"]:
+            entry.config(show="•")  # Set to show bullets by default
+            toggle_btn = create_password_toggle(entry_frame, entry)
+            toggle_btn.pack(side=tk.LEFT)
+
+    # Store references to entry widgets
+    global name_entry, last_entry, email_entry, password_entry, confirm_entry
+    name_entry = entries["name_entry"]
+    last_entry = entries["last_entry"]
+    email_entry = entries["email_entry"]
+    password_entry = entries["password_entry"]
+    confirm_entry = entries["confirm_entry"]
 
-        DarkButton(button_frame, 
-                  text="Create Account", 
-                  command=create_account_if_valid
-                  ).pack(side=tk.LEFT, padx=10)
+    # Buttons
+    button_frame = tk.Frame(signup_frame, bg=DARK_THEME['bg'])
+    button_frame.grid(row=len(fields)+1, column=0, columnspan=3, pady=20)
 
-        DarkButton(button_frame, 
-                  text="Main Menu", 
-                  command=setup_main_screen
-                  ).pack(side=tk.LEFT, padx=10)
+    DarkButton(button_frame, 
+              text="Create Account", 
+              command=create_account_if_valid
+              ).pack(side=tk.LEFT, padx=10)
 
-    except Exception as e:
-        print(f"Error initializing signup screen: {e}")
-        messagebox.showerror("Error", "Failed to initialize signup form")
-        setup_main_screen()
+    DarkButton(button_frame, 
+              text="Main Menu", 
+              command=setup_main_screen
+              ).pack(side=tk.LEFT, padx=10)
+
+    def refresh():
+        for entry in entries.values():
+            entry.delete(0, tk.END)
+
+    return refresh
 
 
     # Function: sign_in() (Sign in form)
 def sign_in():
-    clear_window()
-    configure_window()
+    page_manager.show("sign_in", build_sign_in_page)
 
+
+    # Function: build_sign_in_page()
+def build_sign_in_page(page):
     # Create a frame for better layout control
-    login_frame = tk.Frame(window, bg=DARK_THEME['bg'])
+    login_frame = tk.Frame(page, bg=DARK_THEME['bg'])
     login_frame.place(relx=0.5, rely=0.5, anchor=tk.CENTER)
 
     # Title
@@ -632,6 +2578,12 @@ def sign_in():
               command=setup_main_screen
               ).pack(side=tk.LEFT, padx=10)
 
+    def refresh():
+        email_entry.delete(0, tk.END)
+        password_entry.delete(0, tk.END)
+
+    return refresh
+
 
     # Function: login()
 def login(email, password):
@@ -639,23 +2591,21 @@ def login(email, password):
         messagebox.showerror("Error", "Please enter both email and password")
         return
         
-    user = get_user_from_database(email)
-    if not user:
+    profile = UserProfile.load(email)
+    if not profile:
         messagebox.showerror("Error", "User not found")
         return
         
     try:
-        ph.verify(user[4], password)
+        ph.verify(profile.password_hash, password)
         global current_user, current_user_email
-        current_user = user
+        current_user = profile
         current_user_email = email
-        
-        db_manager.execute("SELECT voice_speed FROM users WHERE email=?", (email,))
-        speed_setting = db_manager.fetchone()
-        if speed_setting:
-            speed = speed_setting[0]
-            engine.setProperty('rate', 200 if speed == "Fast" else 100 if speed == "Slow" else 150)
+        engine.setProperty('rate', profile.speech_rate)
        
+        weather_cache.prefetch_now()
+        if history_index.available():
+            threading.Thread(target=history_index.sync, daemon=True).start()  # warm up for recall
         print(f"\n=== LOGIN SUCCESSFUL ===")      # Debug prints
         print(f"User: {email}")
         logged_in()
@@ -665,33 +2615,31 @@ def login(email, password):
 
     # Function: logged_in() (Logged in user page)
 def logged_in():
-    global current_state, assistant_stop_event
-    
-    # Stop any existing assistant
-    if assistant_stop_event:
-        assistant_stop_event.set()
-    
-    # Create a new event for the new assistant
-    assistant_stop_event = threading.Event()
-    
+    global current_state
     current_state = "logged_in"
-    clear_window()
-    configure_window()
+    page_manager.show("logged_in", build_logged_in_page)
 
-    user_name = f"{current_user[1]} {current_user[2]}"
 
+    # Function: build_logged_in_page()
+def build_logged_in_page(page):
     # Main conversation frame
-    main_frame = tk.Frame(window, bg=DARK_THEME['bg'])
+    main_frame = tk.Frame(page, bg=DARK_THEME['bg'])
     main_frame.pack(fill=tk.BOTH, expand=True, padx=20, pady=20)
 
     # Header with user info
     header_frame = tk.Frame(main_frame, bg=DARK_THEME['bg'])
     header_frame.pack(fill=tk.X, pady=10)
     
-    DarkLabel(header_frame, 
-             text=f"Voice Assistant - {user_name}", 
+    header_label = DarkLabel(header_frame, 
+             text="Voice Assistant", 
              font=("Arial", 14, "bold")
-             ).pack(side=tk.LEFT)
+             )
+    header_label.pack(side=tk.LEFT)
+
+    # Listening indicator, kept outside the transcript
+    status_label = DarkLabel(header_frame, text="")
+    status_label.config(fg=DARK_THEME['accent'])
+    status_label.pack(side=tk.RIGHT)
     
     # Conversation area
     conv_frame = tk.Frame(main_frame, bg=DARK_THEME['bg'])
@@ -711,14 +2659,15 @@ def logged_in():
     
     conversation_area.config(yscrollcommand=scrollbar.set)
     
-    # Welcome message
-    welcome_msg = f"Voice Assistant initialized.\n\n"
-    conversation_area.insert(tk.END, welcome_msg, 'system')
+    transcript = ConversationTranscript(conversation_area, status_label)
     
     # Control buttons
     button_frame = tk.Frame(main_frame, bg=DARK_THEME['bg'])
     button_frame.pack(fill=tk.X, pady=10, side=tk.BOTTOM)
 
+    # Typed commands go through the same dispatcher as spoken ones
+    create_command_input(main_frame, transcript).pack(fill=tk.X, pady=(10, 0), side=tk.BOTTOM)
+
     # Left-aligned Log Out
     DarkButton(button_frame, 
             text="LOG OUT", 
@@ -744,18 +2693,36 @@ def logged_in():
             text="About Me", 
             command=about_me
             ).pack(side=tk.RIGHT, padx=5)
+
+    shown_email = None
+
+    def refresh():
+        nonlocal shown_email
+
+        header_label.config(text=f"Voice Assistant - {current_user.full_name}")
+
+        # Keep the transcript when coming back from another page of the same session
+        if current_user_email != shown_email:
+            shown_email = current_user_email
+            transcript.clear()
+            welcome_msg = f"Voice Assistant initialized.\n\n"
+            conversation_area.insert(tk.END, welcome_msg, 'system')
     
-    wishMe()
-    window.after(1500, lambda: speak("Voice Assistant initialized."))
+        wishMe()
+        window.after(1500, lambda: speak("Voice Assistant initialized."))
     
-    assistant_stop_event = listen_and_respond(conversation_area)
+        listen_and_respond(transcript)
+
+    return refresh
 
 
     # Function: show_settings() (Settings for the logged in user)
 def show_settings():
-    clear_window()
-    configure_window()
+    page_manager.show("settings", build_settings_page)
 
+
+    # Function: build_settings_page()
+def build_settings_page(page):
     def ask_for_password(stored_hashed_password):
         password_window = tk.Toplevel(window)
         password_window.title("Verify Password")
@@ -851,7 +2818,7 @@ def show_settings():
                   ).pack(side=tk.LEFT, padx=5)
 
     # Main settings window content 
-    main_frame = tk.Frame(window, bg=DARK_THEME['bg'])
+    main_frame = tk.Frame(page, bg=DARK_THEME['bg'])
     main_frame.pack(fill=tk.BOTH, expand=True, padx=20, pady=20)
 
     # Centered Title
@@ -860,110 +2827,138 @@ def show_settings():
              font=("Arial", 16, "bold")
              ).pack(pady=(0, 20), anchor='center')
 
-    user_info = get_current_user_info()
-    if user_info:
-        current_name, last_name, stored_hashed_password = user_info
-        full_name = f"{current_name} {last_name}" if last_name else current_name
+    # Profile and voice sections are only shown when the user is found
+    details_frame = tk.Frame(main_frame, bg=DARK_THEME['bg'])
+    profile = {'password': None}
 
-        # User Profile Section - Centered
-        profile_frame = tk.Frame(main_frame, bg=DARK_THEME['bg'])
-        profile_frame.pack(fill=tk.X, pady=10)
+    # User Profile Section - Centered
+    profile_frame = tk.Frame(details_frame, bg=DARK_THEME['bg'])
+    profile_frame.pack(fill=tk.X, pady=10)
 
-        DarkLabel(profile_frame, 
-                 text="👤 User Profile", 
-                 font=("Arial", 12, "bold")
-                 ).pack(anchor='center', pady=5)
+    DarkLabel(profile_frame, 
+             text="👤 User Profile", 
+             font=("Arial", 12, "bold")
+             ).pack(anchor='center', pady=5)
 
-        # Centered Info Grid
-        info_frame = tk.Frame(profile_frame, bg=DARK_THEME['bg'])
-        info_frame.pack(anchor='center', pady=10)
+    # Centered Info Grid
+    info_frame = tk.Frame(profile_frame, bg=DARK_THEME['bg'])
+    info_frame.pack(anchor='center', pady=10)
 
-        DarkLabel(info_frame, text="Name:").grid(row=0, column=0, padx=5, sticky='e')
-        DarkLabel(info_frame, text=full_name).grid(row=0, column=1, padx=5, sticky='w')
+    DarkLabel(info_frame, text="Name:").grid(row=0, column=0, padx=5, sticky='e')
+    name_label = DarkLabel(info_frame, text="")
+    name_label.grid(row=0, column=1, padx=5, sticky='w')
 
-        DarkLabel(info_frame, text="Email:").grid(row=1, column=0, padx=5, pady=5, sticky='e')
-        DarkLabel(info_frame, text=current_user_email).grid(row=1, column=1, padx=5, sticky='w')
+    DarkLabel(info_frame, text="Email:").grid(row=1, column=0, padx=5, pady=5, sticky='e')
+    email_label = DarkLabel(info_frame, text="")
+    email_label.grid(row=1, column=1, padx=5, sticky='w')
 
-        # Centered Change Name Button
-        DarkButton(profile_frame, 
-                  text="✏️ Change Name", 
-                  command=lambda: ask_for_password(stored_hashed_password)
-                  ).pack(pady=10, anchor='center')
+    # Centered Change Name Button
+    DarkButton(profile_frame, 
+              text="✏️ Change Name", 
+              command=lambda: ask_for_password(profile['password'])
+              ).pack(pady=10, anchor='center')
 
-        # Spacer between sections
-        tk.Frame(main_frame, height=20, bg=DARK_THEME['bg']).pack()
+    # Spacer between sections
+    tk.Frame(details_frame, height=20, bg=DARK_THEME['bg']).pack()
 
-        # Voice Settings Section - Centered
-        voice_frame = tk.Frame(main_frame, bg=DARK_THEME['bg'])
-        voice_frame.pack(fill=tk.X, pady=10)
+    # Voice Settings Section - Centered
+    voice_frame = tk.Frame(details_frame, bg=DARK_THEME['bg'])
+    voice_frame.pack(fill=tk.X, pady=10)
 
-        DarkLabel(voice_frame, 
-                 text="🔊 Voice Settings", 
-                 font=("Arial", 12, "bold")
-                 ).pack(anchor='center', pady=5)
+    DarkLabel(voice_frame, 
+             text="🔊 Voice Settings", 
+             font=("Arial", 12, "bold")
+             ).pack(anchor='center', pady=5)
 
-        # Centered Speed Controls
-        speed_frame = tk.Frame(voice_frame, bg=DARK_THEME['bg'])
-        speed_frame.pack(anchor='center', pady=10)
+    # Centered Speed Controls
+    speed_frame = tk.Frame(voice_frame, bg=DARK_THEME['bg'])
+    speed_frame.pack(anchor='center', pady=10)
 
-        DarkLabel(speed_frame, text="Voice Speed:").pack(side=tk.LEFT, padx=5)
-        
-        speed_combobox = Combobox(speed_frame, 
-                                values=["Fast", "Normal", "Slow"], 
-                                state="readonly")
-        speed_combobox.pack(side=tk.LEFT, padx=5)
-        
-        # Set current speed 
-        db_manager.execute("SELECT voice_speed FROM users WHERE email=?", (current_user_email,))
-        saved_speed = db_manager.fetchone()
-        current_speed = saved_speed[0] if saved_speed else "Normal"
-        speed_combobox.set(current_speed)
-        
-        def save_speed():
-            new_speed = speed_combobox.get()
-            db_manager.execute("""
-                UPDATE users 
-                SET voice_speed=? 
-                WHERE email=?
-            """, (new_speed, current_user_email))
-            db_manager.commit()
-            
-            engine.setProperty('rate', 200 if new_speed == "Fast" else 100 if new_speed == "Slow" else 150)
-            messagebox.showinfo("Saved", "Voice speed updated!")
+    DarkLabel(speed_frame, text="Voice Speed:").pack(side=tk.LEFT, padx=5)
+    
+    speed_combobox = Combobox(speed_frame, 
+                            values=["Fast", "Normal", "Slow"], 
+                            state="readonly")
+    speed_combobox.pack(side=tk.LEFT, padx=5)
+    
+    def save_speed():
+        current_user.update(voice_speed=speed_combobox.get())
         
-        DarkButton(speed_frame, 
-                  text="💾 Save", 
-                  command=save_speed
-                  ).pack(side=tk.LEFT, padx=5)
+        old_rate = engine.getProperty('rate')
+        engine.setProperty('rate', current_user.speech_rate)
+        if engine.getProperty('rate') != old_rate:
+            phrase_cache.invalidate(old_rate)
+        messagebox.showinfo("Saved", "Voice speed updated!")
+    
+    DarkButton(speed_frame, 
+              text="💾 Save", 
+              command=save_speed
+              ).pack(side=tk.LEFT, padx=5)
 
     # Centered Back Button
-    DarkButton(main_frame, 
+    back_button = DarkButton(main_frame, 
               text="🔙 Back to Assistant", 
               command=logged_in
-              ).pack(pady=100, anchor='center')
+              )
+    back_button.pack(pady=100, anchor='center')
+
+    def refresh():
+        if current_user is None:
+            details_frame.pack_forget()
+            return
+
+        profile['password'] = current_user.password_hash
+        name_label.config(text=current_user.full_name)
+        email_label.config(text=current_user.email)
+        speed_combobox.set(current_user.voice_speed)
+
+        details_frame.pack(fill=tk.X, before=back_button)
+
+    return refresh
 
 
     # Function: show_history() (Conversation history for logged in users)
 def show_history():
-    # Clear window safely
-    try:
-        if window.winfo_exists():
-            for widget in window.winfo_children():
-                widget.destroy()
-    except:
-        pass
-    
-    # Create basic UI first
-    main_frame = tk.Frame(window, bg=DARK_THEME['bg'])
+    page_manager.show("history", build_history_page)
+
+
+    # Function: build_history_page()
+def build_history_page(page):
+    main_frame = tk.Frame(page, bg=DARK_THEME['bg'])
     main_frame.pack(fill=tk.BOTH, expand=True)
     
     loading_label = DarkLabel(main_frame, 
                             text="Loading History...", 
                             font=("Arial", 14))
     loading_label.pack(pady=50)
+
+    # Create main container
+    container = tk.Frame(main_frame, bg=DARK_THEME['bg'])
+    container.pack(fill=tk.BOTH, expand=True)
+    
+    # History display area
+    text_area = DarkText(container)
+    scrollbar = DarkScrollbar(container, command=text_area.yview)
+    text_area.config(yscrollcommand=scrollbar.set)
+    
+    text_area.tag_config("timestamp", foreground="#aaaaaa")
+    text_area.tag_config("user", foreground=DARK_THEME['user_text'])
+    text_area.tag_config("bot", foreground=DARK_THEME['accent'])
+    
+    scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+    text_area.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+    # Bottom frame for retry and back buttons
+    bottom_frame = tk.Frame(main_frame, bg=DARK_THEME['bg'])
+    bottom_frame.pack(side=tk.BOTTOM, fill=tk.X, pady=10)
+
+    retry_button = DarkButton(bottom_frame, text="Retry", command=show_history)
     
-    # Force UI update before any database ops
-    window.update_idletasks()
+    # Centered back button
+    DarkButton(bottom_frame, 
+             text="Back", 
+             command=logged_in,
+             width=20).pack(anchor='center')
     
     def safe_history_load():
         try:
@@ -975,7 +2970,8 @@ def show_history():
             for attempt in range(3):
                 try:
                     cursor = db_manager.execute(
-                        "SELECT timestamp, speaker, message FROM conversations WHERE user_email = ? ORDER BY timestamp DESC",
+                        "SELECT timestamp, speaker, message FROM conversations "
+                        "WHERE user_id = (SELECT id FROM users WHERE email = ?) ORDER BY timestamp DESC, id DESC",
                         (current_user_email,)
                     )
                     conversations = cursor.fetchall()
@@ -985,35 +2981,22 @@ def show_history():
                     time.sleep(0.1)
             
             # 3. Build UI in main thread
-            window.after(0, lambda: build_history_ui(conversations))
+            gui_queue.post(build_history_ui, conversations)
             
         except Exception as e:
-            window.after(0, lambda: show_error(str(e)))
+            gui_queue.post(show_error, str(e))
     
     def build_history_ui(conversations):
         # Clear loading
-        for widget in main_frame.winfo_children():
-            widget.destroy()
-        
-        # Create main container
-        container = tk.Frame(main_frame, bg=DARK_THEME['bg'])
-        container.pack(fill=tk.BOTH, expand=True)
-        
-        # History display area
-        text_area = DarkText(container)
-        scrollbar = DarkScrollbar(container, command=text_area.yview)
-        text_area.config(yscrollcommand=scrollbar.set)
-        
-        text_area.tag_config("timestamp", foreground="#aaaaaa")
-        text_area.tag_config("user", foreground=DARK_THEME['user_text'])
-        text_area.tag_config("bot", foreground=DARK_THEME['accent'])
-        
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-        text_area.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        loading_label.pack_forget()
+        text_area.config(state=tk.NORMAL)
+        text_area.delete("1.0", tk.END)
         
         if conversations:
             text_area.insert(tk.END, "Conversation History:\n\n", "bot")
             for ts, speaker, msg in conversations:
+                ts = datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S')
+                speaker = SPEAKER_NAMES.get(speaker, "BOT")
                 text_area.insert(tk.END, f"{ts} - ", "timestamp")
                 text_area.insert(tk.END, f"{speaker}: ", "user" if speaker == "USER" else "bot")
                 text_area.insert(tk.END, f"{msg}\n\n")
@@ -1021,36 +3004,34 @@ def show_history():
             text_area.insert(tk.END, "No history found", "bot")
         
         text_area.config(state=tk.DISABLED)
-        
-        # Bottom frame for back button
-        bottom_frame = tk.Frame(main_frame, bg=DARK_THEME['bg'])
-        bottom_frame.pack(side=tk.BOTTOM, fill=tk.X, pady=10)
-        
-        # Centered back button
-        DarkButton(bottom_frame, 
-                 text="Back", 
-                 command=logged_in,
-                 width=20).pack(anchor='center')
     
     def show_error(msg):
-        for widget in main_frame.winfo_children():
-            widget.destroy()
-        
-        DarkLabel(main_frame, text=f"Error: {msg}", fg="red").pack(pady=10)
-        DarkButton(main_frame, text="Retry", command=show_history).pack(pady=5)
-        DarkButton(main_frame, text="Back", command=logged_in).pack(pady=5)
+        loading_label.config(text=f"Error: {msg}", fg="red")
+        retry_button.pack(pady=5)
+
+    def refresh():
+        loading_label.config(text="Loading History...", fg=DARK_THEME['fg'])
+        loading_label.pack(pady=50, before=container)
+        retry_button.pack_forget()
+        text_area.config(state=tk.NORMAL)
+        text_area.delete("1.0", tk.END)
+        text_area.config(state=tk.DISABLED)
     
-    # Start database thread
-    threading.Thread(target=safe_history_load, daemon=True).start()
+        # Start database thread
+        threading.Thread(target=safe_history_load, daemon=True).start()
+
+    return refresh
 
 
     # Function: about_me() (About me page)
 def about_me():
-    clear_window()
-    configure_window()
-    
+    page_manager.show("about", build_about_page)
+
+
+    # Function: build_about_page()
+def build_about_page(page):
     # Main frame with scrollbar
-    main_frame = tk.Frame(window, bg=DARK_THEME['bg'])
+    main_frame = tk.Frame(page, bg=DARK_THEME['bg'])
     main_frame.pack(fill=tk.BOTH, expand=True)
     
     # Create canvas and scrollbar
@@ -1202,7 +3183,7 @@ Technical Aspects:
         create_contact_row(org_link_frame, *link)
 
     # Centered Back Button
-    bottom_frame = tk.Frame(window, bg=DARK_THEME['bg'])
+    bottom_frame = tk.Frame(page, bg=DARK_THEME['bg'])
     bottom_frame.pack(side=tk.BOTTOM, fill=tk.X, pady=20)
 
     DarkButton(
@@ -1224,8 +3205,13 @@ def back_to_previous():
 
 # === Database Functions ===
 
+SPEAKER_CODES = {"USER": 0, "BOT": 1}
+SPEAKER_NAMES = {code: name for name, code in SPEAKER_CODES.items()}
+MIGRATION_BATCH_SIZE = 10000
+ANALYTICS_SLOW_MS = 1000  # turns at least this slow are counted as slow_turns
+
     # Function: initialize_database()
-def initialize_database():
+def initialize_database(progress=None):
     max_retries = 3
     retry_count = 0
     
@@ -1234,29 +3220,8 @@ def initialize_database():
             if not db_manager.ensure_connection():
                 raise sqlite3.Error("Could not establish database connection")
                 
-            # Create tables if they don't exist
-            db_manager.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT,
-                    last_name TEXT,
-                    email TEXT UNIQUE,
-                    password TEXT,
-                    voice_speed TEXT DEFAULT 'Normal'
-                )
-            """)
-            
-            db_manager.execute("""
-                CREATE TABLE IF NOT EXISTS conversations (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_email TEXT,
-                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    speaker TEXT,
-                    message TEXT,
-                    FOREIGN KEY(user_email) REFERENCES users(email)
-                )
-            """)
-            db_manager.commit()
+            # Bring the schema up to date
+            migrate_database(progress)
             return True
             
         except sqlite3.Error as e:
@@ -1267,62 +3232,830 @@ def initialize_database():
             time.sleep(1)
 
 
-    # Function: get_user_from_database()
-def get_user_from_database(email):
-    cursor = db_manager.execute("SELECT * FROM users WHERE email = ?", (email,))
-    return cursor.fetchone()
+    # Function: get_schema_version()
+def get_schema_version():
+    return db_manager.execute("PRAGMA user_version").fetchone()[0]
+
+
+    # Function: migrate_database()
+def migrate_database(progress=None):
+    """Apply every schema migration newer than the database's PRAGMA user_version"""
+    version = get_schema_version()
+
+    for target, migration in SCHEMA_MIGRATIONS:
+        if version >= target:
+            continue
+        report = migration(progress)
+        db_manager.execute(f"PRAGMA user_version = {target}")
+        version = target
+        if report:
+            print(f"Database migrated to version {target}: {report}")
+
+    return version
+
+
+    # Function: migrate_create_tables()
+def migrate_create_tables(progress=None):
+    """Version 1: the original users and conversations tables"""
+    db_manager.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT,
+            last_name TEXT,
+            email TEXT UNIQUE,
+            password TEXT,
+            voice_speed TEXT DEFAULT 'Normal'
+        )
+    """)
+    
+    db_manager.execute("""
+        CREATE TABLE IF NOT EXISTS conversations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_email TEXT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            speaker TEXT,
+            message TEXT,
+            FOREIGN KEY(user_email) REFERENCES users(email)
+        )
+    """)
+    db_manager.commit()
+
+
+    # Function: migrate_compact_conversations()
+def migrate_compact_conversations(progress=None, batch_size=MIGRATION_BATCH_SIZE):
+    """Version 2: integer user_id, speaker code and epoch timestamp for conversations"""
+    busiest = db_manager.execute(
+        "SELECT user_email FROM conversations GROUP BY user_email ORDER BY COUNT(*) DESC LIMIT 1"
+    ).fetchone()
+    size_before = get_database_used_bytes()
+    query_before = time_query(
+        "SELECT timestamp, speaker, message FROM conversations WHERE user_email = ? ORDER BY timestamp DESC",
+        busiest
+    ) if busiest else None
+
+    db_manager.execute("""
+        CREATE TABLE IF NOT EXISTS conversations_v2 (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+            timestamp INTEGER NOT NULL DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
+            speaker INTEGER NOT NULL,
+            message TEXT
+        )
+    """)
+
+    copy_query = """
+        INSERT INTO conversations_v2 (id, user_id, timestamp, speaker, message)
+        SELECT c.id,
+               u.id,
+               COALESCE(CAST(strftime('%s', c.timestamp) AS INTEGER), CAST(strftime('%s', 'now') AS INTEGER)),
+               CASE c.speaker WHEN 'USER' THEN 0 ELSE 1 END,
+               c.message
+        FROM conversations c LEFT JOIN users u ON u.email = c.user_email
+        WHERE c.id > ?
+        ORDER BY c.id
+        LIMIT ?
+    """
+    total = db_manager.execute("SELECT COUNT(*) FROM conversations").fetchone()[0]
+    copied, last_id = db_manager.execute("SELECT COUNT(*), COALESCE(MAX(id), 0) FROM conversations_v2").fetchone()
+
+    # Copy in short batches so other connections can keep writing in between
+    while True:
+        cursor = db_manager.execute(copy_query, (last_id, batch_size))
+        if cursor.rowcount <= 0:
+            break
+        copied += cursor.rowcount
+        last_id = db_manager.execute("SELECT MAX(id) FROM conversations_v2").fetchone()[0]
+        if progress:
+            progress(copied, total)
+
+    # Pick up rows written during the copy and swap tables in one transaction.
+    # The version is bumped here too so a crash can never re-run the copy.
+    with db_manager.transaction() as connection:
+        connection.execute(copy_query, (last_id, -1))
+        connection.execute("DROP TABLE conversations")
+        connection.execute("ALTER TABLE conversations_v2 RENAME TO conversations")
+        connection.execute("CREATE INDEX IF NOT EXISTS idx_conversations_user_time ON conversations(user_id, timestamp)")
+        connection.execute("PRAGMA user_version = 2")
+
+    if not total:
+        return None
+
+    report = f"{total} conversation rows, {size_before / 1024:.0f} KB -> {get_database_used_bytes() / 1024:.0f} KB used"
+    if busiest:
+        query_after = time_query(
+            "SELECT timestamp, speaker, message FROM conversations "
+            "WHERE user_id = (SELECT id FROM users WHERE email = ?) ORDER BY timestamp DESC",
+            busiest
+        )
+        report += f", history query {query_before:.2f} ms -> {query_after:.2f} ms"
+    return report
+
+
+    # Function: migrate_create_analytics()
+def migrate_create_analytics(progress=None):
+    """Version 3: per-turn intent, latency and outcome, with summaries kept current by a trigger"""
+    summary_columns = """
+            turns INTEGER NOT NULL DEFAULT 0,
+            failures INTEGER NOT NULL DEFAULT 0,
+            slow_turns INTEGER NOT NULL DEFAULT 0,
+            total_ms REAL NOT NULL DEFAULT 0,
+            max_ms REAL NOT NULL DEFAULT 0,
+            last_seen INTEGER"""
+    # Cancelled (superseded by a newer command) and denied turns are not failures of the handler
+    upsert_values = f"""1, NEW.outcome IN ('timeouts', 'errors'), NEW.latency_ms >= {ANALYTICS_SLOW_MS},
+                NEW.latency_ms, NEW.latency_ms, NEW.timestamp"""
+    upsert_update = """turns = turns + 1, failures = failures + excluded.failures,
+                slow_turns = slow_turns + excluded.slow_turns, total_ms = total_ms + excluded.total_ms,
+                max_ms = MAX(max_ms, excluded.max_ms), last_seen = MAX(last_seen, excluded.last_seen)"""
+
+    with db_manager.transaction() as connection:
+        connection.execute("""
+            CREATE TABLE IF NOT EXISTS turns (
+                id INTEGER PRIMARY KEY,
+                user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+                timestamp INTEGER NOT NULL,
+                intent TEXT NOT NULL,
+                latency_ms REAL NOT NULL,
+                outcome TEXT NOT NULL
+            )
+        """)
+        # Guests are summarised under user_id 0
+        connection.execute(f"CREATE TABLE IF NOT EXISTS usage_by_user (user_id INTEGER PRIMARY KEY, {summary_columns})")
+        connection.execute(f"CREATE TABLE IF NOT EXISTS usage_by_intent (intent TEXT PRIMARY KEY, {summary_columns}) WITHOUT ROWID")
+        connection.execute(f"CREATE TABLE IF NOT EXISTS usage_by_day (day TEXT PRIMARY KEY, {summary_columns}) WITHOUT ROWID")
+        connection.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS turns_update_usage AFTER INSERT ON turns BEGIN
+                INSERT INTO usage_by_user VALUES (COALESCE(NEW.user_id, 0), {upsert_values})
+                ON CONFLICT(user_id) DO UPDATE SET {upsert_update};
+                INSERT INTO usage_by_intent VALUES (NEW.intent, {upsert_values})
+                ON CONFLICT(intent) DO UPDATE SET {upsert_update};
+                INSERT INTO usage_by_day VALUES (date(NEW.timestamp, 'unixepoch', 'localtime'), {upsert_values})
+                ON CONFLICT(day) DO UPDATE SET {upsert_update};
+            END
+        """)
+        report_columns = """turns, failures, ROUND(100.0 * failures / turns, 1) AS failure_pct,
+                   ROUND(total_ms / turns, 1) AS avg_ms, ROUND(max_ms, 1) AS max_ms, slow_turns, last_seen"""
+        connection.execute(f"""
+            CREATE VIEW IF NOT EXISTS usage_report AS
+            SELECT 'user' AS scope, COALESCE(u.email, 'guest') AS name, {report_columns}
+            FROM usage_by_user s LEFT JOIN users u ON u.id = s.user_id
+            UNION ALL
+            SELECT 'intent', intent, {report_columns} FROM usage_by_intent
+            UNION ALL
+            SELECT 'day', day, {report_columns} FROM usage_by_day
+        """)
+        connection.execute("PRAGMA user_version = 3")
+
+
+SCHEMA_MIGRATIONS = [
+    (1, migrate_create_tables),
+    (2, migrate_compact_conversations),
+    (3, migrate_create_analytics),
+]
+
+
+    # Function: get_database_used_bytes()
+def get_database_used_bytes():
+    """Size of the pages currently holding data (excludes the free list)"""
+    page_size = db_manager.execute("PRAGMA page_size").fetchone()[0]
+    page_count = db_manager.execute("PRAGMA page_count").fetchone()[0]
+    free_pages = db_manager.execute("PRAGMA freelist_count").fetchone()[0]
+    return (page_count - free_pages) * page_size
+
+
+    # Function: time_query()
+def time_query(query, params=(), repeat=5):
+    """Average wall time of a query in milliseconds"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        db_manager.execute(query, params).fetchall()
+    return (time.perf_counter() - start) * 1000 / repeat
+
+
+    # Function: get_user_from_database()
+def get_user_from_database(email):
+    cursor = db_manager.execute("SELECT * FROM users WHERE email = ?", (email,))
+    return cursor.fetchone()
+
+
+    # Function: get_current_user_info()
+def get_current_user_info():
+    """(name, last_name, password hash) of the signed-in user, from the cached profile"""
+    if current_user is None:
+        return None
+    return current_user.name, current_user.last_name, current_user.password_hash
+
+
+    # Function: update_user_info()
+def update_user_info(new_name, new_last_name):
+    current_user.update(name=new_name, last_name=new_last_name)
+
+
+    # Function: is_valid_name()
+def is_valid_name(name_str):
+    """Check if name contains only letters, spaces or hyphens"""
+    return all(c.isalpha() or c in (' ', '-') for c in name_str)
+
+
+    # Function: capitalize_name()
+def capitalize_name(name_str):
+    """Capitalize first letter of each name part (including after hyphens)"""
+    return ' '.join(word.capitalize() for part in name_str.split() 
+                  for word in part.split('-')).replace('- ', '-')
+
+
+    # Function: log_conversation()
+def log_conversation(email, speaker, message):
+    try:
+        cursor = db_manager.execute(
+            "INSERT INTO conversations (user_id, timestamp, speaker, message) "
+            "VALUES ((SELECT id FROM users WHERE email = ?), ?, ?, ?)",
+            (email, int(time.time()), SPEAKER_CODES.get(speaker, SPEAKER_CODES["BOT"]), message.strip())
+        )
+        db_manager.commit()  
+        if cursor is not None:
+            history_index.add(cursor.lastrowid, email, message.strip())
+    except Exception as e:
+        print(f"Failed to log conversation: {e}")
+
+
+    # Function: log_conversations()
+def log_conversations(email, turns):
+    """Bulk version of log_conversation() for (speaker, message) pairs, in one transaction"""
+    now = int(time.time())
+    rows = [(email, now, SPEAKER_CODES.get(speaker, SPEAKER_CODES["BOT"]), message.strip())
+            for speaker, message in turns if message]
+    try:
+        db_manager.executemany(
+            "INSERT INTO conversations (user_id, timestamp, speaker, message) "
+            "VALUES ((SELECT id FROM users WHERE email = ?), ?, ?, ?)",
+            rows
+        )
+    except Exception as e:
+        print(f"Failed to log conversations: {e}")
+        return 0
+    return len(rows)
+
+
+# === Data Transfer Functions ===
+
+HISTORY_COLUMNS = ("user_email", "timestamp", "speaker", "message")
+HISTORY_FORMATS = {'.jsonl': 'jsonl', '.ndjson': 'jsonl', '.csv': 'csv', '.parquet': 'parquet'}
+TRANSFER_BATCH_SIZE = 5000
+USER_COLUMNS = ("name", "last_name", "email", "password")
+PROVISION_BATCH_SIZE = 500  # accounts hashed and inserted per transaction
+PROVISION_POOL_MIN = 64  # passwords in a batch before worker processes are worth starting
+EMAIL_PATTERN = re.compile(r'^[\w\.-]+@[\w\.-]+\.\w+$')
+
+    # Function: detect_history_format()
+def detect_history_format(path, fmt=None):
+    """Pick the history file format from an explicit name or the file extension"""
+    fmt = fmt.lower() if fmt else HISTORY_FORMATS.get(os.path.splitext(path)[1].lower())
+
+    if fmt not in ('jsonl', 'csv', 'parquet'):
+        raise ValueError(f"Unsupported history format for '{path}' (use .jsonl, .csv or .parquet)")
+    if fmt == 'parquet' and pyarrow is None:
+        raise ValueError("Parquet support requires the 'pyarrow' package")
+    return fmt
+
+
+    # Function: print_progress()
+def print_progress(label, done, total=None):
+    """Print a single-line progress counter for long running commands"""
+    if total:
+        print(f"\r{label}: {done}/{total} rows ({done * 100 // total}%)", end="", flush=True)
+    else:
+        print(f"\r{label}: {done} rows", end="", flush=True)
+
+
+    # Function: export_conversations()
+def export_conversations(path, fmt=None, user_email=None, batch_size=TRANSFER_BATCH_SIZE, progress=None):
+    """Stream conversation history into a JSONL, CSV or Parquet file"""
+    fmt = detect_history_format(path, fmt)
+    where = " WHERE c.user_id = (SELECT id FROM users WHERE email = ?)" if user_email else ""
+    params = (user_email,) if user_email else ()
+
+    total = db_manager.execute(f"SELECT COUNT(*) FROM conversations c{where}", params).fetchone()[0]
+    # Files keep the portable layout: email, UTC timestamp text and speaker name
+    batches = db_manager.iter_batches(
+        f"""SELECT u.email, datetime(c.timestamp, 'unixepoch'),
+                   CASE c.speaker WHEN {SPEAKER_CODES["USER"]} THEN 'USER' ELSE 'BOT' END, c.message
+            FROM conversations c LEFT JOIN users u ON u.id = c.user_id{where}
+            ORDER BY c.id""",
+        params,
+        batch_size
+    )
+
+    exported = 0
+    if fmt == 'parquet':
+        schema = pyarrow.schema([(column, pyarrow.string()) for column in HISTORY_COLUMNS])
+        with pq.ParquetWriter(path, schema) as writer:
+            for rows in batches:
+                columns = [pyarrow.array([None if v is None else str(v) for v in column], pyarrow.string())
+                           for column in zip(*rows)]
+                writer.write_table(pyarrow.Table.from_arrays(columns, schema=schema))
+                exported += len(rows)
+                if progress:
+                    progress(exported, total)
+        return exported
+
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        if fmt == 'csv':
+            writer = csv.writer(f)
+            writer.writerow(HISTORY_COLUMNS)
+
+        for rows in batches:
+            if fmt == 'csv':
+                writer.writerows(rows)
+            else:
+                f.writelines(json.dumps(dict(zip(HISTORY_COLUMNS, row)), ensure_ascii=False) + "\n"
+                             for row in rows)
+            exported += len(rows)
+            if progress:
+                progress(exported, total)
+
+    return exported
+
+
+    # Function: iter_history_file()
+def iter_history_file(path, fmt, batch_size=TRANSFER_BATCH_SIZE, errors=None):
+    """Yield batches of (user_email, timestamp, speaker, message) tuples from a history file
+
+    JSONL lines that are not JSON objects (or not UTF-8) are skipped and, when errors is a list,
+    appended to it as (line number, reason), so one bad line does not end the import.
+    """
+    if fmt == 'parquet':
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size, columns=list(HISTORY_COLUMNS)):
+            yield list(zip(*(batch.column(i).to_pylist() for i in range(batch.num_columns))))
+        return
+
+    def json_records(f):
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)  # bytes, so a line that is not UTF-8 fails here too
+            except ValueError as e:
+                reason = f"invalid JSON: {e}"
+            else:
+                if isinstance(record, dict):
+                    yield record
+                    continue
+                reason = "record must be a JSON object"
+            if errors is not None:
+                errors.append((number, reason))
+
+    with (open(path, newline='', encoding='utf-8') if fmt == 'csv' else open(path, 'rb')) as f:
+        records = csv.DictReader(f) if fmt == 'csv' else json_records(f)
+
+        while True:
+            batch = [tuple(record.get(column) or None for column in HISTORY_COLUMNS)
+                     for record in itertools.islice(records, batch_size)]
+            if not batch:
+                break
+            yield batch
+
+
+    # Function: import_conversations()
+def import_conversations(path, fmt=None, user_email=None, batch_size=TRANSFER_BATCH_SIZE, progress=None,
+                         errors=None):
+    """Load a history file into the conversations table using batched transactions
+
+    Unreadable JSONL lines are skipped; pass a list as errors to collect their (line number, reason).
+    """
+    fmt = detect_history_format(path, fmt)
+    user_ids = {None: None}
+
+    def get_user_id(email):
+        if email not in user_ids:
+            row = db_manager.execute("SELECT id FROM users WHERE email = ?", (email,)).fetchone()
+            if not row:
+                raise sqlite3.IntegrityError(f"Unknown user '{email}'")
+            user_ids[email] = row[0]
+        return user_ids[email]
+
+    imported = 0
+    for batch in iter_history_file(path, fmt, batch_size, errors):
+        rows = [
+            (get_user_id(user_email or email), timestamp, SPEAKER_CODES.get(speaker, SPEAKER_CODES["BOT"]), message)
+            for email, timestamp, speaker, message in batch
+        ]
+        db_manager.executemany(
+            "INSERT INTO conversations (user_id, timestamp, speaker, message) "
+            "VALUES (?, COALESCE(CAST(strftime('%s', ?) AS INTEGER), CAST(strftime('%s', 'now') AS INTEGER)), ?, ?)",
+            rows
+        )
+        imported += len(batch)
+        if progress:
+            progress(imported)
+
+    return imported
+
+
+    # Function: iter_user_records()
+def iter_user_records(path, fmt=None):
+    """Yield (record number, dict of USER_COLUMNS) from a CSV or JSONL file of accounts
+
+    A line that cannot be read as an account yields (record number, reason) instead, so one bad
+    line is reported without ending the run.
+    """
+    fmt = detect_history_format(path, fmt)
+    if fmt == 'parquet':
+        raise ValueError("User files must be CSV or JSONL")
+
+    with open(path, newline='', encoding='utf-8') as f:
+        if fmt == 'csv':
+            records = csv.DictReader(f)
+        else:
+            records = (line for line in f if line.strip())
+        for number, record in enumerate(records, 1):
+            if fmt == 'jsonl':
+                try:
+                    record = json.loads(record)
+                except ValueError as e:
+                    yield number, f"invalid JSON: {e}"
+                    continue
+                if not isinstance(record, dict):
+                    yield number, "record must be a JSON object"
+                    continue
+            yield number, {column: str(record.get(column) or "").strip() for column in USER_COLUMNS}
+
+
+    # Function: validate_user_record()
+def validate_user_record(record):
+    """The sign-up form's checks for one account; returns an error message or None"""
+    if not all(record[column] for column in USER_COLUMNS):
+        return "missing name, last_name, email or password"
+    if not (is_valid_name(record['name']) and is_valid_name(record['last_name'])):
+        return "names may only contain letters, spaces or hyphens"
+    if not EMAIL_PATTERN.match(record['email']):
+        return "invalid email address"
+    return None
+
+
+    # Function: provision_users()
+def provision_users(path, fmt=None, workers=None, batch_size=PROVISION_BATCH_SIZE, progress=None):
+    """Create accounts in bulk from a CSV or JSONL file with name, last_name, email and password
+
+    Passwords are hashed on a process pool (Argon2 is CPU bound, so threads would serialise on
+    the GIL) and each batch is inserted with one executemany() transaction. The pool is started
+    by the first batch of PROVISION_POOL_MIN passwords, as spawning workers costs more than
+    hashing a handful inline. Returns the number of accounts created plus (record number, email)
+    duplicates and (record number, email, reason) errors.
+    """
+    workers = workers or os.cpu_count() or 1
+    created, duplicates, errors = 0, [], []
+    seen = set()
+
+    with ExitStack() as stack:
+        executor = None
+        records = iter_user_records(path, fmt)
+        while True:
+            chunk = list(itertools.islice(records, batch_size))
+            if not chunk:
+                break
 
+            emails = [record['email'] for _, record in chunk if not isinstance(record, str)]
+            placeholders = ", ".join("?" * len(emails))
+            existing = {email for email, in db_manager.execute(
+                f"SELECT email FROM users WHERE email IN ({placeholders})", emails).fetchall()}
+
+            batch = []
+            for number, record in chunk:
+                if isinstance(record, str):
+                    errors.append((number, "", record))
+                    continue
+                error = validate_user_record(record)
+                if error:
+                    errors.append((number, record['email'], error))
+                elif record['email'] in existing or record['email'] in seen:
+                    duplicates.append((number, record['email']))
+                else:
+                    seen.add(record['email'])
+                    batch.append((number, record))
+
+            if batch:
+                passwords = [record['password'] for _, record in batch]
+                if executor is None and workers > 1 and len(passwords) >= PROVISION_POOL_MIN:
+                    executor = stack.enter_context(hashing_pool(workers))
+                if executor is None:
+                    hashes = map(hash_password, passwords)
+                else:
+                    hashes = executor.map(hash_password, passwords, chunksize=max(1, len(batch) // (workers * 4)))
+                rows = [(capitalize_name(record['name']), capitalize_name(record['last_name']), record['email'], hashed)
+                        for (_, record), hashed in zip(batch, hashes)]
+                # Accounts created elsewhere since the duplicate check are skipped rather than failing the batch
+                inserted = db_manager.executemany(
+                    "INSERT OR IGNORE INTO users (name, last_name, email, password) VALUES (?, ?, ?, ?)", rows)
+                created += inserted
+                if inserted < len(batch):
+                    duplicates.append((None, f"{len(batch) - inserted} accounts created concurrently"))
+            if progress:
+                progress(created)
+
+    return created, duplicates, errors
+
+
+# === Knowledge Pack Functions ===
+
+KNOWLEDGE_BATCH_SIZE = 5000
+
+    # Function: normalize_title()
+def normalize_title(title):
+    """Lookup key for article titles and redirects"""
+    return re.sub(r"\s+", " ", title.replace("_", " ")).strip().lower()
+
+
+    # Function: iter_abstract_records()
+def iter_abstract_records(path):
+    """Stream (title, abstract, redirects) from a Wikipedia abstract dump (.xml/.xml.gz) or JSONL"""
+    opener = gzip.open if path.endswith(".gz") else open
+    name = path[:-3] if path.endswith(".gz") else path
+
+    if name.endswith((".jsonl", ".ndjson")):
+        with opener(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    yield record["title"], record.get("abstract") or "", record.get("redirects") or []
+        return
 
-    # Function: get_current_user_info()
-def get_current_user_info():
-    print(f"Looking up user with email: {current_user_email}")
-    result = db_manager.execute("SELECT name, last_name, password FROM users WHERE email = ?", (current_user_email,))
-    user_info = result.fetchone()
-    print(f"Found user info: {user_info}")
-    return user_info
+    with opener(path, "rb") as f:
+        root = None
+        for event, element in ET.iterparse(f, events=("start", "end")):
+            if root is None:
+                root = element  # <feed>; finished docs are cleared from it so the tree stays empty
+            if event != "end" or element.tag != "doc":
+                continue
+            title = (element.findtext("title") or "").strip()
+            if title.startswith("Wikipedia: "):
+                title = title[len("Wikipedia: "):]
+            yield title, (element.findtext("abstract") or "").strip(), []
+            root.clear()
 
 
-    # Function: update_user_info()
-def update_user_info(new_name, new_last_name):
-    db_manager.execute("UPDATE users SET name = ?, last_name = ? WHERE email = ?", 
-                      (new_name, new_last_name, current_user_email))
-    db_manager.commit()
+    # Function: build_knowledge_pack()
+def build_knowledge_pack(source, output, redirects=None, batch_size=KNOWLEDGE_BATCH_SIZE, progress=None):
+    """Build the offline abstracts index next to output and swap it into place when complete
 
+    redirects is an optional TSV file of "redirect title<TAB>target title" lines.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    temp_path = output + ".building"
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
 
-    # Function: log_conversation()
-def log_conversation(email, speaker, message):
+    pack = DatabaseManager(temp_path)
     try:
-        db_manager.execute(
-            "INSERT INTO conversations (user_email, speaker, message) VALUES (?, ?, ?)",
-            (email, speaker, message.strip())
-        )
-        db_manager.commit()  
-    except Exception as e:
-        print(f"Failed to log conversation: {e}")
+        pack.execute("PRAGMA journal_mode = OFF")
+        pack.execute("CREATE TABLE articles (id INTEGER PRIMARY KEY, title TEXT NOT NULL, abstract TEXT NOT NULL)")
+        pack.execute("CREATE TABLE titles (key TEXT PRIMARY KEY, article_id INTEGER NOT NULL) WITHOUT ROWID")
+
+        ids = itertools.count(1)
+        count = 0
+        records = ((title, abstract, aliases) for title, abstract, aliases in iter_abstract_records(source)
+                   if title and abstract)
+        while True:
+            batch = list(itertools.islice(records, batch_size))
+            if not batch:
+                break
+            articles, titles = [], []
+            for title, abstract, aliases in batch:
+                article_id = next(ids)
+                articles.append((article_id, title, abstract))
+                titles.extend((normalize_title(alias), article_id) for alias in [title, *aliases])
+            pack.executemany("INSERT INTO articles (id, title, abstract) VALUES (?, ?, ?)", articles)
+            pack.executemany("INSERT OR IGNORE INTO titles (key, article_id) VALUES (?, ?)", titles)
+            count += len(batch)
+            if progress:
+                progress(count)
+
+        if redirects:
+            with open(redirects, encoding="utf-8") as f:
+                pairs = (line.rstrip("\n").split("\t") for line in f)
+                rows = [(normalize_title(alias), normalize_title(target))
+                        for alias, target, *_ in (pair for pair in pairs if len(pair) >= 2)]
+            pack.executemany(
+                "INSERT OR IGNORE INTO titles (key, article_id) SELECT ?, article_id FROM titles WHERE key = ?",
+                rows
+            )
+
+        try:
+            pack.execute(
+                "CREATE VIRTUAL TABLE abstracts_fts USING fts5(title, abstract, content='articles', content_rowid='id')")
+            pack.execute("INSERT INTO abstracts_fts (abstracts_fts) VALUES ('rebuild')")
+        except sqlite3.OperationalError as e:
+            print(f"\nFTS5 unavailable, only exact titles will match: {e}")
+    finally:
+        pack.close()
+
+    knowledge_pack.close()
+    os.replace(temp_path, output)
+    return count
+
+
+    # Function: benchmark_knowledge_pack()
+def benchmark_knowledge_pack(queries=None, count=200):
+    """Time lookups for the given queries (or a sample of titles); returns latency stats in ms"""
+    if not knowledge_pack.available():
+        raise OSError(f"No knowledge pack at {knowledge_pack.path}")
+    if not queries:
+        rows = knowledge_pack.db.execute(
+            "SELECT title FROM articles ORDER BY RANDOM() LIMIT ?", (count,)).fetchall()
+        queries = [title for title, in rows]
+
+    timings, hits = [], 0
+    for query in queries:
+        start = time.perf_counter()
+        hits += knowledge_pack.lookup(query) is not None
+        timings.append((time.perf_counter() - start) * 1000)
+
+    timings.sort()
+    return {
+        'queries': len(timings),
+        'hits': hits,
+        'mean_ms': sum(timings) / max(len(timings), 1),
+        'p50_ms': timings[len(timings) // 2] if timings else 0.0,
+        'p95_ms': timings[int(len(timings) * 0.95)] if timings else 0.0,
+    }
+
+
+# === Lexicon Functions ===
+
+LEXICON_DEFINITIONS_PER_POS = 2  # format_word_entry() never shows more
+WORDNET_FILES = (("noun", "noun"), ("verb", "verb"), ("adj", "adjective"), ("adv", "adverb"))  # data.<suffix>, index.<suffix>
+
+    # Function: normalize_word()
+def normalize_word(word):
+    return re.sub(r"\s+", " ", word.replace("_", " ")).strip().lower()
+
 
+    # Function: iter_wordnet_senses()
+def parse_wordnet_synset(line):
+    """(words, definition, example) from one line of a WordNet data.* file"""
+    fields, _, gloss = line.partition(" | ")
+    parts = fields.split()
+    word_count = int(parts[3], 16)
+    words = [re.sub(r"\(\w+\)$", "", parts[4 + 2 * i]) for i in range(word_count)]
+    definition = gloss.split('; "')[0].strip().rstrip(";")
+    examples = re.findall(r'"([^"]+)"', gloss)
+    return words, definition, examples[0] if examples else None
+
+
+    # Function: iter_wordnet_senses()
+def iter_wordnet_senses(directory):
+    """Stream (word, part of speech, definition, example) from WordNet data.* files
+
+    Each word's senses follow its index.<pos> line, which WordNet orders by tagged frequency
+    (cntlist), so the common meaning comes first; the data file's offset order is only used when
+    there is no index file.
+    """
+    for suffix, part_of_speech in WORDNET_FILES:
+        data_path = os.path.join(directory, "data." + suffix)
+        index_path = os.path.join(directory, "index." + suffix)
+        if not os.path.exists(data_path):
+            continue
+        with open(data_path, "rb") as data:  # index offsets are byte offsets
+            if not os.path.exists(index_path):
+                for line in data:
+                    if line.startswith(b"  "):  # license header
+                        continue
+                    words, definition, example = parse_wordnet_synset(line.decode("utf-8"))
+                    for word in words:
+                        yield word, part_of_speech, definition, example
+                continue
+
+            with open(index_path, encoding="utf-8") as index:
+                for line in index:
+                    if line.startswith("  "):
+                        continue
+                    # lemma pos synset_cnt p_cnt [ptr_symbol...] sense_cnt tagsense_cnt synset_offset...
+                    parts = line.split()
+                    for offset in parts[-int(parts[2]):]:
+                        data.seek(int(offset))
+                        _, definition, example = parse_wordnet_synset(data.readline().decode("utf-8"))
+                        yield parts[0], part_of_speech, definition, example
+
+
+    # Function: iter_lexicon_senses()
+def iter_lexicon_senses(source):
+    """Senses from a WordNet dict/ directory or a JSONL file of dictionaryapi.dev style entries"""
+    if os.path.isdir(source):
+        yield from iter_wordnet_senses(source)
+        return
+    with open(source, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            for meaning in entry.get("meanings", []):
+                for definition in meaning.get("definitions", []):
+                    yield entry["word"], meaning["partOfSpeech"], definition["definition"], definition.get("example")
+
+
+    # Function: build_lexicon()
+def build_lexicon(sources, output, progress=None):
+    """Compile senses into the sorted, memory-mappable lexicon file and swap it into place"""
+    entries = {}  # word -> {part of speech: [definitions]}
+    for source in sources:
+        for word, part_of_speech, definition, example in iter_lexicon_senses(source):
+            definitions = entries.setdefault(normalize_word(word), {}).setdefault(part_of_speech, [])
+            if len(definitions) < LEXICON_DEFINITIONS_PER_POS:
+                definitions.append({'definition': definition, **({'example': example} if example else {})})
+
+    keys = sorted(word.encode("utf-8") for word in entries)
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    temp_path = output + ".building"
+    with open(temp_path, "wb") as f:
+        f.write(Lexicon.HEADER.pack(Lexicon.MAGIC, len(keys)))
+        offset = Lexicon.HEADER.size + 8 * len(keys)
+        f.write(b"\0" * 8 * len(keys))  # offsets, filled in below
+        offsets = []
+        for done, key in enumerate(keys, 1):
+            word = key.decode("utf-8")
+            entry = json.dumps({
+                'word': word,
+                'meanings': [{'partOfSpeech': pos, 'definitions': definitions}
+                             for pos, definitions in entries[word].items()]
+            }, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+            record = struct.pack("<H", len(key)) + key + struct.pack("<I", len(entry)) + entry
+            f.write(record)
+            offsets.append(offset)
+            offset += len(record)
+            if progress and done % 10000 == 0:
+                progress(done)
+        f.seek(Lexicon.HEADER.size)
+        f.write(struct.pack(f"<{len(offsets)}Q", *offsets))
+
+    lexicon.close()
+    os.replace(temp_path, output)
+    return len(keys)
 
 
     # Function: speak()
 def speak(text):
-    """Thread-safe text-to-speech"""
-    def _speak():
-        with suppress_stderr():
-            try:
-                engine.say(text)
-                engine.runAndWait()
-            except Exception as e:
-                print(f"Speech error: {e}")
-    
-    window.after(0, _speak)
+    """Thread-safe text-to-speech, streamed sentence by sentence"""
+    speech_stream.say(text)
 
 
-    # Function: get_working_microphone()
-def get_working_microphone():
-    """Cross-platform microphone detection"""
+    # Function: speak_sentence()
+def speak_sentence(sentence):
+    """Speak one sentence on the Tk thread, from the phrase cache when possible"""
+    with suppress_stderr():
+        try:
+            if phrase_cache.play(sentence):
+                return
+            engine.say(sentence)
+            engine.runAndWait()
+        except Exception as e:
+            print(f"Speech error: {e}")
+
+
+    # Function: normalize_speech_text()
+def normalize_speech_text(text):
+    """Turn display text into speakable text: no emoji or bullets, one sentence per line"""
+    text = text.replace("°C", " degrees Celsius").replace("°F", " degrees Fahrenheit")
+    text = "".join(ch for ch in text if unicodedata.category(ch) not in ("So", "Sk", "Cs", "Co", "Mn"))
+
+    lines = []
+    for line in text.splitlines():
+        line = re.sub(r'^\s*[•▪‣*-]\s*', '', line).strip()
+        if line:
+            lines.append(line)
+    # Headings and list items become sentences of their own
+    for i, line in enumerate(lines):
+        if line.endswith(":"):
+            lines[i] = line[:-1].rstrip() + "."
+        elif i < len(lines) - 1 and line[-1] not in ".!?":
+            lines[i] = line + "."
+    return re.sub(r'\s+', ' ', " ".join(lines))
+
+
+    # Function: split_sentences()
+def split_sentences(text):
+    """Split normalized text at sentence punctuation followed by whitespace"""
+    return [sentence for sentence in re.split(r'(?<=[.!?])\s+', text.strip()) if sentence]
+
+
+    # Function: list_microphones()
+def list_microphones():
+    """Names of the audio devices, indexed like sr.Microphone device_index"""
+    with suppress_stderr():
+        try:
+            return sr.Microphone.list_microphone_names()
+        except Exception as e:
+            print(f"Microphone listing error: {e}")
+            return []
+
+
+    # Function: probe_microphone()
+def probe_microphone(mic_list=None):
+    """Cross-platform microphone detection, returns the device choice and its energy threshold"""
     with suppress_stderr():
         recognizer = sr.Recognizer()
         try:
-            mic_list = sr.Microphone.list_microphone_names()
+            if mic_list is None:
+                mic_list = sr.Microphone.list_microphone_names()
             
             # Windows/Linux/macOS compatible device detection
             preferred_keywords = [
@@ -1340,194 +4073,258 @@ def get_working_microphone():
                 if any(kw in name.lower() for kw in preferred_keywords):
                     with sr.Microphone(device_index=index) as source:
                         recognizer.adjust_for_ambient_noise(source, duration=0.5)
-                        return sr.Microphone(device_index=index)
+                    return {'device_index': index, 'device_name': name,
+                            'energy_threshold': recognizer.energy_threshold}
             
             # Fallback to default microphone
-            return sr.Microphone()
+            return {'device_index': None, 'device_name': None, 'energy_threshold': None}
             
         except Exception as e:
             print(f"Microphone detection error: {e}")
-            return sr.Microphone()
+            return {'device_index': None, 'device_name': None, 'energy_threshold': None}
+
+
+    # Function: get_working_microphone()
+def get_working_microphone():
+    """Microphone for this host, reused from the calibration cache while still valid"""
+    microphone, _ = microphone_cache.get_microphone()
+    return microphone
 
 
     # Function: listen_and_respond()
-def listen_and_respond(conversation_area):
-    recognizer = sr.Recognizer()
-    microphone = get_working_microphone()
-    
+def listen_and_respond(transcript):
+    """Point the assistant runtime at transcript and start (or resume) listening"""
+    microphone, _ = microphone_cache.get_microphone()
     if microphone is None:
         messagebox.showerror("Microphone Error", "No working microphone found")
         return None
 
-    stop_event = threading.Event()
-    processing_lock = threading.Lock()
-
-    def update_gui(text, speaker):
-        if conversation_area.winfo_exists():
-            tag = 'user' if speaker == "USER" else 'bot'
-            conversation_area.insert(tk.END, f"{speaker}: {text}\n", tag)
-            conversation_area.see(tk.END)
-            window.update()
-
-    def show_listening():
-        if conversation_area.winfo_exists():
-            conversation_area.insert(tk.END, "Listening...\n", 'system')
-            conversation_area.see(tk.END)
-            window.update()
-
-    def hide_listening():
-        if conversation_area.winfo_exists():
-            current_text = conversation_area.get("1.0", tk.END)
-            if current_text.endswith("Listening...\n"):
-                conversation_area.delete("end-2l", "end")
-            window.update()
-
-    def listen():
-        with suppress_stderr():
+    assistant_runtime.start(transcript)
+    return assistant_runtime
+
+
+    # Function: dispatch_command()
+def dispatch_command(command, conversation_area=None, user_email=None):
+    """Route one command to its intent and return the response text (False means exit)
+
+    conversation_area may be None, in which case capabilities skip their display output.
+    """
+    command = correct_command(command)
+    return handle_intent(classify_intent(command.lower()), command, conversation_area, user_email=user_email)
+
+
+    # Function: correct_command()
+def correct_command(command):
+    command = command.strip()
+    corrected = command_corrector.correct(command)
+    if corrected != command:
+        print(f"Corrected command: {command!r} -> {corrected!r}")
+    return corrected
+
+
+    # Function: classify_intent()
+def classify_intent(command_lower):
+    """Name of the intent a (lower-case) command routes to; the checks run in priority order"""
+    if any(phrase in command_lower for phrase in RECALL_PHRASES):
+        return "recall"
+    elif any(greeting in command_lower for greeting in ["hello", "hi"]):
+        return "greeting"
+    elif "current local time" in command_lower:
+        return "local_time"
+    elif "date" in command_lower:
+        return "date"
+    elif "hey assistant" in command_lower or "bot" in command_lower or "can you hear me" in command_lower or "hey" in command_lower:
+        return "presence"
+    elif any(word in command_lower for word in ['holiday', 'holidays']):
+        return "holidays"
+    elif any(word in command_lower for word in ['time in', 'time at', 'world time', 'time zones', 'what time is it in']):
+        return "world_time"
+    elif "open" in command_lower:
+        return "open"
+    elif "search google" in command_lower or "search web" in command_lower or "search chrome" in command_lower or "search google chrome" in command_lower:
+        return "web_search"
+    elif any(phrase in command_lower for phrase in ["wikipedia", "what is", "who is", "tell me about"]):
+        return "wikipedia"
+    elif any(phrase in command_lower for phrase in [
+        "what is the meaning of",
+        "define",
+        "what does mean",
+        "explain the word"
+    ]):
+        return "define"
+    # System control commands
+    elif "lock computer" in command_lower or "lock pc" in command_lower:
+        return "lock"
+    elif "restart computer" in command_lower or "reboot computer" in command_lower:
+        return "restart"
+    elif "shutdown computer" in command_lower or "turn off computer" in command_lower:
+        return "shutdown"
+    elif "weather" in command_lower or "forecast" in command_lower:
+        return "weather"
+    elif "news" in command_lower or "headlines" in command_lower:
+        return "news"
+    elif any(word in command_lower for word in ["convert", "change", "to"]):
+        return "convert"
+    elif "exit" in command_lower or "quit" in command_lower or "stop" in command_lower:
+        return "exit"
+    return "unknown"
+
+
+    # Function: handle_intent()
+def handle_intent(intent, command, conversation_area=None, user_email=None):
+    """Run the handler for an intent chosen by classify_intent(); user_email is the signed-in user, if any"""
+    response = ""
+    command_lower = command.lower()
+    
+    if intent == "greeting":
+        response = "Hello! How can I help you today?"
+    elif intent == "local_time":
+        response = f"The current time is {datetime.now().strftime('%H:%M')}"
+    elif intent == "date":
+        response = f"Today's date is {datetime.now().strftime('%B %d, %Y')}"
+    elif intent == "presence":
+        response = f"I am in your service"
+    elif intent == "holidays":
+        response = show_holidays(command_lower, conversation_area)
+    elif intent == "world_time":
+        response = show_world_time(command, conversation_area)
+    elif intent == "open":
+        app = command_lower.replace("open", "").strip()
+        response = open_application(app)  # Let the function handle all responses
+    elif intent == "web_search":
+        query = command_lower.replace("search google", "")\
+                .replace("search web", "")\
+                .replace("search chrome", "")\
+                .replace("search google chrome", "")\
+                .strip()
+        if query:
+            response = f"Searching the web for {query}"
             try:
-                window.after(0, show_listening)
-                with microphone as source:
-                    recognizer.adjust_for_ambient_noise(source, duration=0.5)
-                    audio = recognizer.listen(source, timeout=5, phrase_time_limit=10)
-                window.after(0, hide_listening)
-                return recognizer.recognize_google(audio)
-            except sr.WaitTimeoutError:
-                window.after(0, hide_listening)
-                return None
-            except Exception as e:
-                print(f"Recognition error: {e}")
-                window.after(0, hide_listening)
-                return None
+                subprocess.Popen(["google-chrome", f"https://www.google.com/search?q={query}"])
+            except:
+                response = "I couldn't perform the search. Please try again."
+    
+    elif intent == "wikipedia":
+        query = re.sub(
+            r'(search wikipedia for|wikipedia|what is|who is|tell me about)\s*', 
+            '', 
+            command_lower
+        ).strip()
+        
+        if query:
+            response = search_wikipedia(query, conversation_area, display_only=True)
+        else:
+            response = "What would you like me to search on Wikipedia?"
+
+    elif intent == "define":
+        response = explain_word(command, conversation_area)
+
+    # System control commands
+    elif intent == "lock":
+        response = lock_computer()
+    elif intent == "restart":
+        if "confirm" in command_lower:
+            response = restart_computer(confirm=False)
+        else:
+            response = restart_computer()
+    elif intent == "shutdown":
+        if "confirm" in command_lower:
+            response = shutdown_computer(confirm=False)
+        else:
+            response = shutdown_computer()
+    
+    elif intent == "weather":
+        city = extract_weather_city(command)
+        if city:
+            response = show_weather(city, conversation_area)
+        else:
+            response = "Please specify a city (e.g., 'weather in London')"
+
+    elif intent == "news":
+        response = get_news_summaries(conversation_area)
+
+    elif intent == "convert":
+        response = process_conversion_command(command, conversation_area)
+
+    elif intent == "recall":
+        response = recall_history(command, user_email)
+
+    elif intent == "exit":
+        return False
+    else:
+        response = "I'm not sure how to help with that. Could you try asking something else?"
+
+    return response
 
-    def process_command(command):
-        if not command or not command.strip():
+
+    # Function: execute_turn()
+def execute_turn(command, transcript=None):
+    """Show, log and dispatch one spoken or typed command; returns the response, None or False"""
+    if not command or not command.strip():
+        return None
+
+    # A new command (including "stop") takes over from a handler that is still running
+    intent_runner.cancel()
+    with command_lock:
+        command = command.strip()
+        print(f"Processing command: {command}")
+        if transcript is not None:
+            gui_queue.post(transcript.add_turn, "USER", command)
+        log_conversation(current_user_email, "USER", command)
+
+        response = intent_runner.run(command, transcript.widget if transcript is not None else None,
+                                     user_email=current_user_email)
+        if response is None:
             return None
-            
-        with processing_lock:
-            command = command.strip()
-            print(f"Processing command: {command}")
-            window.after(0, lambda: update_gui(command, "USER"))
-            log_conversation(current_user_email, "USER", command)
-            
-            response = ""
-            command_lower = command.lower()
-            
-            if any(greeting in command_lower for greeting in ["hello", "hi"]):
-                response = "Hello! How can I help you today?"
-            elif "current local time" in command_lower:
-                response = f"The current time is {datetime.now().strftime('%H:%M')}"
-            elif "date" in command_lower:
-                response = f"Today's date is {datetime.now().strftime('%B %d, %Y')}"
-            elif "hey assistant" in command_lower or "bot" in command_lower or "can you hear me" in command_lower or "hey" in command_lower:
-                response = f"I am in your service"
-            elif any(word in command_lower for word in ['holiday', 'holidays']):
-                response = show_holidays(command_lower, conversation_area)
-            elif any(word in command.lower() for word in ['time in', 'time at', 'world time', 'time zones', 'what time is it in']):
-                response = show_world_time(command, conversation_area)
-                return response
-            elif "open" in command_lower:
-                app = command_lower.replace("open", "").strip()
-                response = open_application(app)  # Let the function handle all responses
-            elif "search google" in command_lower or "search web" in command_lower or "search chrome" in command_lower or "search google chrome" in command_lower:
-                query = command_lower.replace("search google", "")\
-                        .replace("search web", "")\
-                        .replace("search chrome", "")\
-                        .replace("search google chrome", "")\
-                        .strip()
-                if query:
-                    response = f"Searching the web for {query}"
-                    try:
-                        subprocess.Popen(["google-chrome", f"https://www.google.com/search?q={query}"])
-                    except:
-                        response = "I couldn't perform the search. Please try again."
-            
-            elif any(phrase in command_lower for phrase in ["wikipedia", "what is", "who is", "tell me about"]):
-                query = re.sub(
-                    r'(search wikipedia for|wikipedia|what is|who is|tell me about)\s*', 
-                    '', 
-                    command_lower
-                ).strip()
-                
-                if query:
-                    response = search_wikipedia(query, conversation_area, display_only=True)
-                else:
-                    response = "What would you like me to search on Wikipedia?"
-                
-                return response
-
-            elif any(phrase in command_lower for phrase in [
-                "what is the meaning of",
-                "define",
-                "what does mean",
-                "explain the word"
-            ]):
-                response = explain_word(command, conversation_area)
-
-            # System control commands
-            elif "lock computer" in command_lower or "lock pc" in command_lower:
-                response = lock_computer()
-            elif "restart computer" in command_lower or "reboot computer" in command_lower:
-                if "confirm" in command_lower:
-                    response = restart_computer(confirm=False)
-                else:
-                    response = restart_computer()
-            elif "shutdown computer" in command_lower or "turn off computer" in command_lower:
-                if "confirm" in command_lower:
-                    response = shutdown_computer(confirm=False)
-                else:
-                    response = shutdown_computer()
-            
-            elif "weather" in command_lower or "forecast" in command_lower:
-                city = command_lower.replace("weather", "").replace("forecast", "").replace("in", "").strip()
-                if city:
-                    response = show_weather(city, conversation_area)
-                else:
-                    response = "Please specify a city (e.g., 'weather in London')"
+        if response is False:
+            if transcript is not None:
+                gui_queue.post(transcript.add_turn, "BOT", GOODBYE_MESSAGE)
+            speak(GOODBYE_MESSAGE)
+            return False
 
-            elif "news" in command_lower or "headlines" in command_lower:
-                response = get_news_summaries(conversation_area)
+        if response:
+            log_conversation(current_user_email, "BOT", response)
 
-            elif any(word in command_lower for word in ["convert", "change", "to"]):
-                response = process_conversion_command(command, conversation_area)
+        return response
 
-            elif "exit" in command_lower or "quit" in command_lower or "stop" in command_lower:
-                response = "Goodbye! Have a nice day."
-                window.after(0, lambda: update_gui(response, "BOT"))
-                speak(response)
-                return False
-            else:
-                response = "I'm not sure how to help with that. Could you try asking something else?"
-            
-            if response:
-                log_conversation(current_user_email, "BOT", response)
-            
-            return response
 
-    def assistant_loop():
-        last_command = None
-        while not stop_event.is_set():
-            command = listen()
-            if command is None or command == last_command:
-                continue
-                
-            response = process_command(command)
-            if response is False:
-                stop_event.set()
-                break
-            if response is None:
-                continue
-                
-            last_command = command
-            
-            if response:
-                window.after(0, lambda: update_gui(response, "BOT"))
-                speak(response)
+    # Function: submit_command()
+def submit_command(transcript, command):
+    """Run a spoken or typed command on its own thread so the caller can keep listening"""
+    def worker():
+        response = execute_turn(command, transcript)
+        if response is False:
+            stop_assistant()
+        elif response:
+            gui_queue.post(transcript.add_turn, "BOT", response)
+            speak(response)
 
-    assistant_thread = threading.Thread(target=assistant_loop)
-    assistant_thread.daemon = True
-    assistant_thread.start()
-    
-    return stop_event
+    threading.Thread(target=worker, daemon=True).start()
+
+
+    # Function: run_command_batch()
+def run_command_batch(commands, workers=BATCH_WORKERS, user_email=None, allow_machine_control=False):
+    """Dispatch commands on a bounded thread pool without audio or GUI output
+
+    Results come back in input order as (command, response) pairs, and the whole
+    batch is written to history in one transaction when user_email is given.
+    REMOTE_DENIED_INTENTS are refused unless allow_machine_control is set, so a
+    commands file cannot open programs or lock and restart the desktop by accident.
+    """
+    denied_intents = () if allow_machine_control else REMOTE_DENIED_INTENTS
+
+    def run(command):
+        response = intent_runner.run(command, cancel_previous=False, user_email=user_email,
+                                     denied_intents=denied_intents)
+        return command, GOODBYE_MESSAGE if response is False else response
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        results = list(executor.map(run, commands))
+
+    if user_email:
+        log_conversations(user_email, [turn for command, response in results
+                                       for turn in (("USER", command), ("BOT", response))])
+    return results
 
 
     # Function: wishMe() (Greetings)
@@ -1653,9 +4450,7 @@ def process_conversion_command(command, conversation_area=None):
         
         response = f"{value} {from_unit} = {result:.2f} {to_unit}"
         
-        if conversation_area:
-            conversation_area.insert(tk.END, f"BOT: {response}\n\n")
-            conversation_area.see(tk.END)
+        gui_queue.append_text(conversation_area, f"BOT: {response}\n\n")
         
         return response
     
@@ -1663,42 +4458,92 @@ def process_conversion_command(command, conversation_area=None):
         return f"Conversion failed: {str(e)}"
 
 
+    # Function: recall_history()
+def recall_history(command, user_email):
+    """Answer "what did I ask about X" from the signed-in user's history by meaning, not exact words"""
+    if user_email is None:
+        return "Sign in so I can search your conversation history."
+    if not history_index.available():
+        return "Searching your history needs the optional numpy package."
+
+    topic = command.lower()
+    for phrase in RECALL_PHRASES:
+        topic = topic.replace(phrase, " ")
+    topic = topic.strip(" ?.!")
+    if not topic:
+        return "What should I look for in your history?"
+
+    # Earlier recalls and their answers are in the history too and match the same topic, so ask
+    # for spare hits and widen the search while they crowd out real turns
+    k = HISTORY_TOP_K * 4
+    while True:
+        hits = history_index.search([topic], user_email, k)[0]
+        answers = recalled_turns(hits)
+        if len(answers) >= HISTORY_TOP_K or len(hits) < k or k >= HISTORY_RECALL_MAX_HITS:
+            break
+        k *= 4
+
+    if not answers:
+        return f"I couldn't find anything about {topic} in your history."
+    return "\n".join(answers)
+
+
+    # Function: recalled_turns()
+def recalled_turns(hits):
+    """Up to HISTORY_TOP_K spoken summaries of the turns behind (conversation id, score) hits
+
+    Turns whose question was itself a recall command are skipped, so an answer never quotes an
+    earlier recall answer.
+    """
+    answers, seen = [], set()
+    for row_id, _ in hits:
+        row = db_manager.execute(
+            "SELECT user_id, timestamp, speaker, message FROM conversations WHERE id = ?", (row_id,)).fetchone()
+        if not row or classify_intent(row[3].lower()) == "recall":
+            continue
+        user_id, timestamp, speaker, message = row
+        # Pair the hit with the other half of its turn
+        if speaker == SPEAKER_CODES["USER"]:
+            pair = db_manager.execute(
+                "SELECT id, message FROM conversations WHERE user_id = ? AND id > ? AND speaker = ? ORDER BY id LIMIT 1",
+                (user_id, row_id, SPEAKER_CODES["BOT"])).fetchone()
+            question_id, question, answer = row_id, message, pair[1] if pair else None
+        else:
+            pair = db_manager.execute(
+                "SELECT id, message FROM conversations WHERE user_id = ? AND id < ? AND speaker = ? ORDER BY id DESC LIMIT 1",
+                (user_id, row_id, SPEAKER_CODES["USER"])).fetchone()
+            question_id, question, answer = (pair[0], pair[1], message) if pair else (row_id, None, message)
+        if question_id in seen or (question and classify_intent(question.lower()) == "recall"):
+            continue
+        seen.add(question_id)
+        when = datetime.fromtimestamp(timestamp).strftime('%B %d')
+        if question and answer:
+            answers.append(f"On {when} you asked \"{question}\" and I said: {answer}")
+        else:
+            answers.append(f"On {when}: {question or answer}")
+        if len(answers) == HISTORY_TOP_K:
+            break
+    return answers
+
+
     # Function: get_news_summaries()
 def get_news_summaries(conversation_area=None):
-    """Fetch top 5 global news headlines with summaries"""
+    """Top 5 global news headlines from the background refresher's latest snapshot"""
     try:
-        API_KEY = "your_newsapi_key"  # Replace with your actual key
-        url = f"https://newsapi.org/v2/top-headlines?country=us&pageSize=5&apiKey={API_KEY}"
-        
-        response = requests.get(url)
-        data = response.json()
-        
-        if data['status'] != 'ok' or not data['articles']:
+        snapshot, age = news_refresher.latest()
+        if snapshot is None:
+            # Refresher not started yet (or never succeeded): fetch once on the spot
+            news_refresher.refresh()
+            snapshot, age = news_refresher.latest()
+        if snapshot is None:
             return "Couldn't fetch news at the moment"
         
-        news_items = []
-        for article in data['articles'][:5]:  # Get top 5
-            title = article['title']
-            description = article['description'] or "No description available"
-            source = article['source']['name']
-            
-            # Create 3-line summary
-            summary = (
-                f"📰 {title}\n"
-                f"   - {description.split('.')[0]}\n"
-                f"   - Source: {source}\n"
-            )
-            news_items.append(summary)
-        
-        # Format response
-        response = "🌍 Top Global News Headlines:\n"
-        full_report = response + "\n".join(news_items)
+        intro, full_report = snapshot
+        response = f"{intro.rstrip(':')} ({format_age(age)}):\n"
         
         # Update GUI
-        if conversation_area:
-            conversation_area.insert(tk.END, f"BOT: {response}\n")
-            conversation_area.insert(tk.END, full_report + "\n\n")
-            conversation_area.see(tk.END)
+        gui_queue.append_text(conversation_area, f"BOT: {response}\n")
+        gui_queue.append_text(conversation_area, full_report + "\n\n")
         
         return response  # Only speak the intro
     
@@ -1707,41 +4552,78 @@ def get_news_summaries(conversation_area=None):
         return "Failed to fetch news updates"
 
 
+    # Function: format_news_report()
+def format_news_report(articles):
+    """Spoken intro and displayed report for a list of NewsAPI articles"""
+    news_items = []
+    for article in articles[:5]:  # Get top 5
+        title = article['title']
+        description = article['description'] or "No description available"
+        source = article['source']['name']
+        
+        # Create 3-line summary
+        summary = (
+            f"📰 {title}\n"
+            f"   - {description.split('.')[0]}\n"
+            f"   - Source: {source}\n"
+        )
+        news_items.append(summary)
+    
+    # Format response
+    intro = "🌍 Top Global News Headlines:"
+    return intro, intro + "\n" + "\n".join(news_items)
+
+
+    # Function: format_age()
+def format_age(seconds):
+    """Human wording for how old a snapshot is"""
+    minutes = int(seconds // 60)
+    if minutes < 1:
+        return "updated just now"
+    if minutes < 60:
+        return f"updated {minutes} minute{'s' if minutes != 1 else ''} ago"
+    hours = minutes // 60
+    return f"updated {hours} hour{'s' if hours != 1 else ''} ago"
+
+
     # Function: get_weather()
 def get_weather(city_name):
-    """Get current weather and forecast for a city"""
+    """Get current weather and forecast for a city, from the prefetch cache when it is fresh"""
     try:
-        # Use OpenWeatherMap API (free tier)
-        API_KEY = "your_api_key"  # Get from https://openweathermap.org/
-        base_url = "http://api.openweathermap.org/data/2.5/weather"
-        forecast_url = "http://api.openweathermap.org/data/2.5/forecast"
-        
-        # Get current weather
-        current_params = {
-            'q': city_name,
-            'units': 'metric',
-            'appid': API_KEY
-        }
-        current_response = requests.get(base_url, params=current_params).json()
-        
-        # Get forecast
-        forecast_params = {
-            'q': city_name,
-            'units': 'metric',
-            'appid': API_KEY,
-            'cnt': 5  # Next 5 time periods (about 24 hours)
-        }
-        forecast_response = requests.get(forecast_url, params=forecast_params).json()
-        
-        return {
-            'current': current_response,
-            'forecast': forecast_response
-        }
+        return weather_cache.get(city_name) or weather_cache.fetch(city_name)
     except Exception as e:
         print(f"Weather API error: {e}")
         return None
 
 
+    # Function: extract_weather_city()
+def extract_weather_city(command):
+    """City named in a weather command ('weather in Berlin', 'Paris forecast', ...)"""
+    command = command.lower().strip().rstrip("?.!")
+    match = re.search(r"\b(?:in|for|at)\s+(.+)$", command)
+    city = match.group(1) if match else re.sub(r"\b(?:weather|forecast)\b", "", command)
+    city = re.sub(r"\b(?:weather|forecast|today|tomorrow|now)\b", "", city)
+    return re.sub(r"\s+", " ", city).strip()
+
+
+    # Function: get_favorite_cities()
+def get_favorite_cities(email, limit=WEATHER_FAVORITES, min_requests=2, recent=500):
+    """Cities a user asked the weather for most often among their recent commands"""
+    try:
+        rows = db_manager.execute(
+            "SELECT c.message FROM conversations c JOIN users u ON u.id = c.user_id "
+            "WHERE u.email = ? AND c.speaker = ? AND (c.message LIKE '%weather%' OR c.message LIKE '%forecast%') "
+            "ORDER BY c.timestamp DESC LIMIT ?",
+            (email, SPEAKER_CODES["USER"], recent)
+        ).fetchall()
+    except sqlite3.Error as e:
+        print(f"Favorite city lookup failed: {e}")
+        return []
+
+    counts = Counter(city for city in (extract_weather_city(message) for message, in rows) if city)
+    return [city for city, count in counts.most_common(limit) if count >= min_requests]
+
+
     # Function: show_weather()
 def show_weather(city_name, conversation_area=None):
     """Process weather command and display results"""
@@ -1769,10 +4651,8 @@ def show_weather(city_name, conversation_area=None):
             forecast_text += f"• {time}: {temp}°C, {condition}\n"
         
         # Update GUI
-        if conversation_area:
-            conversation_area.insert(tk.END, f"BOT: {spoken_response}\n")
-            conversation_area.insert(tk.END, forecast_text + "\n")
-            conversation_area.see(tk.END)
+        gui_queue.append_text(conversation_area, f"BOT: {spoken_response}\n")
+        gui_queue.append_text(conversation_area, forecast_text + "\n")
         
         return spoken_response
     
@@ -1782,7 +4662,11 @@ def show_weather(city_name, conversation_area=None):
 
     # Function: simplify_word_meaning()
 def simplify_word_meaning(word):
-    """Get simple dictionary definition using DictionaryAPI"""
+    """Get simple dictionary definition from the offline lexicon, or DictionaryAPI on a miss"""
+    entry = lexicon.lookup(word)
+    if entry:
+        return format_word_entry(entry)
+
     try:
         response = requests.get(f"https://api.dictionaryapi.dev/api/v2/entries/en/{word}")
         data = response.json()
@@ -1791,30 +4675,35 @@ def simplify_word_meaning(word):
             return f"Couldn't find a definition for '{word}'"
         
         # Extract the first entry
-        entry = data[0]
-        word = entry["word"]
-        meanings = entry["meanings"]
-        
-        simplified = [f"📖 {word.capitalize()} means:"]
-        
-        # Limit to 3 meanings max
-        for meaning in meanings[:3]:
-            part_of_speech = meaning["partOfSpeech"]
-            definitions = meaning["definitions"]
-            
-            simplified.append(f"• As a {part_of_speech}:")
-            # Take first 2 definitions max
-            for definition in definitions[:2]:
-                simplified.append(f"  - {definition['definition']}")
-                if "example" in definition:
-                    simplified.append(f"    Example: '{definition['example']}'")
-        
-        return "\n".join(simplified)
+        return format_word_entry(data[0])
     
     except Exception as e:
         return f"Sorry, I couldn't look up '{word}'. Try another word."
 
 
+    # Function: format_word_entry()
+def format_word_entry(entry):
+    """Format a dictionary entry ({'word', 'meanings'}) as the spoken/displayed explanation"""
+    word = entry["word"]
+    meanings = entry["meanings"]
+    
+    simplified = [f"📖 {word.capitalize()} means:"]
+    
+    # Limit to 3 meanings max
+    for meaning in meanings[:3]:
+        part_of_speech = meaning["partOfSpeech"]
+        definitions = meaning["definitions"]
+        
+        simplified.append(f"• As a {part_of_speech}:")
+        # Take first 2 definitions max
+        for definition in definitions[:2]:
+            simplified.append(f"  - {definition['definition']}")
+            if "example" in definition:
+                simplified.append(f"    Example: '{definition['example']}'")
+    
+    return "\n".join(simplified)
+
+
     # Function: explain_word()
 def explain_word(command, conversation_area=None):
     """Handle word explanation requests"""
@@ -1837,10 +4726,8 @@ def explain_word(command, conversation_area=None):
     explanation = simplify_word_meaning(word)
     
     # Update GUI if available
-    if conversation_area and conversation_area.winfo_exists():
-        conversation_area.insert(tk.END, f"USER: {command}\n")
-        conversation_area.insert(tk.END, f"BOT: {explanation}\n\n")
-        conversation_area.see(tk.END)
+    gui_queue.append_text(conversation_area, f"USER: {command}\n")
+    gui_queue.append_text(conversation_area, f"BOT: {explanation}\n\n")
     
     return explanation
 
@@ -1849,13 +4736,12 @@ def explain_word(command, conversation_area=None):
 def search_wikipedia(query, conversation_area=None, display_only=False):
     """Search Wikipedia and return a summary"""
     try:
-        wikipedia.set_lang("en")
-        summary = wikipedia.summary(query, sentences=3)
+        # The offline pack answers in milliseconds; the network is only the fallback
+        summary = knowledge_pack.lookup(query) or wikipedia.summary(query, sentences=3)
         response = f"📚 Wikipedia summary for '{query}':\n\n{summary}"
         
-        if not display_only and conversation_area and conversation_area.winfo_exists():
-            conversation_area.insert(tk.END, f"BOT: {response}\n\n")
-            conversation_area.see(tk.END)
+        if not display_only:
+            gui_queue.append_text(conversation_area, f"BOT: {response}\n\n")
         
         return response
     
@@ -1916,9 +4802,7 @@ def show_holidays(command, conversation_area=None):
             response += f"• {date}: {name}\n"
     
     # Display in conversation area
-    if conversation_area:
-        conversation_area.insert(tk.END, "\n" + response + "\n")
-        conversation_area.see(tk.END)
+    gui_queue.append_text(conversation_area, "\n" + response + "\n")
     
     return response
 
@@ -2013,9 +4897,7 @@ def show_world_time(command, conversation_area=None):
                 response += f"• {city}: {time}\n"
         
         # Safely update conversation area if it exists
-        if conversation_area and conversation_area.winfo_exists():
-            conversation_area.insert(tk.END, f"BOT: {response}\n\n")
-            conversation_area.see(tk.END)
+        gui_queue.append_text(conversation_area, f"BOT: {response}\n\n")
         
         return response
     
@@ -2025,6 +4907,56 @@ def show_world_time(command, conversation_area=None):
 
 # === Utility Functions ===
 
+# Curated aliases, tried before the application index
+APP_COMMANDS = {
+    'chrome': {
+        'Windows': ['start', 'chrome'],
+        'Linux': ['google-chrome', 'google-chrome-stable', 'chromium-browser'],
+        'Darwin': ['open', '-a', 'Google Chrome']
+    },
+    'browser': {
+        'Windows': ['start', 'chrome'],
+        'Linux': ['google-chrome', 'firefox', 'chromium-browser'],
+        'Darwin': ['open', '-a', 'Google Chrome']
+    },
+    'terminal': {
+        'Windows': ['cmd.exe'],
+        'Linux': ['gnome-terminal', 'x-terminal-emulator', 'konsole', 'xfce4-terminal'],
+        'Darwin': ['open', '-a', 'Terminal']
+    },
+    'file manager': {
+        'Windows': ['explorer.exe'],
+        'Linux': ['nautilus', 'dolphin', 'thunar'],
+        'Darwin': ['open', '-a', 'Finder']
+    },
+    'calculator': {
+        'Windows': ['calc.exe'],
+        'Linux': ['gnome-calculator', 'kcalc'],
+        'Darwin': ['open', '-a', 'Calculator']
+    },
+    'text editor': {
+        'Windows': ['notepad.exe'],
+        'Linux': ['gedit', 'kate', 'mousepad'],
+        'Darwin': ['open', '-a', 'TextEdit']
+    },
+    'spotify': {
+        'Windows': ['spotify'],
+        'Linux': ['spotify'],
+        'Darwin': ['open', '-a', 'Spotify']
+    },
+    'youtube': {
+        'Windows': ['start', 'chrome', 'https://youtube.com'],
+        'Linux': ['google-chrome', 'https://youtube.com'],
+        'Darwin': ['open', '-a', 'Google Chrome', 'https://youtube.com']
+    },
+    'settings': {
+        'Windows': ['control'],
+        'Linux': ['gnome-control-center', 'systemsettings'],
+        'Darwin': ['open', '-a', 'System Preferences']
+    }
+}
+
+
     # Function: open_application()
 def open_application(app_name):
     """Cross-platform application opener with intelligent matching"""
@@ -2032,66 +4964,16 @@ def open_application(app_name):
         system_os = platform.system()
         app_name = app_name.lower().strip()
         
-        # Expanded app commands mapping with common variations
-        app_commands = {
-            'chrome': {
-                'Windows': ['start', 'chrome'],
-                'Linux': ['google-chrome', 'google-chrome-stable', 'chromium-browser'],
-                'Darwin': ['open', '-a', 'Google Chrome']
-            },
-            'browser': {
-                'Windows': ['start', 'chrome'],
-                'Linux': ['google-chrome', 'firefox', 'chromium-browser'],
-                'Darwin': ['open', '-a', 'Google Chrome']
-            },
-            'terminal': {
-                'Windows': ['cmd.exe'],
-                'Linux': ['gnome-terminal', 'x-terminal-emulator', 'konsole', 'xfce4-terminal'],
-                'Darwin': ['open', '-a', 'Terminal']
-            },
-            'file manager': {
-                'Windows': ['explorer.exe'],
-                'Linux': ['nautilus', 'dolphin', 'thunar'],
-                'Darwin': ['open', '-a', 'Finder']
-            },
-            'calculator': {
-                'Windows': ['calc.exe'],
-                'Linux': ['gnome-calculator', 'kcalc'],
-                'Darwin': ['open', '-a', 'Calculator']
-            },
-            'text editor': {
-                'Windows': ['notepad.exe'],
-                'Linux': ['gedit', 'kate', 'mousepad'],
-                'Darwin': ['open', '-a', 'TextEdit']
-            },
-            'spotify': {
-                'Windows': ['spotify'],
-                'Linux': ['spotify'],
-                'Darwin': ['open', '-a', 'Spotify']
-            },
-            'youtube': {
-                'Windows': ['start', 'chrome', 'https://youtube.com'],
-                'Linux': ['google-chrome', 'https://youtube.com'],
-                'Darwin': ['open', '-a', 'Google Chrome', 'https://youtube.com']
-            },
-            'settings': {
-                'Windows': ['control'],
-                'Linux': ['gnome-control-center', 'systemsettings'],
-                'Darwin': ['open', '-a', 'System Preferences']
-            }
-        }
-
         # First check for direct matches in our command mapping
-        for app_key in app_commands:
+        for app_key in APP_COMMANDS:
             if app_key in app_name:
-                commands = app_commands[app_key].get(system_os, [])
+                commands = APP_COMMANDS[app_key].get(system_os, [])
                 for cmd in commands:
                     try:
                         # On Linux, check if the command exists first
                         if system_os == "Linux":
                             which_cmd = cmd[0] if isinstance(cmd, list) else cmd.split()[0]
-                            if subprocess.run(['which', which_cmd], 
-                                           capture_output=True).returncode != 0:
+                            if not app_index.has_executable(which_cmd):
                                 continue
                         
                         subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
@@ -2099,6 +4981,15 @@ def open_application(app_name):
                     except Exception as e:
                         continue
 
+        # Any installed application, by its .desktop name, generic name, keyword or command
+        argv = app_index.lookup(app_name)
+        if argv:
+            try:
+                subprocess.Popen(argv, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                return f"Opening {app_name}"
+            except OSError as e:
+                print(f"Launch failed for {argv}: {e}")
+
         # Special handling for browser names
         browser_names = ['chrome', 'firefox', 'edge', 'safari', 'opera', 'brave', 'browser']
         if any(browser in app_name for browser in browser_names):
@@ -2211,27 +5102,88 @@ def restart_computer(confirm=True):
 
 # === Other Functions ===
 
-    # Function: clear_window()
-def clear_window():
-    global assistant_stop_event
-    
-    if 'assistant_stop_event' in globals() and assistant_stop_event:
-        assistant_stop_event.set()
-    
-    for widget in window.winfo_children():
-        widget.destroy()
+    # Function: allowed_edits()
+def allowed_edits(word):
+    """Edit budget for fuzzy matching: none for short words, where near-misses are real words"""
+    return 0 if len(word) < 5 else 1 if len(word) < 8 else 2
+
+
+    # Function: bounded_edit_distance()
+def bounded_edit_distance(a, b, bound):
+    """Levenshtein distance, or bound + 1 as soon as it is known to exceed bound"""
+    if abs(len(a) - len(b)) > bound:
+        return bound + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        if min(current) > bound:
+            return bound + 1
+        previous = current
+    return min(previous[-1], bound + 1)
+
+
+    # Function: vectorize_texts()
+def vectorize_texts(texts, dims=None):
+    """L2-normalised signed, hashed word unigrams and bigrams of each text, as CSR arrays
+
+    Returns (indptr, columns, weights): the weights of text i are weights[indptr[i]:indptr[i + 1]].
+    """
+    dims = dims or HISTORY_INDEX_DIMS
+    indptr, columns, weights = [0], [], []
+    for text in texts:
+        tokens = [token for token in re.findall(r"[a-z0-9']+", text.lower()) if token not in HISTORY_STOPWORDS]
+        row = {}
+        for gram, count in Counter(tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]).items():
+            # crc32 rather than hash(), which changes between runs and would break the saved index
+            digest = zlib.crc32(gram.encode("utf-8"))
+            row[digest % dims] = row.get(digest % dims, 0.0) + (1.0 + math.log(count)) * (1.0 if digest & 0x80000000 else -1.0)
+        norm = math.sqrt(sum(weight * weight for weight in row.values()))
+        for column, weight in row.items():
+            if weight:
+                columns.append(column)
+                weights.append(weight / norm)
+        indptr.append(len(columns))
+    return np.array(indptr, np.int64), np.array(columns, np.uint16), np.array(weights, np.float32)
+
+
+    # Function: count_widgets()
+def count_widgets(widget):
+    """Number of live Tk widgets in the tree under widget, itself included"""
+    return 1 + sum(count_widgets(child) for child in widget.winfo_children())
+
+
+    # Function: thread_kind()
+def thread_kind(thread):
+    """Group threads by target ("Thread-7 (safe_history_load)") or pool ("intent_3") name"""
+    match = re.search(r"\((\w+)\)$", thread.name)
+    return match.group(1) if match else thread.name.rstrip("-_0123456789") or thread.name
+
+
+    # Function: widget_exists()
+def widget_exists(widget):
+    """winfo_exists() that also tolerates widgets whose interpreter is gone"""
+    try:
+        return bool(widget.winfo_exists())
+    except tk.TclError:
+        return False
+
+
+    # Function: stop_assistant()
+def stop_assistant():
+    assistant_runtime.pause()
+    speech_stream.stop()
 
 
     # Function: log_out()
 def log_out():
-    global current_user, current_user_email, assistant_stop_event
-    
-    if 'assistant_stop_event' in globals() and assistant_stop_event:
-        assistant_stop_event.set()
+    global current_user, current_user_email
+
+    assistant_runtime.pause()
     
     current_user = None
     current_user_email = None
-    clear_window()
     setup_main_screen()
 
 
@@ -2264,6 +5216,910 @@ def create_password_toggle(parent, entry_widget):
     )
     return toggle_btn
 
+
+    # Function: create_command_input()
+def create_command_input(parent, transcript):
+    """Entry and Send button that submit typed commands to the assistant"""
+    input_frame = tk.Frame(parent, bg=DARK_THEME['bg'])
+
+    command_entry = DarkEntry(input_frame)
+    command_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(0, 10))
+
+    def send(event=None):
+        command = command_entry.get().strip()
+        if command:
+            command_entry.delete(0, tk.END)
+            submit_command(transcript, command)
+
+    command_entry.bind("<Return>", send)
+    DarkButton(input_frame, text="Send", command=send).pack(side=tk.LEFT)
+    return input_frame
+
+# === Replay Functions ===
+
+REPLAY_DRIFT_SHOWN = 10  # changed transcripts listed in a replay report
+
+    # Function: iter_audio_corpus()
+def iter_audio_corpus(path):
+    """Yield (header, frame_data) for every utterance in a corpus written by AudioRecorder"""
+    with gzip.open(path, 'rb') as f:
+        while True:
+            prefix = f.read(AUDIO_FRAME.size)
+            if len(prefix) < AUDIO_FRAME.size:
+                return
+            header = json.loads(f.read(AUDIO_FRAME.unpack(prefix)[0]))
+            size, = AUDIO_FRAME.unpack(f.read(AUDIO_FRAME.size))
+            frame_data = f.read(size)
+            if len(frame_data) < size:
+                raise ValueError(f"{path}: truncated record")
+            yield header, frame_data
+
+
+    # Function: word_error_rate()
+def word_error_rate(reference, hypothesis):
+    """Word-level edit distance divided by the number of reference words"""
+    reference = (reference or "").lower().split()
+    hypothesis = (hypothesis or "").lower().split()
+    bound = max(len(reference), len(hypothesis))
+    return bounded_edit_distance(reference, hypothesis, bound) / max(len(reference), 1)
+
+
+    # Function: replay_audio_corpus()
+def replay_audio_corpus(path, speed=None, recognize=None, dispatch=False):
+    """Push a recorded corpus through listen(), recognition and optionally dispatch with the microphone stubbed
+
+    recognize defaults to Google recognition and can be swapped for another engine. With dispatch,
+    the handlers run for real except REMOTE_DENIED_INTENTS, so a recorded "shutdown computer confirm"
+    or "open ..." never acts on the machine running the replay. Returns
+    latency stats in ms (recorded recognition latency alongside the replayed one, so regressions
+    stand out), the real-time factor and the transcripts that no longer match the recording.
+    """
+    listen_ms, recognition_ms, turn_ms, recorded_ms = [], [], [], []
+    drift, errors, edits, words = [], 0, 0.0, 0
+    audio_seconds = 0.0
+    start = time.perf_counter()
+
+    for header, frame_data in iter_audio_corpus(path):
+        recognizer = sr.Recognizer()
+        recognizer.dynamic_energy_threshold = False
+        recognizer.energy_threshold = header.get('energy_threshold') or recognizer.energy_threshold
+        recognize_audio = recognize or recognizer.recognize_google
+        audio_seconds += len(frame_data) / header['sample_width'] / header['sample_rate']
+        if header.get('recognition_ms') is not None:
+            recorded_ms.append(header['recognition_ms'])
+
+        turn_start = time.perf_counter()
+        with CorpusMicrophone(frame_data, header['sample_rate'], header['sample_width'], speed) as source:
+            audio = recognizer.listen(source, phrase_time_limit=10)
+        captured = time.perf_counter()
+        try:
+            transcript = recognize_audio(audio)
+        except sr.UnknownValueError:
+            transcript = None
+        except sr.RequestError as e:
+            print(f"Recognition service error: {e}")
+            errors += 1
+            continue
+        recognized = time.perf_counter()
+        if dispatch and transcript:
+            intent_runner.run(transcript, cancel_previous=False, denied_intents=REMOTE_DENIED_INTENTS)
+
+        listen_ms.append((captured - turn_start) * 1000)
+        recognition_ms.append((recognized - captured) * 1000)
+        turn_ms.append((time.perf_counter() - turn_start) * 1000)
+        expected = header.get('transcript')
+        reference_words = len((expected or "").split())
+        edits += word_error_rate(expected, transcript) * max(reference_words, 1)
+        words += max(reference_words, 1)
+        if (expected or "").lower() != (transcript or "").lower():
+            drift.append((expected, transcript))
+
+    elapsed = time.perf_counter() - start
+
+    def percentile(values, p):
+        values = sorted(values)
+        return values[min(len(values) - 1, int(len(values) * p))] if values else 0.0
+    return {
+        'utterances': len(turn_ms),
+        'errors': errors,
+        'audio_seconds': audio_seconds,
+        'seconds': elapsed,
+        'realtime_factor': audio_seconds / max(elapsed, 1e-9),
+        'listen_p50_ms': percentile(listen_ms, 0.50),
+        'recognition_p50_ms': percentile(recognition_ms, 0.50),
+        'recognition_p95_ms': percentile(recognition_ms, 0.95),
+        'recorded_recognition_p50_ms': percentile(recorded_ms, 0.50),
+        'turn_p50_ms': percentile(turn_ms, 0.50),
+        'turn_p95_ms': percentile(turn_ms, 0.95),
+        'drift': drift,
+        'word_error_rate': edits / max(words, 1),
+    }
+
+# === Diagnostics Functions ===
+
+SOAK_SAMPLE_EVERY = 100  # cycles between memory samples
+SOAK_PASSWORD = "soak-test-password"
+
+    # Function: run_soak_test()
+def run_soak_test(cycles, sample_every=SOAK_SAMPLE_EVERY, monitor=None, progress=None):
+    """Cycle guest mode, login, every page and logout in a real Tk window against a scratch database
+
+    Speech is muted and the microphone is replaced by silence, so each login still resumes the
+    assistant runtime, which listens and times out like a quiet room. Returns the memory samples
+    and the trends flagged by the last one.
+    """
+    global window, db_manager
+    monitor = monitor or memory_monitor
+    scratch = tempfile.TemporaryDirectory()
+    saved_db = db_manager
+    db_manager = DatabaseManager(os.path.join(scratch.name, "soak.db"))
+    speech_stream.muted = True
+    microphone_cache.selection = {'device_index': None, 'device_name': 'soak', 'energy_threshold': 300}
+    microphone_cache.microphone = CorpusMicrophone(b"", 16000, 2, speed=1.0, trailing_silence=10)
+    try:
+        initialize_database()
+        email = "soak@example.com"
+        db_manager.execute("INSERT INTO users (name, last_name, email, password) VALUES (?, ?, ?, ?)",
+                           ("Soak", "Test", email, ph.hash(SOAK_PASSWORD)))
+        db_manager.commit()
+
+        window = tk.Tk()
+        configure_window()
+        page_manager.attach(window)
+        gui_queue.start(window)
+        monitor.start(window)
+
+        steps = (setup_main_screen, continue_without_account, setup_main_screen,
+                 lambda: login(email, SOAK_PASSWORD), show_settings, show_history, about_me,
+                 logged_in, log_out)
+        trends = {}
+        for cycle in range(1, cycles + 1):
+            for step in steps:
+                step()
+                window.update()
+            if cycle % sample_every == 0 or cycle == cycles:
+                sample, trends = monitor.sample(f"cycle {cycle}")
+                if progress:
+                    progress(cycle, sample, trends)
+        return list(monitor.samples), trends
+    finally:
+        stop_assistant()
+        monitor.stop()
+        speech_stream.muted = False
+        microphone_cache.selection = microphone_cache.microphone = None
+        if window is not None and widget_exists(window):
+            window.destroy()
+        window = None
+        page_manager.pages.clear()
+        db_manager.close()
+        db_manager = saved_db
+        scratch.cleanup()
+
+# === Server Functions ===
+
+SERVER_HOST = "127.0.0.1"  # pass --host 0.0.0.0 to accept LAN clients
+SERVER_PORT = 8765
+SERVER_LINE_LIMIT = 2 ** 16  # bytes per request line
+# Never run for network clients: they act on the machine itself rather than answer a question
+REMOTE_DENIED_INTENTS = frozenset(("lock", "restart", "shutdown", "open", "web_search"))
+SERVER_WORKERS = 8  # executor threads running blocking handlers
+SERVER_MAX_CONNECTIONS = 256
+SERVER_SESSION_INFLIGHT = 4  # pipelined requests per connection
+SERVER_QUEUE_TIMEOUT = 5.0  # seconds a request may wait for a worker before "busy"
+LOAD_TEST_COMMANDS = ("hello", "what is the date", "convert 5 km to m")
+AUDIO_PORT = 8766
+AUDIO_MAX_CONNECTIONS = 32  # concurrent microphone streams
+AUDIO_MAX_BYTES = 16 * 1024 * 1024  # per utterance
+AUDIO_FRAME = struct.Struct(">I")  # length prefix of each audio chunk
+
+    # Function: authenticate_user()
+def authenticate_user(email, password):
+    """The users row for email when password matches, otherwise None"""
+    user = get_user_from_database(str(email or ""))
+    try:
+        if not user or not ph.verify(user[4], str(password or "")):
+            raise VerifyMismatchError()
+    except VerifyMismatchError:
+        return None
+    return user
+
+
+    # Function: handle_server_request()
+def handle_server_request(session, request):
+    """Blocking part of a request, run on the executor: login or dispatch plus history logging"""
+    if request.get("type") == "login":
+        user = authenticate_user(request.get("email", ""), request.get("password", ""))
+        if user is None:
+            return {"ok": False, "error": "Invalid email or password"}
+        session.user_email = user[3]
+        return {"ok": True, "user": f"{user[1]} {user[2]}"}
+
+    if session.user_email is None:
+        return {"ok": False, "error": "Log in first"}
+    if request.get("type") == "stats":
+        return {"ok": True, "stats": intent_runner.summary()}
+
+    command = str(request.get("command", "")).strip()
+    if not command:
+        return {"ok": False, "error": "Empty command"}
+    response = intent_runner.run(command, cancel_previous=False, user_email=session.user_email,
+                                 denied_intents=REMOTE_DENIED_INTENTS)
+    if response is False:
+        response = GOODBYE_MESSAGE
+    log_conversations(session.user_email, [("USER", command), ("BOT", response)])
+    return {"ok": True, "response": response}
+
+
+    # Function: read_request_line()
+async def read_request_line(reader):
+    """Next request line (b"" at end of stream), or None for a line over SERVER_LINE_LIMIT
+
+    An over-long line is skipped up to its newline so the connection stays usable.
+    """
+    try:
+        return await reader.readuntil(b"\n")
+    except asyncio.IncompleteReadError as e:
+        return e.partial
+    except asyncio.LimitOverrunError as e:
+        consumed = e.consumed
+    while True:
+        await reader.readexactly(consumed)
+        try:
+            await reader.readuntil(b"\n")
+            return None
+        except asyncio.LimitOverrunError as e:
+            consumed = e.consumed
+
+
+    # Function: serve_assistant()
+async def serve_assistant(host=SERVER_HOST, port=SERVER_PORT, workers=SERVER_WORKERS,
+                          max_connections=SERVER_MAX_CONNECTIONS, ready=None):
+    """JSON-lines server: one request object per line in, one response object per line out
+
+    Requests are {"id": .., "command": "..."}, {"id": .., "type": "login", "email": .., "password": ..}
+    or {"id": .., "type": "stats"} for the intent handler timeout/cancellation counters. Everything
+    but login is refused until the session has logged in, and commands that control the machine
+    (REMOTE_DENIED_INTENTS) are refused for every session.
+    Responses echo the id and carry "ok", "response" or "error", and "elapsed_ms".
+    """
+    loop = asyncio.get_running_loop()
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="assistant")
+    slots = asyncio.Semaphore(workers)
+    session_ids = itertools.count(1)
+    sessions = {}
+
+    async def run_request(session, request, writer):
+        """Runs with one of the session's in-flight slots, released when the reply is written"""
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(slots.acquire(), SERVER_QUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            reply = {"ok": False, "error": "Server busy"}
+        else:
+            try:
+                reply = await loop.run_in_executor(executor, handle_server_request, session, request)
+            except Exception as e:
+                reply = {"ok": False, "error": f"Handler error: {e}"}
+            finally:
+                slots.release()
+        finally:
+            session.inflight.release()
+        session.commands += 1
+        reply.update(id=request.get("id"), elapsed_ms=round((time.perf_counter() - start) * 1000, 3))
+        if not writer.is_closing():
+            writer.write(json.dumps(reply).encode("utf-8") + b"\n")
+
+    async def handle_connection(reader, writer):
+        peer = writer.get_extra_info("peername")
+        if len(sessions) >= max_connections:
+            writer.write(json.dumps({"ok": False, "error": "Too many connections"}).encode("utf-8") + b"\n")
+            writer.close()
+            return
+
+        session = AssistantSession(next(session_ids), peer, SERVER_SESSION_INFLIGHT)
+        sessions[session.id] = session
+        tasks = set()
+        try:
+            while (line := await read_request_line(reader)) != b"":
+                try:
+                    if line is None:
+                        raise ValueError(f"line longer than {SERVER_LINE_LIMIT} bytes")
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError("request must be an object")
+                except ValueError as e:
+                    writer.write(json.dumps({"ok": False, "error": f"Bad request: {e}"}).encode("utf-8") + b"\n")
+                    continue
+                # Stop reading while the session's pipeline is full, so one client cannot queue unbounded work
+                await session.inflight.acquire()
+                task = asyncio.create_task(run_request(session, request, writer))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                if request.get("type") == "login":
+                    await task  # requests pipelined after a login must see the session's user
+                await writer.drain()
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            sessions.pop(session.id, None)
+            writer.close()
+            print(f"Session {session.id} from {peer} closed after {session.commands} requests")
+
+    server = await asyncio.start_server(handle_connection, host, port, limit=SERVER_LINE_LIMIT)
+    print(f"Assistant server listening on {host}:{port} ({workers} workers, {max_connections} connections)")
+    if ready:
+        ready(server)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+    # Function: run_load_test()
+async def run_load_test(host=SERVER_HOST, port=SERVER_PORT, connections=50, requests_per_connection=100,
+                        commands=LOAD_TEST_COMMANDS, pipeline=1, email=None, password=None):
+    """Drive a server with concurrent connections; returns throughput and latency percentiles
+
+    Each connection logs in as email first, since the server only answers logged-in sessions.
+    """
+    latencies, errors = [], 0
+
+    async def client(client_id):
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            writer.write(json.dumps({"type": "login", "email": email, "password": password}).encode("utf-8") + b"\n")
+            reply = json.loads(await reader.readline())
+            if not reply.get("ok"):
+                raise ConnectionError(f"login failed: {reply.get('error')}")
+            pending = {}
+            for i in range(requests_per_connection):
+                pending[i] = time.perf_counter()
+                request = {"id": i, "command": commands[(client_id + i) % len(commands)]}
+                writer.write(json.dumps(request).encode("utf-8") + b"\n")
+                if len(pending) >= pipeline:
+                    await collect(reader, pending)
+            while pending:
+                await collect(reader, pending)
+        finally:
+            writer.close()
+
+    async def collect(reader, pending):
+        nonlocal errors
+        line = await reader.readline()
+        if not line:
+            raise ConnectionError("server closed the connection")
+        reply = json.loads(line)
+        latencies.append((time.perf_counter() - pending.pop(reply.get("id"), time.perf_counter())) * 1000)
+        errors += not reply.get("ok")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(i) for i in range(connections)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] if latencies else 0.0
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'seconds': elapsed,
+        'rps': len(latencies) / max(elapsed, 1e-9),
+        'p50_ms': percentile(0.50),
+        'p95_ms': percentile(0.95),
+        'p99_ms': percentile(0.99),
+    }
+
+    # Function: recognize_audio_stream()
+def recognize_audio_stream(header, buffer, user_email):
+    """Blocking part of an audio stream: recognise the utterance in buffer and dispatch it"""
+    recognizer = sr.Recognizer()
+    if header["format"] == "flac":
+        with sr.AudioFile(io.BytesIO(buffer)) as source:
+            audio = recognizer.record(source)
+    else:
+        # AudioData accepts the bytearray as-is, so the frames are never joined or copied again
+        audio = sr.AudioData(buffer, header["sample_rate"], header["sample_width"])
+
+    try:
+        transcript = recognizer.recognize_google(audio)
+    except sr.UnknownValueError:
+        return {"ok": False, "error": "Could not understand the audio"}
+    except sr.RequestError as e:
+        return {"ok": False, "error": f"Recognition service error: {e}"}
+
+    response = intent_runner.run(transcript, cancel_previous=False, user_email=user_email,
+                                 denied_intents=REMOTE_DENIED_INTENTS)
+    if response is False:
+        response = GOODBYE_MESSAGE
+    log_conversations(user_email, [("USER", transcript), ("BOT", response)])
+    return {"ok": True, "transcript": transcript, "response": response}
+
+
+    # Function: read_audio_header()
+def read_audio_header(line):
+    """Validate the JSON header that opens an audio stream"""
+    header = json.loads(line)
+    if not isinstance(header, dict) or header.get("format") not in ("pcm", "flac"):
+        raise ValueError("format must be 'pcm' or 'flac'")
+    if header["format"] == "pcm":
+        header["sample_rate"] = int(header.get("sample_rate", 16000))
+        header["sample_width"] = int(header.get("sample_width", 2))
+        if header["sample_width"] not in (1, 2, 3, 4) or not 8000 <= header["sample_rate"] <= 96000:
+            raise ValueError("unsupported sample rate or width")
+        if int(header.get("channels", 1)) != 1:
+            raise ValueError("PCM audio must be mono")
+    return header
+
+
+    # Function: serve_audio()
+async def serve_audio(host=SERVER_HOST, port=AUDIO_PORT, workers=SERVER_WORKERS,
+                      max_connections=AUDIO_MAX_CONNECTIONS, ready=None):
+    """Audio ingestion endpoint for remote microphones
+
+    A stream starts with one JSON header line ({"format": "pcm", "sample_rate": 16000,
+    "sample_width": 2} or {"format": "flac"}, plus the account's "email" and "password"),
+    followed by frames of a 4-byte big-endian length and that many audio bytes. A zero-length
+    frame ends an utterance and the server answers with one JSON line; an empty utterance (or
+    closing the socket) ends the stream. As in serve_assistant(), REMOTE_DENIED_INTENTS are refused.
+    """
+    loop = asyncio.get_running_loop()
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="audio")
+    slots = asyncio.Semaphore(workers)
+    streams = 0
+
+    async def handle_stream(reader, writer):
+        nonlocal streams
+        peer = writer.get_extra_info("peername")
+        if streams >= max_connections:
+            writer.write(json.dumps({"ok": False, "error": "Too many connections"}).encode("utf-8") + b"\n")
+            writer.close()
+            return
+
+        streams += 1
+        utterances = 0
+        try:
+            header = read_audio_header(await reader.readline())
+            user = await loop.run_in_executor(executor, authenticate_user, header.get("email"), header.get("password"))
+            if user is None:
+                writer.write(json.dumps({"ok": False, "error": "Invalid email or password"}).encode("utf-8") + b"\n")
+                return
+            while True:
+                buffer = bytearray()
+                while True:
+                    size, = AUDIO_FRAME.unpack(await reader.readexactly(AUDIO_FRAME.size))
+                    if size == 0:
+                        break
+                    if len(buffer) + size > AUDIO_MAX_BYTES:
+                        raise ValueError(f"utterance longer than {AUDIO_MAX_BYTES} bytes")
+                    buffer += await reader.readexactly(size)
+                if not buffer:
+                    break
+
+                start = time.perf_counter()
+                async with slots:
+                    try:
+                        reply = await loop.run_in_executor(executor, recognize_audio_stream, header, buffer, user[3])
+                    except Exception as e:
+                        reply = {"ok": False, "error": f"Audio error: {e}"}
+                utterances += 1
+                reply["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 3)
+                writer.write(json.dumps(reply).encode("utf-8") + b"\n")
+                await writer.drain()
+        except asyncio.IncompleteReadError:
+            pass  # client went away mid-stream
+        except (ValueError, struct.error) as e:
+            writer.write(json.dumps({"ok": False, "error": f"Bad stream: {e}"}).encode("utf-8") + b"\n")
+        except ConnectionError:
+            pass
+        finally:
+            streams -= 1
+            writer.close()
+            print(f"Audio stream from {peer} closed after {utterances} utterances")
+
+    server = await asyncio.start_server(handle_stream, host, port)
+    print(f"Audio endpoint listening on {host}:{port}")
+    if ready:
+        ready(server)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+    # Function: replay_audio()
+async def replay_audio(path, host=SERVER_HOST, port=AUDIO_PORT, chunk_ms=100, realtime=False, email=None, password=None):
+    """Stream a mono WAV file to the audio endpoint as one utterance; returns (reply, latency ms)"""
+    with wave.open(path, "rb") as wav:
+        if wav.getnchannels() != 1:
+            raise ValueError(f"{path}: only mono WAV files can be replayed")
+        header = {"format": "pcm", "sample_rate": wav.getframerate(), "sample_width": wav.getsampwidth(),
+                  "email": email, "password": password}
+        frames_per_chunk = max(1, wav.getframerate() * chunk_ms // 1000)
+        chunks = list(iter(lambda: wav.readframes(frames_per_chunk), b""))
+
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        writer.write(json.dumps(header).encode("utf-8") + b"\n")
+        for chunk in chunks:
+            writer.write(AUDIO_FRAME.pack(len(chunk)) + chunk)
+            await writer.drain()
+            if realtime:
+                await asyncio.sleep(chunk_ms / 1000)
+        sent = time.perf_counter()
+        writer.write(AUDIO_FRAME.pack(0) + AUDIO_FRAME.pack(0))  # end utterance, then end stream
+        reply = json.loads(await reader.readline())
+        return reply, (time.perf_counter() - sent) * 1000
+    finally:
+        writer.close()
+
+# === Command Line Interface ===
+
+    # Function: cli_export_history()
+def cli_export_history(args):
+    start = time.perf_counter()
+    count = export_conversations(args.path, args.format, args.user, args.batch_size,
+                                 progress=lambda done, total: print_progress("Exported", done, total))
+    elapsed = time.perf_counter() - start
+    print(f"\nExported {count} rows to {args.path} in {elapsed:.2f}s ({count / max(elapsed, 1e-9):.0f} rows/s)")
+    return 0
+
+
+    # Function: cli_import_history()
+def cli_import_history(args):
+    start = time.perf_counter()
+    errors = []
+    try:
+        count = import_conversations(args.path, args.format, args.user, args.batch_size,
+                                     progress=lambda done: print_progress("Imported", done), errors=errors)
+    except sqlite3.IntegrityError as e:
+        print(f"\nImport failed: {e} (the user accounts referenced by the file must exist)")
+        return 1
+    elapsed = time.perf_counter() - start
+    print()
+    for number, reason in errors:
+        print(f"line {number}: {reason}")
+    print(f"Imported {count} rows from {args.path} in {elapsed:.2f}s ({count / max(elapsed, 1e-9):.0f} rows/s), "
+          f"{len(errors)} lines skipped")
+    return 1 if errors else 0
+
+
+    # Function: cli_migrate()
+def cli_migrate(args):
+    print(f"\nDatabase schema is at version {get_schema_version()}")
+    return 0
+
+
+    # Function: cli_batch()
+def cli_batch(args):
+    if args.user and UserProfile.load(args.user) is None:
+        print(f"Error: no account is registered with {args.user}")
+        return 1
+    stream = sys.stdin if args.path == "-" else open(args.path, encoding="utf-8")
+    try:
+        commands = [line.strip() for line in stream if line.strip() and not line.lstrip().startswith("#")]
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+    start = time.perf_counter()
+    results = run_command_batch(commands, args.workers, args.user, args.allow_machine_control)
+    elapsed = time.perf_counter() - start
+
+    for command, response in results:
+        print(f"> {command}\n{response}\n")
+    refused = sum(response == REMOTE_DENIED_MESSAGE for _, response in results)
+    if refused:
+        print(f"Refused {refused} machine control commands; pass --allow-machine-control to run them")
+    print(f"Ran {len(results)} commands with {args.workers} workers in {elapsed:.2f}s "
+          f"({len(results) / max(elapsed, 1e-9):.1f} commands/s)")
+    totals = intent_runner.summary().get("all", {})
+    print(f"Handler timeouts: {totals.get('timeouts', 0)}, errors: {totals.get('errors', 0)}")
+    return 0
+
+
+    # Function: cli_build_wiki_index()
+def cli_build_wiki_index(args):
+    start = time.perf_counter()
+    count = build_knowledge_pack(args.source, args.output, args.redirects, args.batch_size,
+                                 progress=lambda done: print_progress("Indexed", done))
+    elapsed = time.perf_counter() - start
+    print(f"\nIndexed {count} abstracts into {args.output} in {elapsed:.2f}s")
+    return 0
+
+
+    # Function: cli_bench_wiki_index()
+def cli_bench_wiki_index(args):
+    queries = None
+    if args.queries:
+        with open(args.queries, encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+    stats = benchmark_knowledge_pack(queries, args.count)
+    print(f"{stats['queries']} lookups, {stats['hits']} hits: mean {stats['mean_ms']:.3f} ms, "
+          f"p50 {stats['p50_ms']:.3f} ms, p95 {stats['p95_ms']:.3f} ms")
+    return 0
+
+
+    # Function: cli_build_lexicon()
+def cli_build_lexicon(args):
+    start = time.perf_counter()
+    count = build_lexicon(args.sources, args.output, progress=lambda done: print_progress("Compiled", done))
+    elapsed = time.perf_counter() - start
+    size = os.path.getsize(args.output)
+    print(f"\nCompiled {count} words into {args.output} ({size / 1024 / 1024:.1f} MiB) in {elapsed:.2f}s")
+    return 0
+
+
+    # Function: cli_serve()
+def cli_serve(args):
+    async def serve():
+        servers = [serve_assistant(args.host, args.port, args.workers, args.max_connections)]
+        if args.audio_port:
+            servers.append(serve_audio(args.host, args.audio_port, args.workers, args.max_audio_connections))
+        await asyncio.gather(*servers)
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        print("\nServer stopped")
+    return 0
+
+
+    # Function: cli_load_test()
+def cli_load_test(args):
+    stats = asyncio.run(run_load_test(args.host, args.port, args.connections, args.requests,
+                                      args.commands or LOAD_TEST_COMMANDS, args.pipeline,
+                                      args.email, os.environ.get("VOICE_ASSISTANT_PASSWORD")))
+    print(f"{stats['requests']} requests ({stats['errors']} errors) in {stats['seconds']:.2f}s: "
+          f"{stats['rps']:.0f} req/s, p50 {stats['p50_ms']:.2f} ms, p95 {stats['p95_ms']:.2f} ms, "
+          f"p99 {stats['p99_ms']:.2f} ms")
+    return 0 if stats['errors'] == 0 else 1
+
+
+    # Function: cli_replay_audio()
+def cli_replay_audio(args):
+    async def replay_all():
+        password = os.environ.get("VOICE_ASSISTANT_PASSWORD")
+        return await asyncio.gather(*(replay_audio(path, args.host, args.port, args.chunk_ms, args.realtime,
+                                                   args.email, password)
+                                      for path in args.paths), return_exceptions=True)
+
+    failures = 0
+    for path, result in zip(args.paths, asyncio.run(replay_all())):
+        if isinstance(result, Exception):
+            failures += 1
+            print(f"{path}: {result}")
+            continue
+        reply, latency = result
+        failures += not reply.get("ok")
+        print(f"{path}: {reply.get('transcript') or reply.get('error')} -> {reply.get('response', '')} "
+              f"({latency:.0f} ms after the last chunk)")
+    return 0 if failures == 0 else 1
+
+
+    # Function: cli_replay_corpus()
+def cli_replay_corpus(args):
+    stats = replay_audio_corpus(args.path, args.speed, dispatch=args.dispatch)
+    print(f"Replayed {stats['utterances']} utterances ({stats['audio_seconds']:.1f}s of audio) in "
+          f"{stats['seconds']:.2f}s, {stats['realtime_factor']:.1f}x real time, {stats['errors']} errors")
+    print(f"listen p50 {stats['listen_p50_ms']:.1f} ms, recognition p50 {stats['recognition_p50_ms']:.1f} ms "
+          f"(recorded {stats['recorded_recognition_p50_ms']:.1f} ms), p95 {stats['recognition_p95_ms']:.1f} ms")
+    print(f"turn p50 {stats['turn_p50_ms']:.1f} ms, p95 {stats['turn_p95_ms']:.1f} ms")
+    print(f"Transcript drift: {len(stats['drift'])} changed, word error rate {stats['word_error_rate']:.1%}")
+    for expected, transcript in stats['drift'][:REPLAY_DRIFT_SHOWN]:
+        print(f"  {expected!r} -> {transcript!r}")
+    return 0 if stats['errors'] == 0 else 1
+
+
+    # Function: cli_soak_test()
+def cli_soak_test(args):
+    def progress(cycle, sample, trends):
+        print(f"cycle {cycle}: {sample['traced_bytes'] / 1024 / 1024:.2f} MiB traced, "
+              f"{sample['widgets']} widgets, {sample['threads']} threads"
+              + (f", growing: {', '.join(trends)}" if trends else ""))
+
+    monitor = MemoryMonitor(args.output)
+    try:
+        samples, trends = run_soak_test(args.cycles, args.sample_every, monitor, progress)
+    except tk.TclError as e:
+        print(f"Soak test needs a display: {e}")
+        return 1
+    print(f"{len(samples)} samples written to {args.output}")
+    if trends:
+        print(f"Still growing at the end: {', '.join(trends)}")
+    return 1 if trends else 0
+
+
+    # Function: cli_provision_users()
+def cli_provision_users(args):
+    start = time.perf_counter()
+    created, duplicates, errors = provision_users(args.path, args.format, args.workers, args.batch_size,
+                                                  progress=lambda done: print_progress("Created", done))
+    elapsed = time.perf_counter() - start
+    print()
+    for number, email in duplicates:
+        print(f"record {number}: {email} already exists" if number else f"skipped: {email}")
+    for number, email, reason in errors:
+        print(f"record {number}: {email or '(no email)'}: {reason}")
+    print(f"Created {created} accounts in {elapsed:.2f}s ({created / max(elapsed, 1e-9):.1f} accounts/s), "
+          f"{len(duplicates)} duplicates, {len(errors)} errors")
+    return 1 if errors else 0
+
+
+    # Function: cli_usage_report()
+def cli_usage_report(args):
+    usage_recorder.flush()
+    query = "SELECT name, turns, failure_pct, avg_ms, max_ms, slow_turns FROM usage_report WHERE scope = ?"
+    order = " ORDER BY name DESC" if args.scope == "day" else " ORDER BY turns DESC"
+    rows = db_manager.execute(query + order + " LIMIT ?", (args.scope, args.limit)).fetchall()
+    if not rows:
+        print("No usage recorded yet")
+        return 0
+
+    width = max(len(str(row[0])) for row in rows + [(args.scope,)])
+    print(f"{args.scope:<{width}}  {'turns':>7}  {'fail %':>6}  {'avg ms':>8}  {'max ms':>8}  {'slow':>5}")
+    for name, turns, failure_pct, avg_ms, max_ms, slow_turns in rows:
+        print(f"{name:<{width}}  {turns:>7}  {failure_pct:>6.1f}  {avg_ms:>8.1f}  {max_ms:>8.1f}  {slow_turns:>5}")
+    return 0
+
+
+    # Function: cli_search_history()
+def cli_search_history(args):
+    if not history_index.available():
+        print("Searching history requires the optional 'numpy' package")
+        return 1
+    start = time.perf_counter()
+    added = history_index.sync(progress=lambda done: print_progress("Indexed", done))
+    if added:
+        print(f"\nIndexed {added} new messages in {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    results = history_index.search(args.queries, args.user, args.k)
+    elapsed = (time.perf_counter() - start) * 1000
+    for query, hits in zip(args.queries, results):
+        print(f"> {query}")
+        for row_id, score in hits:
+            message = db_manager.execute("SELECT message FROM conversations WHERE id = ?", (row_id,)).fetchone()
+            print(f"  {score:.2f}  {message[0] if message else '(deleted)'}")
+    print(f"{len(args.queries)} queries over {history_index.count} messages in {elapsed:.1f} ms")
+    return 0
+
+
+    # Function: build_cli_parser()
+def build_cli_parser():
+    """Build the argument parser for the maintenance commands"""
+    parser = argparse.ArgumentParser(
+        prog="Voice_Assistant.py",
+        description="Voice Assistant maintenance commands. Run without arguments to start the GUI."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export-history", help="Export conversation history to JSONL, CSV or Parquet")
+    export_parser.add_argument("path", help="Output file (.jsonl, .csv or .parquet)")
+    export_parser.add_argument("--format", choices=["jsonl", "csv", "parquet"], help="Override the format detected from the extension")
+    export_parser.add_argument("--user", help="Only export the history of this email")
+    export_parser.add_argument("--batch-size", type=int, default=TRANSFER_BATCH_SIZE)
+    export_parser.set_defaults(handler=cli_export_history)
+
+    import_parser = subparsers.add_parser("import-history", help="Import conversation history from JSONL, CSV or Parquet")
+    import_parser.add_argument("path", help="Input file (.jsonl, .csv or .parquet)")
+    import_parser.add_argument("--format", choices=["jsonl", "csv", "parquet"], help="Override the format detected from the extension")
+    import_parser.add_argument("--user", help="Assign every imported row to this email")
+    import_parser.add_argument("--batch-size", type=int, default=TRANSFER_BATCH_SIZE)
+    import_parser.set_defaults(handler=cli_import_history)
+
+    provision_parser = subparsers.add_parser("provision-users", help="Create accounts in bulk from CSV or JSONL")
+    provision_parser.add_argument("path", help="File with name, last_name, email and password columns")
+    provision_parser.add_argument("--format", choices=["jsonl", "csv"], help="Override the format detected from the extension")
+    provision_parser.add_argument("--workers", type=int, help="Hashing processes (default: CPU count)")
+    provision_parser.add_argument("--batch-size", type=int, default=PROVISION_BATCH_SIZE)
+    provision_parser.set_defaults(handler=cli_provision_users)
+
+    batch_parser = subparsers.add_parser("batch", help="Run typed commands from a file or stdin without audio")
+    batch_parser.add_argument("path", nargs="?", default="-", help="File with one command per line, '-' for stdin")
+    batch_parser.add_argument("--workers", type=int, default=BATCH_WORKERS, help="Commands run concurrently")
+    batch_parser.add_argument("--user", help="Log the commands and responses to this email's history")
+    batch_parser.add_argument("--allow-machine-control", action="store_true",
+                              help="Also run open, lock, restart, shutdown and web search commands")
+    batch_parser.set_defaults(handler=cli_batch)
+
+    wiki_parser = subparsers.add_parser("build-wiki-index", help="Build the offline Wikipedia abstracts index")
+    wiki_parser.add_argument("source", help="Abstract dump (.xml or .xml.gz) or JSONL with title/abstract/redirects")
+    wiki_parser.add_argument("--redirects", help="TSV file of redirect<TAB>target titles")
+    wiki_parser.add_argument("--output", default=knowledge_pack.path)
+    wiki_parser.add_argument("--batch-size", type=int, default=KNOWLEDGE_BATCH_SIZE)
+    wiki_parser.set_defaults(handler=cli_build_wiki_index)
+
+    bench_parser = subparsers.add_parser("bench-wiki-index", help="Measure offline Wikipedia lookup latency")
+    bench_parser.add_argument("--queries", help="File with one query per line (default: sampled titles)")
+    bench_parser.add_argument("--count", type=int, default=200, help="Number of sampled titles")
+    bench_parser.set_defaults(handler=cli_bench_wiki_index)
+
+    lexicon_parser = subparsers.add_parser("build-lexicon", help="Compile the offline dictionary used by 'define'")
+    lexicon_parser.add_argument("sources", nargs="+", help="WordNet dict/ directory or JSONL of dictionary entries")
+    lexicon_parser.add_argument("--output", default=lexicon.path)
+    lexicon_parser.set_defaults(handler=cli_build_lexicon)
+
+    serve_parser = subparsers.add_parser("serve", help="Serve text commands to network clients (JSON lines over TCP)")
+    serve_parser.add_argument("--host", default=SERVER_HOST, help="Interface to listen on (0.0.0.0 for every interface)")
+    serve_parser.add_argument("--port", type=int, default=SERVER_PORT)
+    serve_parser.add_argument("--workers", type=int, default=SERVER_WORKERS, help="Handlers running at once")
+    serve_parser.add_argument("--max-connections", type=int, default=SERVER_MAX_CONNECTIONS)
+    serve_parser.add_argument("--audio-port", type=int, help="Also accept PCM/FLAC streams from remote microphones")
+    serve_parser.add_argument("--max-audio-connections", type=int, default=AUDIO_MAX_CONNECTIONS)
+    serve_parser.set_defaults(handler=cli_serve)
+
+    load_parser = subparsers.add_parser("load-test", help="Measure a running server's throughput and latency")
+    load_parser.add_argument("--host", default=SERVER_HOST)
+    load_parser.add_argument("--port", type=int, default=SERVER_PORT)
+    load_parser.add_argument("--email", required=True, help="Account to log in as (password from VOICE_ASSISTANT_PASSWORD)")
+    load_parser.add_argument("--connections", type=int, default=50)
+    load_parser.add_argument("--requests", type=int, default=100, help="Requests per connection")
+    load_parser.add_argument("--pipeline", type=int, default=1, help="Requests in flight per connection")
+    load_parser.add_argument("--command", dest="commands", action="append", help="Command to send (repeatable)")
+    load_parser.set_defaults(handler=cli_load_test)
+
+    replay_parser = subparsers.add_parser("replay-audio", help="Stream WAV files to a server's audio endpoint")
+    replay_parser.add_argument("paths", nargs="+", help="Mono WAV files, streamed concurrently")
+    replay_parser.add_argument("--host", default=SERVER_HOST)
+    replay_parser.add_argument("--port", type=int, default=AUDIO_PORT)
+    replay_parser.add_argument("--email", required=True, help="Account to log in as (password from VOICE_ASSISTANT_PASSWORD)")
+    replay_parser.add_argument("--chunk-ms", type=int, default=100)
+    replay_parser.add_argument("--realtime", action="store_true", help="Pace chunks like a live microphone")
+    replay_parser.set_defaults(handler=cli_replay_audio)
+
+    corpus_parser = subparsers.add_parser("replay-corpus", help="Replay recorded utterances and report latency and drift")
+    corpus_parser.add_argument("path", help="Corpus recorded with VOICE_ASSISTANT_RECORD set")
+    corpus_parser.add_argument("--speed", type=float, help="Playback speed, 1.0 is real time (default: unpaced)")
+    corpus_parser.add_argument("--dispatch", action="store_true",
+                               help="Also run the command handlers (machine control commands are refused)")
+    corpus_parser.set_defaults(handler=cli_replay_corpus)
+
+    soak_parser = subparsers.add_parser("soak-test", help="Cycle login, logout and page navigation while sampling memory")
+    soak_parser.add_argument("--cycles", type=int, default=2000)
+    soak_parser.add_argument("--sample-every", type=int, default=SOAK_SAMPLE_EVERY, help="Cycles between memory samples")
+    soak_parser.add_argument("--output", default=memory_monitor.directory, help="Directory for the memory reports")
+    soak_parser.set_defaults(handler=cli_soak_test)
+
+    history_parser = subparsers.add_parser("search-history", help="Find past messages by meaning with the local history index")
+    history_parser.add_argument("queries", nargs="+", help="Searched together as one batch")
+    history_parser.add_argument("--user", required=True, help="Email whose history is searched")
+    history_parser.add_argument("-k", type=int, default=HISTORY_TOP_K, help="Results per query")
+    history_parser.set_defaults(handler=cli_search_history)
+
+    usage_parser = subparsers.add_parser("usage-report", help="Show turns, latency and failure rates from the usage summaries")
+    usage_parser.add_argument("--scope", choices=["user", "intent", "day"], default="intent")
+    usage_parser.add_argument("--limit", type=int, default=30, help="Rows shown (days are newest first)")
+    usage_parser.set_defaults(handler=cli_usage_report)
+
+    migrate_parser = subparsers.add_parser("migrate", help="Upgrade the database schema to the latest version")
+    migrate_parser.set_defaults(handler=cli_migrate)
+
+    return parser
+
+
+    # Function: run_cli()
+def run_cli(argv):
+    """Run a maintenance command against the local database"""
+    args = build_cli_parser().parse_args(argv)
+    try:
+        initialize_database(progress=lambda done, total: print_progress("Migrating", done, total))
+        return args.handler(args)
+    except (ValueError, OSError, sqlite3.Error) as e:
+        print(f"Error: {e}")
+        return 1
+    finally:
+        usage_recorder.stop()
+        usage_recorder.flush()
+        history_index.save()
+        db_manager.close()
+        knowledge_pack.close()
+        lexicon.close()
+
 # === Main Guard ===
 if platform.system() == "Linux":
     try:
@@ -2272,6 +6128,9 @@ if platform.system() == "Linux":
         pass
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        sys.exit(run_cli(sys.argv[1:]))
+
     try:
         db_manager = DatabaseManager('user.db')
         if not initialize_database():
@@ -2282,6 +6141,7 @@ if __name__ == "__main__":
         
         # Create main window
         window = tk.Tk()
+        gui_queue.start(window)
 
         if platform.system() == "Linux":
             try:
@@ -2292,6 +6152,14 @@ if __name__ == "__main__":
                 pass
 
         configure_window()
+        page_manager.attach(window)
+        microphone_cache.start_watcher()
+        news_refresher.start()
+        weather_cache.start()
+        app_index.start()
+        if os.environ.get("VOICE_ASSISTANT_DIAGNOSTICS"):
+            # Value is the sampling interval in seconds, reports go to ~/.voice_assistant/diagnostics
+            memory_monitor.start(window, float(os.environ["VOICE_ASSISTANT_DIAGNOSTICS"]))
         def delayed_start():
             setup_main_screen()
             window.attributes('-topmost', 1)  # Bring to front
@@ -2301,8 +6169,18 @@ if __name__ == "__main__":
         
         def on_closing():
             try:
-                if 'assistant_stop_event' in globals() and assistant_stop_event:
-                    assistant_stop_event.set()
+                assistant_runtime.shutdown()
+                print(f"Assistant runtime stats: {assistant_runtime.stats()}")
+                microphone_cache.stop_watcher()
+                news_refresher.stop()
+                weather_cache.stop()
+                print(f"Intent handler stats: {intent_runner.summary()}")
+                app_index.stop()
+                audio_recorder.close()
+                memory_monitor.stop()
+                usage_recorder.stop()
+                usage_recorder.flush()
+                history_index.save()
                 if 'db_manager' in globals():
                     db_manager.close()
                 if 'engine' in globals():
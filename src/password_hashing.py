@@ -0,0 +1,37 @@
+"""Argon2 password hashing on a process pool
+
+Voice_Assistant.py starts the speech engine and builds the app's runtime objects when it is
+imported, so it cannot be what pool workers load. Spawned workers (the only start method on
+Windows and macOS) re-run their parent's main module; hashing_pool() points them at this
+module instead, so each worker imports argon2 and nothing else.
+"""
+from contextlib import contextmanager
+import concurrent.futures
+import multiprocessing
+import sys
+
+from argon2 import PasswordHasher
+
+ph = PasswordHasher()
+
+
+# Function: hash_password()
+def hash_password(password):
+    """ph.hash() as a module-level function, so process pool workers can run it"""
+    return ph.hash(password)
+
+
+# Function: hashing_pool()
+@contextmanager
+def hashing_pool(workers):
+    """A spawn ProcessPoolExecutor whose workers start from this module rather than the caller's script"""
+    main = sys.modules['__main__']
+    main_spec = getattr(main, '__spec__', None)
+    # Spawned children import the parent's main module by its spec name when it has one
+    main.__spec__ = __spec__
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers,
+                                                    mp_context=multiprocessing.get_context("spawn")) as executor:
+            yield executor
+    finally:
+        main.__spec__ = main_spec
@@ -3,11 +3,37 @@ Voice Assistant Comprehensive Test Suite
 This file contains unit tests for all major components of the Voice Assistant application.
 """
 
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
 import unittest
+import wave
+import xml.etree.ElementTree as ET
 from unittest.mock import patch, MagicMock
 import sqlite3
 import tkinter as tk
 from src.Voice_Assistant import DatabaseManager, DarkButton, convert_units, get_current_user_info, ph
+from src.password_hashing import hashing_pool
+from src.Voice_Assistant import (
+    detect_history_format, export_conversations, import_conversations,
+    initialize_database, log_conversation, migrate_create_tables, migrate_database,
+    get_schema_version, SPEAKER_CODES, ConversationTranscript, GuiUpdateQueue, PageManager,
+    MicrophoneCache, dispatch_command, run_command_batch, PhraseAudioCache,
+    SpeechStream, normalize_speech_text, split_sentences, KnowledgePack, build_knowledge_pack,
+    iter_abstract_records, search_wikipedia, Lexicon, build_lexicon, simplify_word_meaning, NewsRefresher,
+    get_news_summaries, WeatherCache, extract_weather_city, get_favorite_cities, ApplicationIndex,
+    open_application, FuzzyIndex, CommandCorrector, bounded_edit_distance, serve_assistant,
+    run_load_test, serve_audio, replay_audio, IntentRunner, INTENT_TIMEOUT_MESSAGE,
+    AudioRecorder, iter_audio_corpus, replay_audio_corpus, word_error_rate, MemoryMonitor,
+    thread_kind, AssistantRuntime, CorpusMicrophone, UserProfile, update_user_info, provision_users,
+    UsageRecorder, REMOTE_DENIED_MESSAGE, cli_batch, CACHED_PHRASES, phrase_cache, HistoryIndex, recall_history, classify_intent, np
+)
 from argon2.exceptions import VerifyMismatchError
 
 
@@ -207,6 +233,1320 @@ class TestErrorHandling(unittest.TestCase):
         result = get_weather("InvalidCity")
         self.assertIsNone(result)  # Verify None return on failure
 
+# ======================================================================================
+# History Transfer Tests
+# ======================================================================================
+class TestHistoryTransfer(unittest.TestCase):
+    """Tests for streaming export and import of conversation history"""
+
+    def setUp(self):
+        """Create an in-memory database with a user and a few conversation rows"""
+        self.db = DatabaseManager(':memory:')
+        self.db.connect()
+        self.patcher = patch('src.Voice_Assistant.db_manager', self.db)
+        self.patcher.start()
+        initialize_database()
+        self.db.execute("INSERT INTO users (name, email, password) VALUES (?, ?, ?)",
+                        ("Alice", "alice@test.com", "hash"))
+        for i in range(7):
+            log_conversation("alice@test.com", "USER" if i % 2 == 0 else "BOT", f"message {i}")
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def roundtrip(self, filename):
+        """Export to a file, clear the table and import it back"""
+        path = os.path.join(self.tmpdir.name, filename)
+        self.assertEqual(export_conversations(path, batch_size=3), 7)
+        self.db.execute("DELETE FROM conversations")
+        self.assertEqual(import_conversations(path, batch_size=3), 7)
+        return self.db.execute("SELECT speaker, message FROM conversations ORDER BY id").fetchall()
+
+    def test_jsonl_roundtrip(self):
+        """JSONL export and import preserve every row in order"""
+        rows = self.roundtrip("history.jsonl")
+        self.assertEqual(rows[0], (SPEAKER_CODES["USER"], "message 0"))
+        self.assertEqual(rows[-1], (SPEAKER_CODES["USER"], "message 6"))
+
+    def test_csv_roundtrip(self):
+        """CSV export and import preserve every row in order"""
+        rows = self.roundtrip("history.csv")
+        self.assertEqual([msg for _, msg in rows], [f"message {i}" for i in range(7)])
+
+    def test_unknown_format(self):
+        """Unsupported file extensions are rejected"""
+        with self.assertRaises(ValueError):
+            detect_history_format("history.xml")
+
+    def test_malformed_lines_are_reported_per_row(self):
+        """Bad JSONL lines are skipped with their line numbers and the rest still imports"""
+        path = os.path.join(self.tmpdir.name, "history.jsonl")
+        good = {"user_email": "alice@test.com", "timestamp": "2024-01-01 00:00:00",
+                "speaker": "USER", "message": "kept"}
+        with open(path, 'wb') as f:
+            f.write(json.dumps(good).encode() + b"\n{not json\n[1, 2]\n\xff\xfe\n\n"
+                    + json.dumps(dict(good, message="also kept")).encode() + b"\n")
+        self.db.execute("DELETE FROM conversations")
+        errors = []
+        self.assertEqual(import_conversations(path, errors=errors), 2)
+        self.assertEqual([number for number, _ in errors], [2, 3, 4])
+        self.assertIn("JSON object", errors[1][1])
+        messages = [m for (m,) in self.db.execute("SELECT message FROM conversations ORDER BY id")]
+        self.assertEqual(messages, ["kept", "also kept"])
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+        self.patcher.stop()
+        self.db.close()
+
+# ======================================================================================
+# Schema Migration Tests
+# ======================================================================================
+class TestSchemaMigration(unittest.TestCase):
+    """Tests for the PRAGMA user_version driven schema migrations"""
+
+    def setUp(self):
+        """Create a version 1 database holding legacy text-keyed conversations"""
+        self.db = DatabaseManager(':memory:')
+        self.db.connect()
+        self.patcher = patch('src.Voice_Assistant.db_manager', self.db)
+        self.patcher.start()
+        migrate_create_tables()
+        self.db.execute("PRAGMA user_version = 1")
+        self.db.execute("INSERT INTO users (name, email, password) VALUES (?, ?, ?)",
+                        ("Alice", "alice@test.com", "hash"))
+        self.db.execute(
+            "INSERT INTO conversations (user_email, timestamp, speaker, message) VALUES (?, ?, ?, ?)",
+            ("alice@test.com", "2025-01-02 03:04:05", "USER", "hello")
+        )
+        self.db.execute(
+            "INSERT INTO conversations (user_email, timestamp, speaker, message) VALUES (?, ?, ?, ?)",
+            ("alice@test.com", "2025-01-02 03:04:06", "BOT", "Hello! How can I help you today?")
+        )
+
+    def test_compact_layout(self):
+        """Legacy rows are converted to user_id, speaker code and epoch timestamp"""
+        with patch('builtins.print'):
+            self.assertEqual(migrate_database(), 3)
+        rows = self.db.execute("SELECT user_id, timestamp, speaker, message FROM conversations ORDER BY id").fetchall()
+        self.assertEqual(rows[0], (1, 1735787045, SPEAKER_CODES["USER"], "hello"))
+        self.assertEqual(rows[1][2], SPEAKER_CODES["BOT"])
+
+    def test_migration_is_idempotent(self):
+        """Running the migrations twice leaves the schema version and data unchanged"""
+        with patch('builtins.print'):
+            migrate_database()
+            migrate_database()
+        self.assertEqual(get_schema_version(), 3)
+        self.assertEqual(self.db.execute("SELECT COUNT(*) FROM conversations").fetchone()[0], 2)
+
+    def tearDown(self):
+        self.patcher.stop()
+        self.db.close()
+
+# ======================================================================================
+# Conversation Transcript Tests
+# ======================================================================================
+class TestConversationTranscript(unittest.TestCase):
+    """Tests for the bounded live transcript behind the conversation area"""
+
+    def setUp(self):
+        """Use mock widgets so the ring buffer logic runs without a display"""
+        self.widget = MagicMock()
+        self.status = MagicMock()
+        self.transcript = ConversationTranscript(self.widget, self.status, max_turns=3)
+
+    def test_turns_are_bounded(self):
+        """Only the last max_turns turns are kept and older text is deleted from the widget"""
+        for i in range(5):
+            self.transcript.add_turn("USER", f"command {i}")
+        self.assertEqual([turn.text for turn in self.transcript.turns], ["command 2", "command 3", "command 4"])
+        self.widget.delete.assert_called_with("1.0", "turn2")
+        self.widget.mark_unset.assert_called_with("turn1")
+
+    def test_status_does_not_touch_transcript(self):
+        """The listening indicator updates the status label instead of the text widget"""
+        self.transcript.set_status("Listening...")
+        self.status.config.assert_called_with(text="Listening...")
+        self.widget.insert.assert_not_called()
+        self.widget.get.assert_not_called()
+
+# ======================================================================================
+# GUI Update Queue Tests
+# ======================================================================================
+class TestGuiUpdateQueue(unittest.TestCase):
+    """Tests for the coalescing GUI message queue used by worker threads"""
+
+    def test_appends_are_batched(self):
+        """Consecutive appends become one insert and each widget scrolls once per frame"""
+        gui = GuiUpdateQueue()
+        widget = MagicMock()
+        callback = MagicMock()
+        gui.append_text(widget, "BOT: one\n")
+        gui.append_text(widget, "two\n", 'bot')
+        gui.post(callback, "arg")
+        gui.append_text(widget, "three\n")
+        gui.drain()
+        self.assertEqual(widget.insert.call_count, 2)
+        widget.insert.assert_any_call(tk.END, "BOT: one\n", (), "two\n", 'bot')
+        callback.assert_called_once_with("arg")
+        widget.see.assert_called_once_with(tk.END)
+
+    def test_failing_callback_does_not_stop_drain(self):
+        """An exception in one message does not drop the messages after it"""
+        gui = GuiUpdateQueue()
+        callback = MagicMock()
+        gui.post(MagicMock(side_effect=RuntimeError("boom")))
+        gui.post(callback)
+        with patch('builtins.print'):
+            gui.drain()
+        callback.assert_called_once()
+
+# ======================================================================================
+# Page Manager Tests
+# ======================================================================================
+class TestPageManager(unittest.TestCase):
+    """Tests for cached page frames and navigation"""
+
+    @patch('src.Voice_Assistant.stop_assistant')
+    @patch('src.Voice_Assistant.tk.Frame')
+    def test_pages_are_built_once(self, mock_frame, mock_stop):
+        """A page is built on first navigation and only refreshed afterwards"""
+        manager = PageManager()
+        manager.attach(MagicMock())
+        refresh = MagicMock()
+        builder = MagicMock(return_value=refresh)
+        manager.show("settings", builder)
+        manager.show("settings", builder)
+        builder.assert_called_once()
+        self.assertEqual(refresh.call_count, 2)
+        self.assertEqual(mock_stop.call_count, 2)
+        self.assertEqual(manager.current, "settings")
+
+# ======================================================================================
+# Microphone Cache Tests
+# ======================================================================================
+@patch('src.Voice_Assistant.sr.Microphone')
+class TestMicrophoneCache(unittest.TestCase):
+    """Tests for the persisted per-host microphone selection"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "microphone.json")
+        self.selection = {'device_index': 1, 'device_name': "USB Microphone", 'energy_threshold': 420.0}
+
+    @patch('src.Voice_Assistant.list_microphones', return_value=["HDMI", "USB Microphone"])
+    @patch('src.Voice_Assistant.probe_microphone')
+    def test_cached_selection_skips_probe(self, mock_probe, mock_list, mock_microphone):
+        """A saved device that is still present is reused without calibrating again"""
+        mock_probe.return_value = self.selection
+        MicrophoneCache(self.path).get_microphone()
+        _, selection = MicrophoneCache(self.path).get_microphone()
+        mock_probe.assert_called_once()
+        self.assertEqual(selection['energy_threshold'], 420.0)
+
+    @patch('src.Voice_Assistant.list_microphones', return_value=["HDMI"])
+    @patch('src.Voice_Assistant.probe_microphone')
+    def test_missing_device_is_reprobed(self, mock_probe, mock_list, mock_microphone):
+        """A cached device that disappeared triggers a new probe"""
+        MicrophoneCache(self.path).save(self.selection)
+        mock_probe.return_value = {'device_index': None, 'device_name': None, 'energy_threshold': None}
+        _, selection = MicrophoneCache(self.path).get_microphone()
+        mock_probe.assert_called_once()
+        self.assertIsNone(selection['device_index'])
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+# ======================================================================================
+# Command Batch Tests
+# ======================================================================================
+class TestCommandBatch(unittest.TestCase):
+    """Tests for typed command dispatch without audio"""
+
+    def setUp(self):
+        """Create an in-memory database with one user"""
+        self.db = DatabaseManager(':memory:')
+        self.db.connect()
+        self.patcher = patch('src.Voice_Assistant.db_manager', self.db)
+        self.patcher.start()
+        initialize_database()
+        self.db.execute("INSERT INTO users (name, email, password) VALUES (?, ?, ?)",
+                        ("Alice", "alice@test.com", "hash"))
+
+    def test_dispatch_without_display(self):
+        """Commands dispatch without a conversation area"""
+        self.assertEqual(dispatch_command("hello"), "Hello! How can I help you today?")
+        self.assertFalse(dispatch_command("quit"))
+
+    def test_batch_keeps_order_and_logs(self):
+        """Results follow input order and are logged in bulk"""
+        commands = ["hello", "what is the date", "qqq"] * 4
+        results = run_command_batch(commands, workers=3, user_email="alice@test.com")
+        self.assertEqual([command for command, _ in results], commands)
+        self.assertTrue(results[1][1].startswith("Today's date is"))
+        count = self.db.execute("SELECT COUNT(*) FROM conversations").fetchone()[0]
+        self.assertEqual(count, 2 * len(commands))
+
+    def test_batch_rejects_unknown_user(self):
+        """An unregistered --user fails before any command is logged"""
+        args = argparse.Namespace(path="-", workers=1, user="nobody@test.com", allow_machine_control=False)
+        with patch('builtins.print'):
+            self.assertEqual(cli_batch(args), 1)
+        self.assertEqual(self.db.execute("SELECT COUNT(*) FROM conversations").fetchone()[0], 0)
+
+    @patch('src.Voice_Assistant.open_application')
+    @patch('src.Voice_Assistant.shutdown_computer')
+    def test_batch_refuses_machine_control_by_default(self, mock_shutdown, mock_open):
+        """open and shutdown only run from a batch with allow_machine_control"""
+        commands = ["open calculator", "shutdown computer confirm"]
+        results = run_command_batch(commands, workers=1)
+        self.assertEqual([response for _, response in results], [REMOTE_DENIED_MESSAGE] * 2)
+        mock_open.assert_not_called()
+        mock_shutdown.assert_not_called()
+        run_command_batch(commands, workers=1, allow_machine_control=True)
+        mock_open.assert_called_once()
+        mock_shutdown.assert_called_once()
+
+    def tearDown(self):
+        self.patcher.stop()
+
+# ======================================================================================
+# Phrase Audio Cache Tests
+# ======================================================================================
+class TestPhraseAudioCache(unittest.TestCase):
+    """Tests for pre-rendered phrase audio"""
+
+    def setUp(self):
+        """Fake engine that writes a small file for every rendering"""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.properties = {'voice': 'english', 'rate': 150}
+        self.engine = MagicMock()
+        self.engine.getProperty.side_effect = self.properties.get
+
+        def save_to_file(text, path):
+            with open(path, 'wb') as f:
+                f.write(b'RIFF')
+        self.engine.save_to_file.side_effect = save_to_file
+        self.cache = PhraseAudioCache(self.tmpdir.name, self.engine, ["Hello"])
+        self.cache.player = "/usr/bin/aplay"
+
+    @patch('src.Voice_Assistant.subprocess.run')
+    def test_phrase_rendered_once(self, mock_run):
+        """Repeated phrases replay the same file without synthesis"""
+        self.assertTrue(self.cache.play("Hello"))
+        self.assertTrue(self.cache.play("Hello"))
+        self.engine.save_to_file.assert_called_once()
+        self.assertEqual(mock_run.call_count, 2)
+        self.assertFalse(self.cache.play("Something else"))
+
+    @patch('src.Voice_Assistant.subprocess.run')
+    def test_rate_change_invalidates(self, mock_run):
+        """Changing the rate renders again and drops the old speed"""
+        self.cache.play("Hello")
+        self.properties['rate'] = 200
+        self.assertEqual(self.cache.invalidate(150), 1)
+        self.cache.play("Hello")
+        self.assertEqual(self.engine.save_to_file.call_count, 2)
+        self.assertEqual(len(os.listdir(self.tmpdir.name)), 1)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+# ======================================================================================
+# Speech Streaming Tests
+# ======================================================================================
+class TestSpeechStream(unittest.TestCase):
+    """Tests for the sentence-streaming speech front-end"""
+
+    def test_display_text_is_normalized(self):
+        """Emoji and bullets are dropped and list items become sentences"""
+        text = "📅 Holidays in May 2025:\n\n• 2025-05-01: Labour Day\n• 2025-05-26: Spring Bank Holiday\n"
+        self.assertEqual(split_sentences(normalize_speech_text(text)),
+                         ["Holidays in May 2025.", "2025-05-01: Labour Day.", "2025-05-26: Spring Bank Holiday"])
+        self.assertEqual(normalize_speech_text("21°C, clear"), "21 degrees Celsius, clear")
+
+    @patch('src.Voice_Assistant.speak_sentence')
+    def test_sentences_stream_and_stop(self, mock_speak):
+        """Each frame speaks one sentence and stop() drops the rest"""
+        posted = []
+        stream = SpeechStream(posted.append)
+        stream.say("First one. Second one. Third one.")
+        posted.pop(0)()
+        mock_speak.assert_called_once_with("First one.")
+        stream.stop()
+        posted.pop(0)()
+        self.assertEqual(mock_speak.call_count, 1)
+        self.assertFalse(stream.active)
+
+    def test_cached_phrases_stay_whole(self):
+        """Every cached phrase reaches the phrase cache as one unit"""
+        for phrase in CACHED_PHRASES:
+            stream = SpeechStream(lambda callback: None)
+            stream.say(phrase)
+            self.assertEqual(len(stream.pending), 1, phrase)
+            self.assertIn(stream.pending[0], phrase_cache.phrases)
+
+# ======================================================================================
+# Knowledge Pack Tests
+# ======================================================================================
+class TestKnowledgePack(unittest.TestCase):
+    """Tests for the offline Wikipedia abstracts index"""
+
+    def setUp(self):
+        """Build a pack from a tiny abstract dump and a redirects file"""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        source = os.path.join(self.tmpdir.name, "abstracts.xml")
+        with open(source, "w", encoding="utf-8") as f:
+            f.write("<feed><doc><title>Wikipedia: Albert Einstein</title>"
+                    "<abstract>Albert Einstein was a physicist. He developed relativity. "
+                    "He won a Nobel Prize. He played the violin.</abstract></doc>"
+                    "<doc><title>Wikipedia: Python (programming language)</title>"
+                    "<abstract>Python is a programming language.</abstract></doc></feed>")
+        redirects = os.path.join(self.tmpdir.name, "redirects.tsv")
+        with open(redirects, "w", encoding="utf-8") as f:
+            f.write("A. Einstein\tAlbert Einstein\n")
+
+        self.pack = KnowledgePack(os.path.join(self.tmpdir.name, "wikipedia.db"))
+        self.patcher = patch('src.Voice_Assistant.knowledge_pack', self.pack)
+        self.patcher.start()
+        self.assertEqual(build_knowledge_pack(source, self.pack.path, redirects), 2)
+
+    def test_title_redirect_and_fulltext_lookup(self):
+        """Exact titles, redirects and title words all resolve locally"""
+        expected = "Albert Einstein was a physicist. He developed relativity. He won a Nobel Prize."
+        self.assertEqual(self.pack.lookup("albert einstein"), expected)
+        self.assertEqual(self.pack.lookup("A. Einstein"), expected)
+        self.assertEqual(self.pack.lookup("python"), "Python is a programming language.")
+        self.assertIsNone(self.pack.lookup("unknown topic"))
+
+    @patch('src.Voice_Assistant.wikipedia.summary')
+    def test_network_only_on_miss(self, mock_summary):
+        """search_wikipedia() answers from the pack and falls back to the API"""
+        mock_summary.return_value = "From the network."
+        self.assertIn("physicist", search_wikipedia("albert einstein"))
+        mock_summary.assert_not_called()
+        self.assertIn("From the network.", search_wikipedia("unknown topic"))
+
+    def test_streaming_parse_drops_finished_docs(self):
+        """The dump's root only holds the docs parsed ahead of the reader, not every finished one"""
+        source = os.path.join(self.tmpdir.name, "large.xml")
+        with open(source, "w", encoding="utf-8") as f:
+            f.write("<feed>" + "".join(f"<doc><title>Wikipedia: T{i}</title><abstract>A{i}.</abstract></doc>"
+                                       for i in range(5000)) + "</feed>")
+        roots = []
+
+        def iterparse(source, events=("end",)):
+            for event, element in real_iterparse(source, events=("start", "end")):
+                if not roots:
+                    roots.append(element)
+                if event in events:
+                    yield event, element
+
+        real_iterparse = ET.iterparse
+        with patch('src.Voice_Assistant.ET.iterparse', iterparse):
+            records = iter_abstract_records(source)
+            for i, record in enumerate(records):
+                self.assertEqual(record[:2], (f"T{i}", f"A{i}."))
+                self.assertLess(len(roots[0]), 1000)  # iterparse reads ahead in 16 KiB chunks
+        self.assertEqual(i, 4999)
+
+    def tearDown(self):
+        self.pack.close()
+        self.patcher.stop()
+        self.tmpdir.cleanup()
+
+# ======================================================================================
+# Lexicon Tests
+# ======================================================================================
+class TestLexicon(unittest.TestCase):
+    """Tests for the memory-mapped offline dictionary"""
+
+    def setUp(self):
+        """Compile a lexicon from WordNet-format data files and a JSONL entry file"""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        wordnet = os.path.join(self.tmpdir.name, "dict")
+        os.makedirs(wordnet)
+        with open(os.path.join(wordnet, "data.noun"), "w", encoding="utf-8") as f:
+            f.write("  1 This software and database is being provided\n")
+            f.write('00001 03 n 02 serendipity 0 happy_chance 0 000 | good luck in making unexpected '
+                    'discoveries; "it was pure serendipity"\n')
+        with open(os.path.join(wordnet, "data.adj"), "w", encoding="utf-8") as f:
+            f.write('00002 00 s 01 fleet(a) 0 000 | moving very fast; "fleet of foot"\n')
+        entries = os.path.join(self.tmpdir.name, "extra.jsonl")
+        with open(entries, "w", encoding="utf-8") as f:
+            for i in range(300):
+                f.write(json.dumps({"word": f"word{i:03d}", "meanings": [
+                    {"partOfSpeech": "noun", "definitions": [{"definition": f"definition {i}"}]}]}) + "\n")
+
+        self.lexicon = Lexicon(os.path.join(self.tmpdir.name, "lexicon.bin"))
+        self.patcher = patch('src.Voice_Assistant.lexicon', self.lexicon)
+        self.patcher.start()
+        self.assertEqual(build_lexicon([wordnet, entries], self.lexicon.path), 303)
+
+    def test_binary_search_lookup(self):
+        """Every compiled word is found and unknown words miss"""
+        for i in range(300):
+            entry = self.lexicon.lookup(f"Word{i:03d}")
+            self.assertEqual(entry["meanings"][0]["definitions"][0]["definition"], f"definition {i}")
+        self.assertEqual(self.lexicon.lookup("happy chance")["word"], "happy chance")
+        self.assertEqual(self.lexicon.lookup("fleet")["meanings"][0]["partOfSpeech"], "adjective")
+        self.assertIsNone(self.lexicon.lookup("zzz"))
+
+    @patch('src.Voice_Assistant.requests.get')
+    def test_offline_definition_format(self, mock_get):
+        """Offline hits keep the API response format without a network call"""
+        self.assertEqual(simplify_word_meaning("serendipity"),
+                         "📖 Serendipity means:\n"
+                         "• As a noun:\n"
+                         "  - good luck in making unexpected discoveries\n"
+                         "    Example: 'it was pure serendipity'")
+        mock_get.assert_not_called()
+
+    def test_wordnet_index_orders_senses(self):
+        """Senses come in index.<pos> frequency order, not data file order"""
+        wordnet = os.path.join(self.tmpdir.name, "ordered")
+        os.makedirs(wordnet)
+        lines = ["  1 This software and database is being provided\n"]
+        for gloss in ("sloping land beside a body of water", "a financial institution"):
+            offset = sum(len(line.encode()) for line in lines)
+            lines.append(f"{offset:08d} 17 n 01 bank 0 000 | {gloss}\n")
+        with open(os.path.join(wordnet, "data.noun"), "w", encoding="utf-8") as f:
+            f.writelines(lines)
+        river, bank = (line[:8] for line in lines[1:])
+        with open(os.path.join(wordnet, "index.noun"), "w", encoding="utf-8") as f:
+            f.write("  1 This software and database is being provided\n")
+            f.write(f"bank n 2 1 @ 2 2 {bank} {river}  \n")
+
+        ordered = Lexicon(os.path.join(self.tmpdir.name, "ordered.bin"))
+        self.assertEqual(build_lexicon([wordnet], ordered.path), 1)
+        definitions = ordered.lookup("bank")["meanings"][0]["definitions"]
+        self.assertEqual([d["definition"] for d in definitions],
+                         ["a financial institution", "sloping land beside a body of water"])
+        ordered.close()
+
+    def tearDown(self):
+        self.lexicon.close()
+        self.patcher.stop()
+        self.tmpdir.cleanup()
+
+# ======================================================================================
+# News Refresher Tests
+# ======================================================================================
+class TestNewsRefresher(unittest.TestCase):
+    """Tests for the background headline snapshot"""
+
+    def setUp(self):
+        self.refresher = NewsRefresher("https://news.example/top")
+        self.refresher.session = MagicMock()
+        fresh = MagicMock(status_code=200, headers={'ETag': '"v1"'})
+        fresh.json.return_value = {'status': 'ok', 'articles': [
+            {'title': 'Headline', 'description': 'First part. Second part.', 'source': {'name': 'Wire'}}]}
+        self.refresher.session.get.side_effect = [fresh, MagicMock(status_code=304)]
+        self.patcher = patch('src.Voice_Assistant.news_refresher', self.refresher)
+        self.patcher.start()
+
+    def test_conditional_refresh_keeps_snapshot(self):
+        """A 304 reuses the snapshot and the ETag is sent back"""
+        first = self.refresher.refresh()
+        self.assertIn("📰 Headline", first[1])
+        self.assertIs(self.refresher.refresh(), first)
+        _, kwargs = self.refresher.session.get.call_args
+        self.assertEqual(kwargs['headers']['If-None-Match'], '"v1"')
+
+    def test_invalid_payload_keeps_snapshot(self):
+        """A payload without articles returns the previous snapshot, not a (snapshot, age) pair"""
+        broken = MagicMock(status_code=200, headers={})
+        broken.json.return_value = {'status': 'error'}
+        self.refresher.session.get.side_effect = [broken]
+        self.assertIsNone(self.refresher.refresh())
+
+    def test_news_intent_answers_from_snapshot(self):
+        """The intent fetches only when no snapshot exists and reports its age"""
+        self.assertEqual(get_news_summaries(), "🌍 Top Global News Headlines (updated just now):\n")
+        get_news_summaries()
+        self.assertEqual(self.refresher.session.get.call_count, 1)
+
+    def tearDown(self):
+        self.patcher.stop()
+
+# ======================================================================================
+# Weather Cache Tests
+# ======================================================================================
+class TestWeatherCache(unittest.TestCase):
+    """Tests for favourite cities, city ID resolution and cached reports"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache = WeatherCache(os.path.join(self.tmpdir.name, "cities.json"))
+        self.cache.session = MagicMock()
+        current = MagicMock()
+        current.json.return_value = {'id': 2950159, 'name': 'Berlin', 'coord': {'lat': 52.5, 'lon': 13.4},
+                                     'main': {'temp': 20}, 'weather': [{'description': 'clear'}], 'dt': 0}
+        forecast = MagicMock()
+        forecast.json.return_value = {'list': []}
+        self.cache.session.get.side_effect = [current, forecast] * 2
+
+    def test_city_extraction(self):
+        """City names survive the words around them"""
+        self.assertEqual(extract_weather_city("What's the weather in Berlin?"), "berlin")
+        self.assertEqual(extract_weather_city("forecast for New York today"), "new york")
+        self.assertEqual(extract_weather_city("Paris weather"), "paris")
+
+    def test_resolved_id_and_cached_report(self):
+        """Fresh reports come from memory and later fetches use the city ID"""
+        self.cache.fetch("Berlin")
+        self.assertIsNotNone(self.cache.get("berlin"))
+        self.assertEqual(WeatherCache(self.cache.path).location_params("Berlin"), {'id': 2950159})
+        self.cache.fetch("Berlin")
+        _, kwargs = self.cache.session.get.call_args
+        self.assertEqual(kwargs['params']['id'], 2950159)
+
+    def test_favorites_from_history(self):
+        """Cities asked about repeatedly become favourites"""
+        db = DatabaseManager(':memory:')
+        db.connect()
+        with patch('src.Voice_Assistant.db_manager', db):
+            initialize_database()
+            db.execute("INSERT INTO users (name, email, password) VALUES (?, ?, ?)", ("Al", "al@test.com", "hash"))
+            for command in ["weather in Berlin", "Berlin weather", "weather in Oslo", "hello"]:
+                log_conversation("al@test.com", "USER", command)
+            self.assertEqual(get_favorite_cities("al@test.com"), ["berlin"])
+        db.close()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+# ======================================================================================
+# Application Index Tests
+# ======================================================================================
+class TestApplicationIndex(unittest.TestCase):
+    """Tests for the $PATH and .desktop launch index"""
+
+    def setUp(self):
+        """Fake PATH with one executable and an XDG directory with one application"""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        bin_dir = os.path.join(self.tmpdir.name, "bin")
+        apps_dir = os.path.join(self.tmpdir.name, "share", "applications")
+        os.makedirs(bin_dir)
+        os.makedirs(apps_dir)
+        for name in ("gimp-2.10", "poweroff"):
+            tool = os.path.join(bin_dir, name)
+            with open(tool, "w") as f:
+                f.write("#!/bin/sh\n")
+            os.chmod(tool, 0o755)
+        with open(os.path.join(apps_dir, "gimp.desktop"), "w") as f:
+            f.write("[Desktop Entry]\nType=Application\nName=GNU Image Manipulation Program\n"
+                    "GenericName=Image Editor\nKeywords=photo;paint;\nExec=gimp-2.10 %U\n"
+                    "[Desktop Action new]\nName=New Window\n")
+        with open(os.path.join(apps_dir, "logout.desktop"), "w") as f:
+            f.write("[Desktop Entry]\nType=Application\nName=Power Off\nExec=systemctl poweroff\n")
+        self.env = patch.dict(os.environ, {'PATH': bin_dir, 'XDG_DATA_HOME': os.path.join(self.tmpdir.name, "share"),
+                                           'XDG_DATA_DIRS': os.path.join(self.tmpdir.name, "none")})
+        self.env.start()
+        self.index = ApplicationIndex()
+
+    def test_names_keywords_and_exec(self):
+        """Desktop names, generic names, keywords and executables all resolve"""
+        for name in ["GNU Image Manipulation Program", "image editor", "photo", "gimp", "gimp-2.10"]:
+            self.assertEqual(self.index.lookup(name), ["gimp-2.10"])
+        self.assertIsNone(self.index.lookup("new window"))
+        self.assertTrue(self.index.has_executable("gimp-2.10"))
+
+    def test_system_executables_not_launchable(self):
+        """Bare $PATH executables and blocked tools are never resolved by name"""
+        self.assertTrue(self.index.has_executable("poweroff"))
+        for name in ["poweroff", "power off", "systemctl"]:
+            self.assertIsNone(self.index.lookup(name))
+
+    @patch('src.Voice_Assistant.subprocess.Popen')
+    def test_open_application_uses_index(self, mock_popen):
+        """'open X' launches indexed apps without spawning which"""
+        with patch('src.Voice_Assistant.app_index', self.index):
+            self.assertEqual(open_application("image editor"), "Opening image editor")
+        mock_popen.assert_called_once()
+        self.assertEqual(mock_popen.call_args[0][0], ["gimp-2.10"])
+
+    def tearDown(self):
+        self.env.stop()
+        self.tmpdir.cleanup()
+
+# ======================================================================================
+# Command Correction Tests
+# ======================================================================================
+class TestCommandCorrection(unittest.TestCase):
+    """Tests for fuzzy correction of misrecognized commands"""
+
+    def test_bounded_edit_distance(self):
+        """Distances are exact up to the bound and capped beyond it"""
+        self.assertEqual(bounded_edit_distance("wether", "weather", 2), 1)
+        self.assertEqual(bounded_edit_distance("kitten", "sitting", 3), 3)
+        self.assertEqual(bounded_edit_distance("kitten", "sitting", 1), 2)
+
+    def test_fuzzy_index_match(self):
+        """The closest term within the budget wins"""
+        index = FuzzyIndex(["weather", "whether", "forecast"])
+        self.assertEqual(index.match("weathr", 1), "weather")
+        self.assertIsNone(index.match("forest", 1))
+
+    def build_lexicon(self, words):
+        """Offline lexicon containing just words"""
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        entries = os.path.join(tmpdir.name, "words.jsonl")
+        with open(entries, "w", encoding="utf-8") as f:
+            for word in words:
+                f.write(json.dumps({"word": word, "meanings": [
+                    {"partOfSpeech": "noun", "definitions": [{"definition": word}]}]}) + "\n")
+        result = Lexicon(os.path.join(tmpdir.name, "lexicon.bin"))
+        build_lexicon([entries], result.path)
+        self.addCleanup(result.close)
+        return result
+
+    def test_corrects_near_misses_only(self):
+        """Keywords, app names and cities are fixed; ordinary words are left alone"""
+        corrector = CommandCorrector()
+        dictionary = self.build_lexicon(["serendipity", "paris", "wether", "data", "world", "time"])
+        patcher = patch('src.Voice_Assistant.lexicon', dictionary)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.assertEqual(corrector.correct("open crome"), "open chrome")
+        self.assertEqual(corrector.correct("wether in paris"), "weather in paris")
+        self.assertEqual(corrector.correct("definee serendipity"), "define serendipity")
+        self.assertEqual(corrector.correct("world time in tokio"), "world time in tokyo")
+        self.assertEqual(corrector.correct("tell me about data"), "tell me about data")
+
+    def test_real_words_are_not_corrected(self):
+        """Dictionary words near a keyword are kept when the command already means something"""
+        corrector = CommandCorrector()
+        commands = ["what is a cello", "what is leather made of", "who is Heather Locklear",
+                    "tell me about the concert", "commuter", "define refine"]
+        dictionary = self.build_lexicon(["cello", "leather", "made", "heather", "concert", "commuter", "refine"])
+        for current in (Lexicon(os.path.join(tempfile.gettempdir(), "missing-lexicon.bin")), dictionary):
+            with patch('src.Voice_Assistant.lexicon', current):
+                for command in commands:
+                    self.assertEqual(corrector.correct(command), command)
+
+    def test_keywords_inside_words_do_not_block_correction(self):
+        """Commands whose words merely contain a trigger ("hi", "date", "to", "open") are still corrected"""
+        corrector = CommandCorrector()
+        dictionary = self.build_lexicon(["wether", "chicago", "this", "update", "tomorrow", "reopened", "shop"])
+        with patch('src.Voice_Assistant.lexicon', dictionary):
+            self.assertEqual(corrector.correct("wether in chicago"), "weather in chicago")
+            self.assertEqual(corrector.correct("wether update tomorrow"), "weather update tomorrow")
+            self.assertEqual(corrector.correct("wether this weekend"), "weather this weekend")
+            self.assertEqual(corrector.correct("wether at the reopened shop"), "weather at the reopened shop")
+            self.assertEqual(corrector.correct("the weather this weekend"), "the weather this weekend")
+
+# ======================================================================================
+# Server Mode Tests
+# ======================================================================================
+class TestServerMode(unittest.TestCase):
+    """Tests for the asyncio JSON-lines server and its load-test client"""
+
+    def setUp(self):
+        self.db = DatabaseManager(':memory:')
+        self.db.connect()
+        self.patcher = patch('src.Voice_Assistant.db_manager', self.db)
+        self.patcher.start()
+        initialize_database()
+        self.db.execute("INSERT INTO users (name, last_name, email, password) VALUES (?, ?, ?, ?)",
+                        ("Alice", "Smith", "alice@test.com", ph.hash("secret")))
+
+    async def exchange(self, lines):
+        """Start a server on a free port, send raw lines, then run a small load test"""
+        started = asyncio.get_running_loop().create_future()
+        server_task = asyncio.create_task(serve_assistant("127.0.0.1", 0, workers=2, ready=started.set_result))
+        server = await started
+        port = server.sockets[0].getsockname()[1]
+        try:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(b"".join(line + b"\n" for line in lines))
+            replies = [json.loads(await reader.readline()) for _ in lines]
+            writer.close()
+            stats = await run_load_test("127.0.0.1", port, connections=5, requests_per_connection=10, pipeline=2,
+                                        email="alice@test.com", password="secret")
+        finally:
+            server_task.cancel()
+        return replies, stats
+
+    def test_requests_and_load_test(self):
+        """Replies carry the request id, bad lines get errors, and the load test completes"""
+        with patch('builtins.print'):
+            replies, stats = asyncio.run(self.exchange([
+                b'{"id": 1, "type": "login", "email": "alice@test.com", "password": "secret"}',
+                b'{"id": 2, "command": "hello"}',
+                b'not json',
+                b'{"id": 3, "type": "login", "email": "nobody@test.com", "password": "x"}',
+            ]))
+        by_id = {reply.get("id"): reply for reply in replies}
+        self.assertEqual(by_id[1]["user"], "Alice Smith")
+        self.assertEqual(by_id[2]["response"], "Hello! How can I help you today?")
+        self.assertIn("Bad request", by_id[None]["error"])
+        self.assertFalse(by_id[3]["ok"])
+        self.assertEqual((stats['requests'], stats['errors']), (50, 0))
+
+    @patch('src.Voice_Assistant.shutdown_computer')
+    @patch('src.Voice_Assistant.subprocess.Popen')
+    def test_guests_and_system_commands_are_refused(self, mock_popen, mock_shutdown):
+        """Commands need a login, machine control is refused, and an over-long line only costs an error"""
+        with patch('builtins.print'):
+            replies, _ = asyncio.run(self.exchange([
+                b'{"id": 1, "command": "shutdown computer confirm"}',
+                b'{"id": 2, "type": "login", "email": "alice@test.com", "password": "secret"}',
+                b'{"id": 3, "command": "' + b"x" * 70000 + b'"}',
+                b'{"id": 4, "command": "shutdown computer confirm"}',
+                b'{"id": 5, "command": "open poweroff"}',
+                b'{"id": 6, "command": "hello"}',
+            ]))
+        by_id = {reply.get("id"): reply for reply in replies}
+        self.assertEqual(by_id[1]["error"], "Log in first")
+        self.assertIn("longer than", by_id[None]["error"])
+        self.assertEqual(by_id[4]["response"], REMOTE_DENIED_MESSAGE)
+        self.assertEqual(by_id[5]["response"], REMOTE_DENIED_MESSAGE)
+        self.assertEqual(by_id[6]["response"], "Hello! How can I help you today?")
+        mock_shutdown.assert_not_called()
+        mock_popen.assert_not_called()
+
+    def tearDown(self):
+        self.patcher.stop()
+
+# ======================================================================================
+# Audio Endpoint Tests
+# ======================================================================================
+class TestAudioEndpoint(unittest.TestCase):
+    """Tests for streaming remote audio into recognition and dispatch"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "hello.wav")
+        with wave.open(self.path, "wb") as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(16000)
+            wav.writeframes(b"\x01\x00" * 16000)
+        self.db = DatabaseManager(':memory:')
+        self.db.connect()
+        self.patcher = patch('src.Voice_Assistant.db_manager', self.db)
+        self.patcher.start()
+        initialize_database()
+        self.db.execute("INSERT INTO users (name, email, password) VALUES (?, ?, ?)",
+                        ("Alice", "alice@test.com", ph.hash("secret")))
+
+    async def replay(self, path, password="secret"):
+        started = asyncio.get_running_loop().create_future()
+        server_task = asyncio.create_task(serve_audio("127.0.0.1", 0, workers=2, ready=started.set_result))
+        server = await started
+        port = server.sockets[0].getsockname()[1]
+        try:
+            return await replay_audio(path, "127.0.0.1", port, chunk_ms=50, email="alice@test.com", password=password)
+        finally:
+            server_task.cancel()
+
+    @patch('src.Voice_Assistant.sr.Recognizer.recognize_google')
+    def test_wav_replay_is_recognized_and_answered(self, mock_recognize):
+        """The reassembled stream reaches the recognizer intact and gets a dispatched answer"""
+        mock_recognize.return_value = "hello"
+        with patch('builtins.print'):
+            reply, _ = asyncio.run(self.replay(self.path))
+        self.assertEqual(reply["transcript"], "hello")
+        self.assertEqual(reply["response"], "Hello! How can I help you today?")
+        audio = mock_recognize.call_args[0][0]
+        self.assertEqual((len(audio.frame_data), audio.sample_rate, audio.sample_width), (32000, 16000, 2))
+
+    @patch('src.Voice_Assistant.lock_computer')
+    @patch('src.Voice_Assistant.sr.Recognizer.recognize_google')
+    def test_login_required_and_system_commands_refused(self, mock_recognize, mock_lock):
+        """Streams need valid credentials and recognised machine control is refused"""
+        mock_recognize.return_value = "lock computer"
+        with patch('builtins.print'):
+            reply, _ = asyncio.run(self.replay(self.path, password="wrong"))
+            self.assertEqual(reply["error"], "Invalid email or password")
+            reply, _ = asyncio.run(self.replay(self.path))
+        self.assertEqual(reply["response"], REMOTE_DENIED_MESSAGE)
+        mock_lock.assert_not_called()
+
+    def tearDown(self):
+        self.patcher.stop()
+        self.tmpdir.cleanup()
+
+# ======================================================================================
+# Intent Runner Tests
+# ======================================================================================
+class TestIntentRunner(unittest.TestCase):
+    """Tests for per-intent time budgets and cancellation"""
+
+    def setUp(self):
+        self.release = threading.Event()
+        self.runner = IntentRunner(workers=4)
+        self.gui = GuiUpdateQueue()
+        self.patches = [
+            patch('src.Voice_Assistant.handle_intent', side_effect=self.slow_handler),
+            patch('src.Voice_Assistant.gui_queue', self.gui),
+            patch.dict('src.Voice_Assistant.INTENT_TIMEOUTS', {'news': 0.2}),
+            patch('builtins.print'),
+        ]
+        for patcher in self.patches:
+            patcher.start()
+
+    def slow_handler(self, intent, command, conversation_area=None, user_email=None):
+        if intent == "news":
+            self.release.wait(5)
+        self.gui.append_text(conversation_area, f"BOT: done {intent}\n")
+        return f"done {intent}"
+
+    def test_timeout_returns_fallback(self):
+        """A handler over its budget yields the spoken fallback and is counted"""
+        self.assertEqual(self.runner.run("news"), INTENT_TIMEOUT_MESSAGE)
+        self.assertEqual(self.runner.run("hello"), "done greeting")
+        stats = self.runner.summary()
+        self.assertEqual(stats["news"], {"timeouts": 1})
+        self.assertEqual(stats["all"], {"timeouts": 1, "completed": 1})
+
+    def test_new_command_cancels_inflight(self):
+        """Cancelling wakes the waiting turn immediately with no response"""
+        results = []
+        with patch.dict('src.Voice_Assistant.INTENT_TIMEOUTS', {'news': 5.0}):
+            turn = threading.Thread(target=lambda: results.append(self.runner.run("news")))
+            turn.start()
+            time.sleep(0.05)
+            self.runner.cancel()
+            turn.join(1)
+        self.assertEqual(results, [None])
+        self.assertEqual(self.runner.summary()["news"], {"cancelled": 1})
+
+    def test_abandoned_handler_cannot_write_to_transcript(self):
+        """A handler that finishes after its timeout has its transcript output dropped"""
+        widget = MagicMock()
+        self.assertEqual(self.runner.run("news", widget), INTENT_TIMEOUT_MESSAGE)
+        self.release.set()
+        self.runner.executor.shutdown(wait=True)
+        self.assertTrue(self.gui.messages.empty())
+        self.runner = IntentRunner(workers=1)
+        self.assertEqual(self.runner.run("hello", widget), "done greeting")
+        self.assertEqual(self.gui.messages.get_nowait()[1], (widget, "BOT: done greeting\n", None))
+
+    def tearDown(self):
+        self.release.set()
+        for patcher in reversed(self.patches):
+            patcher.stop()
+        self.runner.executor.shutdown(wait=True)
+
+# ======================================================================================
+# Record and Replay Tests
+# ======================================================================================
+class TestAudioCorpus(unittest.TestCase):
+    """Tests for recording utterances and replaying them faster than real time"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "corpus.gz")
+        recorder = AudioRecorder(self.path)
+        # Half a second of loud square wave, so listen() hears speech and then the appended pause
+        speech = (b"\x00\x40" * 8 + b"\x00\xc0" * 8) * 500
+        for transcript in ("what is the date", "hello"):
+            recorder.record(MagicMock(frame_data=speech, sample_rate=16000, sample_width=2),
+                            transcript, 120.0, 300)
+        recorder.close()
+
+    def test_corpus_round_trip(self):
+        """Records come back in order with their transcripts and audio"""
+        records = list(iter_audio_corpus(self.path))
+        self.assertEqual([header["transcript"] for header, _ in records], ["what is the date", "hello"])
+        self.assertEqual(len(records[0][1]), 16000)
+
+    def test_replay_reports_latency_and_drift(self):
+        """Unpaced replay beats real time and flags transcripts that changed"""
+        heard = iter(["what is the date", "hello there"])
+        with patch('builtins.print'):
+            stats = replay_audio_corpus(self.path, recognize=lambda audio: next(heard))
+        self.assertEqual(stats["utterances"], 2)
+        self.assertGreater(stats["realtime_factor"], 1.0)
+        self.assertEqual(stats["drift"], [("hello", "hello there")])
+        self.assertAlmostEqual(stats["word_error_rate"], 1 / 5)
+        self.assertEqual(stats["recorded_recognition_p50_ms"], 120.0)
+        self.assertEqual(word_error_rate("open the browser", "open browser"), 1 / 3)
+
+    @patch('src.Voice_Assistant.shutdown_computer')
+    def test_replay_dispatch_is_opt_in_and_safe(self, mock_shutdown):
+        """Handlers only run with dispatch, and machine control is refused even then"""
+        with patch('builtins.print'), patch('src.Voice_Assistant.intent_runner.run') as mock_run:
+            replay_audio_corpus(self.path, recognize=lambda audio: "hello")
+            mock_run.assert_not_called()
+        with patch('builtins.print'):
+            replay_audio_corpus(self.path, recognize=lambda audio: "shutdown computer confirm", dispatch=True)
+        mock_shutdown.assert_not_called()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+# ======================================================================================
+# Memory Diagnostics Tests
+# ======================================================================================
+class TestMemoryMonitor(unittest.TestCase):
+    """Tests for tracemalloc sampling, growth flags and thread grouping"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.monitor = MemoryMonitor(self.tmpdir.name, trend_window=3)
+        self.monitor.start()
+        self.leak = []
+
+    def test_growth_is_flagged_and_reported(self):
+        """Memory that grows every sample is flagged, and each sample writes a report"""
+        for _ in range(3):
+            self.leak.append(bytearray(512 * 1024))
+            sample, trends = self.monitor.sample()
+        self.assertIn("traced_bytes", trends)
+        self.assertNotIn("widgets", trends)
+        reports = [name for name in os.listdir(self.tmpdir.name) if name.startswith("memory-")]
+        self.assertEqual(len(reports), 3)
+        with open(os.path.join(self.tmpdir.name, "samples.jsonl")) as f:
+            self.assertEqual(len(f.readlines()), 3)
+
+    def test_thread_kind_groups_threads(self):
+        """Threads are grouped by target or pool name rather than their numbered names"""
+        self.assertEqual(thread_kind(threading.Thread(name="Thread-12 (assistant_loop)")), "assistant_loop")
+        self.assertEqual(thread_kind(threading.Thread(name="intent_3")), "intent")
+        self.assertEqual(thread_kind(threading.Thread(name="MainThread")), "MainThread")
+
+    def tearDown(self):
+        self.monitor.stop()
+        self.tmpdir.cleanup()
+
+# ======================================================================================
+# Assistant Runtime Tests
+# ======================================================================================
+class TestAssistantRuntime(unittest.TestCase):
+    """Tests for the single listening loop and its pause/resume lifecycle"""
+
+    def setUp(self):
+        self.runtime = AssistantRuntime()
+        self.transcript = MagicMock()
+        # Ten seconds of silence at real time: listen() would block until its 5 second timeout
+        silence = CorpusMicrophone(b"", 16000, 2, speed=1.0, trailing_silence=10)
+        selection = {'device_index': None, 'energy_threshold': 300}
+        self.patches = [
+            patch('src.Voice_Assistant.microphone_cache.get_microphone', return_value=(silence, selection)),
+            patch('src.Voice_Assistant.submit_command'),
+            patch('builtins.print'),
+        ]
+        for patcher in self.patches:
+            patcher.start()
+
+    def wait_for(self, counter, value=1, timeout=2.0):
+        deadline = time.time() + timeout
+        while self.runtime.counters[counter] < value and time.time() < deadline:
+            time.sleep(0.01)
+        return self.runtime.counters[counter]
+
+    def test_pause_interrupts_capture_promptly(self):
+        """Pausing ends a blocking listen() within a chunk instead of after its timeout"""
+        self.runtime.start(self.transcript)
+        self.wait_for('captures')
+        time.sleep(0.2)
+        paused = time.time()
+        self.runtime.pause()
+        self.assertEqual(self.wait_for('cancelled'), 1)
+        self.assertLess(time.time() - paused, 0.5)
+        self.assertEqual(self.runtime.stats()['state'], "paused")
+
+    def test_sessions_share_one_thread(self):
+        """Repeated logins reuse the same thread rather than starting another loop"""
+        for _ in range(5):
+            self.runtime.start(self.transcript)
+            self.runtime.pause()
+        self.assertTrue(self.runtime.resume())
+        stats = self.runtime.stats()
+        self.assertEqual((stats['threads_started'], stats['sessions'], stats['resumes']), (1, 5, 1))
+        self.assertTrue(stats['thread_alive'])
+
+    @patch('src.Voice_Assistant.speak_sentence')
+    def test_capture_is_held_while_speaking(self, mock_speak):
+        """Speech interrupts the capture in progress and the next one waits until playback ends"""
+        stream = SpeechStream(lambda callback: None)
+        with patch('src.Voice_Assistant.speech_stream', stream):
+            self.runtime.start(self.transcript)
+            self.wait_for('captures')
+            stream.say("The answer.")
+            self.assertEqual(self.wait_for('cancelled'), 1)
+            time.sleep(0.3)
+            self.assertEqual(self.runtime.counters['captures'], 1)
+            stream.speak_next()  # speaks the sentence
+            stream.speak_next()  # nothing left, playback goes idle
+            self.assertEqual(self.wait_for('captures', 2), 2)
+
+    def tearDown(self):
+        self.runtime.shutdown()
+        for patcher in reversed(self.patches):
+            patcher.stop()
+
+# ======================================================================================
+# User Profile Tests
+# ======================================================================================
+class TestUserProfile(unittest.TestCase):
+    """Tests for the cached profile and its write-through updates"""
+
+    def setUp(self):
+        self.db = DatabaseManager(':memory:')
+        self.db.connect()
+        self.patcher = patch('src.Voice_Assistant.db_manager', self.db)
+        self.patcher.start()
+        initialize_database()
+        self.db.execute("INSERT INTO users (name, last_name, email, password, voice_speed) VALUES (?, ?, ?, ?, ?)",
+                        ("Alice", "Smith", "alice@test.com", "hash", "Fast"))
+        self.profile = UserProfile.load("alice@test.com")
+
+    def test_load_reads_whole_row(self):
+        """One query fills every field, and unknown emails give None"""
+        self.assertEqual((self.profile.full_name, self.profile.password_hash, self.profile.speech_rate),
+                         ("Alice Smith", "hash", 200))
+        self.assertIsNone(UserProfile.load("nobody@test.com"))
+        with self.assertRaises(AttributeError):
+            self.profile.nickname = "Al"
+
+    def test_updates_write_through(self):
+        """Changes reach the database and the cached object, so pages need not re-query"""
+        with patch('src.Voice_Assistant.current_user', self.profile):
+            update_user_info("Alicia", "Jones")
+            self.assertEqual(get_current_user_info(), ("Alicia", "Jones", "hash"))
+        self.profile.update(voice_speed="Slow")
+        row = self.db.execute("SELECT name, last_name, voice_speed FROM users").fetchone()
+        self.assertEqual(row, ("Alicia", "Jones", "Slow"))
+        with self.assertRaises(ValueError):
+            self.profile.update(email="x@test.com")
+
+    def tearDown(self):
+        self.patcher.stop()
+        self.db.close()
+
+# ======================================================================================
+# User Provisioning Tests
+# ======================================================================================
+class TestUserProvisioning(unittest.TestCase):
+    """Tests for bulk account creation with pooled password hashing"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db = DatabaseManager(os.path.join(self.tmpdir.name, "users.db"))
+        self.patcher = patch('src.Voice_Assistant.db_manager', self.db)
+        self.patcher.start()
+        initialize_database()
+        self.db.execute("INSERT INTO users (name, email, password) VALUES (?, ?, ?)",
+                        ("Existing", "taken@test.com", "hash"))
+        self.db.commit()
+
+    def test_jsonl_and_csv_provisioning(self):
+        """Valid rows are created with verifiable hashes; duplicates and bad rows are reported"""
+        path = os.path.join(self.tmpdir.name, "users.jsonl")
+        with open(path, "w") as f:
+            for record in ({"name": "kiosk", "last_name": "one", "email": "k1@test.com", "password": "pw1"},
+                           {"name": "kiosk", "last_name": "two", "email": "taken@test.com", "password": "pw2"},
+                           {"name": "kiosk", "last_name": "three", "email": "k1@test.com", "password": "pw3"},
+                           {"name": "kiosk4", "last_name": "four", "email": "k4@test.com", "password": "pw4"}):
+                f.write(json.dumps(record) + "\n")
+        created, duplicates, errors = provision_users(path, workers=2, batch_size=2)
+        self.assertEqual(created, 1)
+        self.assertEqual(duplicates, [(2, "taken@test.com"), (3, "k1@test.com")])
+        self.assertEqual([(number, email) for number, email, _ in errors], [(4, "k4@test.com")])
+
+        csv_path = os.path.join(self.tmpdir.name, "users.csv")
+        with open(csv_path, "w") as f:
+            f.write("name,last_name,email,password\nmary jane,doe,k5@test.com,pw5\n")
+        self.assertEqual(provision_users(csv_path, workers=2)[0], 1)
+
+        name, hashed = self.db.execute("SELECT name, password FROM users WHERE email = 'k5@test.com'").fetchone()
+        self.assertEqual(name, "Mary Jane")
+        self.assertTrue(ph.verify(hashed, "pw5"))
+
+    def test_malformed_lines_are_reported_per_row(self):
+        """Undecodable and non-object JSONL lines are errors; the rows around them still load"""
+        path = os.path.join(self.tmpdir.name, "broken.jsonl")
+        with open(path, "w") as f:
+            f.write(json.dumps({"name": "kiosk", "last_name": "one", "email": "k1@test.com", "password": "pw1"}) + "\n")
+            f.write("not json\n[1, 2]\n")
+            f.write(json.dumps({"name": "kiosk", "last_name": "two", "email": "k2@test.com", "password": "pw2"}) + "\n")
+        created, duplicates, errors = provision_users(path, workers=1, batch_size=2)
+        self.assertEqual((created, duplicates), (2, []))
+        self.assertEqual([(number, email) for number, email, _ in errors], [(2, ""), (3, "")])
+        self.assertIn("invalid JSON", errors[0][2])
+
+    def test_pool_workers_do_not_rerun_the_main_script(self):
+        """Spawned hashing workers load the hashing module, not the script that started them"""
+        marker = os.path.join(self.tmpdir.name, "imports.txt")
+        script = os.path.join(self.tmpdir.name, "main_script.py")
+        with open(script, "w") as f:
+            f.write("import sys\n"
+                    f"sys.path.insert(0, {os.getcwd()!r})\n"
+                    f"open({marker!r}, 'a').write(__name__ + '\\n')\n"
+                    "from src.password_hashing import hash_password, hashing_pool\n"
+                    "if __name__ == '__main__':\n"
+                    "    with hashing_pool(2) as pool:\n"
+                    "        assert all(h.startswith('$argon2') for h in pool.map(hash_password, ['a', 'b']))\n")
+        subprocess.run([sys.executable, script], check=True, timeout=60)
+        with open(marker) as f:
+            self.assertEqual(f.read().split(), ["__main__"])
+
+    def test_large_batches_use_the_pool(self):
+        """Batches of PROVISION_POOL_MIN passwords are hashed by worker processes"""
+        path = os.path.join(self.tmpdir.name, "users.csv")
+        with open(path, "w") as f:
+            f.write("name,last_name,email,password\n")
+            f.writelines(f"kiosk,{'abcd'[i]},k{i}@test.com,pw{i}\n" for i in range(4))
+        with patch('src.Voice_Assistant.PROVISION_POOL_MIN', 4), \
+                patch('src.Voice_Assistant.hashing_pool', wraps=hashing_pool) as mock_pool:
+            self.assertEqual(provision_users(path, workers=2), (4, [], []))
+        mock_pool.assert_called_once_with(2)
+        hashed = self.db.execute("SELECT password FROM users WHERE email = 'k3@test.com'").fetchone()[0]
+        self.assertTrue(ph.verify(hashed, "pw3"))
+
+    def tearDown(self):
+        self.patcher.stop()
+        self.db.close()
+        self.tmpdir.cleanup()
+
+# ======================================================================================
+# Usage Analytics Tests
+# ======================================================================================
+class TestUsageAnalytics(unittest.TestCase):
+    """Tests for per-turn analytics rows and their incrementally maintained summaries"""
+
+    def setUp(self):
+        self.db = DatabaseManager(':memory:')
+        self.db.connect()
+        self.patcher = patch('src.Voice_Assistant.db_manager', self.db)
+        self.patcher.start()
+        initialize_database()
+        self.db.execute("INSERT INTO users (name, email, password) VALUES (?, ?, ?)",
+                        ("Alice", "alice@test.com", "hash"))
+        self.recorder = UsageRecorder(batch_size=3, interval=60)
+
+    def report(self, scope):
+        return self.db.execute("SELECT name, turns, failure_pct, avg_ms, max_ms, slow_turns FROM usage_report "
+                               "WHERE scope = ? ORDER BY name", (scope,)).fetchall()
+
+    def test_summaries_follow_inserts(self):
+        """Batches are written once full and every summary is updated by the trigger"""
+        self.recorder.record("alice@test.com", "weather", 200.0, "completed")
+        self.recorder.record("alice@test.com", "weather", 8000.0, "timeouts")
+        self.assertEqual(self.report("intent"), [])  # still buffered
+        self.recorder.record(None, "greeting", 1.0, "completed")
+        self.assertEqual(self.report("intent"), [("greeting", 1, 0.0, 1.0, 1.0, 0),
+                                                 ("weather", 2, 50.0, 4100.0, 8000.0, 1)])
+        self.assertEqual([row[:2] for row in self.report("user")], [("alice@test.com", 2), ("guest", 1)])
+
+        self.recorder.record("alice@test.com", "weather", 100.0, "completed")
+        self.recorder.flush()
+        self.assertEqual(self.report("intent")[1][:2], ("weather", 3))
+        self.assertEqual(self.report("day")[0][1], 4)
+
+    def test_cancelled_turns_are_not_failures(self):
+        """Superseded and refused turns count as turns but not as failures"""
+        for outcome in ("cancelled", "denied", "errors", "completed"):
+            self.recorder.record(None, "news", 10.0, outcome)
+        self.recorder.flush()
+        self.assertEqual(self.report("intent"), [("news", 4, 25.0, 10.0, 10.0, 0)])
+
+    def test_quiet_session_is_flushed_by_timer(self):
+        """A lone turn reaches the database without another turn or an explicit flush"""
+        recorder = UsageRecorder(batch_size=100, interval=0.05)
+        self.addCleanup(recorder.stop)
+        recorder.record("alice@test.com", "greeting", 1.0, "completed")
+        deadline = time.monotonic() + 5
+        while not self.report("intent") and time.monotonic() < deadline:
+            time.sleep(0.02)
+        self.assertEqual(self.report("intent")[0][:2], ("greeting", 1))
+
+    def tearDown(self):
+        self.recorder.stop()
+        self.patcher.stop()
+        self.db.close()
+
+@unittest.skipIf(np is None, "numpy is not installed")
+class TestHistoryIndex(unittest.TestCase):
+    """Tests for the hashed n-gram similarity index over conversation history"""
+
+    def setUp(self):
+        self.db = DatabaseManager(':memory:')
+        self.db.connect()
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.index = HistoryIndex(os.path.join(self.temp_dir.name, "history_index"))
+        self.patchers = [patch('src.Voice_Assistant.db_manager', self.db),
+                         patch('src.Voice_Assistant.history_index', self.index)]
+        for patcher in self.patchers:
+            patcher.start()
+        initialize_database()
+        for name, email in (("Alice", "alice@test.com"), ("Bob", "bob@test.com")):
+            self.db.execute("INSERT INTO users (name, email, password) VALUES (?, ?, ?)", (name, email, "hash"))
+
+    def test_search_is_per_user_and_incremental(self):
+        """Logged messages are found by shared words and never leak to another user"""
+        log_conversation("alice@test.com", "USER", "what's the weather in Paris")
+        log_conversation("alice@test.com", "BOT", "It is sunny in Paris")
+        log_conversation("alice@test.com", "USER", "convert 5 km to miles")
+        log_conversation("bob@test.com", "USER", "weather in Paris tomorrow")
+        self.assertEqual(self.index.count, 4)
+
+        hits = self.index.search(["paris weather", "kilometres km miles"], "alice@test.com")
+        self.assertEqual(hits[0][0][0], 1)
+        self.assertEqual(hits[1][0][0], 3)
+        self.assertTrue(all(row_id != 4 for row_id, _ in hits[0]))
+        self.assertEqual(self.index.search(["paris"], "nobody@test.com"), [[]])
+
+        # Rows written behind the index's back are picked up by the next search
+        self.db.execute("INSERT INTO conversations (user_id, timestamp, speaker, message) VALUES (1, 0, 0, ?)",
+                        ("holidays in December",))
+        self.assertEqual(self.index.search(["december holidays"], "alice@test.com")[0][0][0], 5)
+        self.assertEqual(self.index.count, 5)
+
+    def test_saved_index_reloads(self):
+        """Saves append segments holding only new rows, and a reload only syncs rows written after them"""
+        log_conversation("alice@test.com", "USER", "tell me the news")
+        self.index.save()
+        log_conversation("alice@test.com", "USER", "world time in Tokyo")
+        self.index.save()
+        self.assertEqual(len(self.index.segments), 2)
+        log_conversation("alice@test.com", "USER", "holidays in December")
+
+        reloaded = HistoryIndex(self.index.path)
+        self.assertEqual(reloaded.search(["tokyo time"], "alice@test.com")[0][0][0], 2)
+        self.assertEqual(reloaded.count, 3)  # rows added before a save are not indexed twice
+
+        with patch('src.Voice_Assistant.HISTORY_INDEX_SEGMENTS', 2):
+            reloaded.save()
+        self.assertEqual(sorted(os.listdir(self.index.path)), ["meta.json", reloaded.segments[0]])
+        self.assertEqual(HistoryIndex(self.index.path).search(["december"], "alice@test.com")[0][0][0], 3)
+
+    def test_recall_intent(self):
+        """Recall commands route first and answer with the matching turn"""
+        self.assertEqual(classify_intent("what did i ask about history"), "recall")
+        log_conversation("alice@test.com", "USER", "what's the weather in Paris")
+        log_conversation("alice@test.com", "BOT", "It is sunny in Paris")
+        log_conversation("alice@test.com", "USER", "what did i ask about paris")
+
+        response = recall_history("what did I ask about Paris", "alice@test.com")
+        self.assertIn("\"what's the weather in Paris\"", response)
+        self.assertIn("It is sunny in Paris", response)
+        self.assertEqual(len(response.splitlines()), 1)  # the recall itself and the bot half are folded away
+        self.assertIn("couldn't find", recall_history("what did I ask about quantum chromodynamics", "alice@test.com"))
+        self.assertIn("Sign in", recall_history("what did I ask about Paris", None))
+
+        # Recall answers are history too; later recalls must not quote them
+        for _ in range(6):
+            log_conversation("alice@test.com", "USER", "what did i ask about paris")
+            log_conversation("alice@test.com", "BOT", recall_history("what did I ask about Paris", "alice@test.com"))
+        response = recall_history("what did I ask about Paris", "alice@test.com")
+        self.assertEqual(response.count("you asked"), 1)
+        self.assertNotIn("what did i ask about", response.lower())
+
+        # Batch and server turns carry their own user rather than the desktop login
+        results = run_command_batch(["what did I ask about paris"], workers=1, user_email="alice@test.com")
+        self.assertIn("It is sunny in Paris", results[0][1])
+
+    def tearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+        self.db.close()
+        self.temp_dir.cleanup()
+
 # ======================================================================================
 # Test Execution Configuration
 # ======================================================================================